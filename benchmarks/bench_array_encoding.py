@@ -0,0 +1,67 @@
+""" Compare JSON lists with packed arrays for fit data payloads
+
+Reports the JSON size of the d1, d2, dip and dip_sd arrays in task
+messages, and the time to encode them and decode them back to ndarrays,
+for the combinations of a synthetic screen.
+
+Usage: python -m benchmarks.bench_array_encoding [--rows 20000]
+"""
+import argparse
+import json
+import time
+import numpy as np
+from musycweb.arrays import ARRAY_FIELDS, pack_array, unpack_array
+from musycweb.partition import CombinationPartitioner
+from .synthetic import make_screen, normalise
+
+
+def _lists(fit_data):
+    return json.dumps({k: fit_data[k].tolist() for k in ARRAY_FIELDS})
+
+
+def _from_lists(msg):
+    return {k: np.array(v) for k, v in json.loads(msg).items()}
+
+
+def _packed(fit_data):
+    return json.dumps({k: pack_array(fit_data[k]) for k in ARRAY_FIELDS})
+
+
+def _from_packed(msg):
+    return {k: unpack_array(v) for k, v in json.loads(msg).items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    data = normalise(make_screen(args.rows))
+    partitions = CombinationPartitioner(data, False)
+    fits = [partitions.fit_data(*key) for key in partitions]
+
+    print(f'{len(fits)} combinations, '
+          f'{np.mean([len(f["d1"]) for f in fits]):.1f} points each')
+    print(f'{"encoding":>8} {"total KB":>9} {"bytes/fit":>10} '
+          f'{"encode (ms)":>12} {"decode (ms)":>12}')
+    for name, encode, decode in (('lists', _lists, _from_lists),
+                                 ('packed', _packed, _from_packed)):
+        start = time.perf_counter()
+        msgs = [encode(f) for f in fits]
+        t_encode = time.perf_counter() - start
+
+        start = time.perf_counter()
+        decoded = [decode(m) for m in msgs]
+        t_decode = time.perf_counter() - start
+
+        for f, d in zip(fits, decoded):
+            for k in ARRAY_FIELDS:
+                assert np.array_equal(f[k], d[k])
+
+        size = sum(len(m) for m in msgs)
+        print(f'{name:>8} {size / 1024:9.1f} {size / len(fits):10.0f} '
+              f'{t_encode * 1000:12.1f} {t_decode * 1000:12.1f}')
+
+
+if __name__ == '__main__':
+    main()
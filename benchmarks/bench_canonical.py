@@ -0,0 +1,57 @@
+""" Benchmark loading a dataset from its canonical Parquet copy
+
+Compares reading, validating and normalising the uploaded CSV, as every
+reprocess previously did, with reading the canonical copy written after
+the first read. Also reports file sizes.
+
+Usage: python -m benchmarks.bench_canonical [--sizes 100000 1000000]
+"""
+import argparse
+import io
+import time
+from .synthetic import make_screen
+
+
+def _time(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    import django
+    from django.conf import settings
+    settings.configure(
+        DATASET_READ_CHUNKSIZE=50000,
+        DATASET_VALIDATION_MAX_ROWS_PER_RULE=10,
+        DATASET_VALIDATION_BUDGET_US_PER_ROW=5.0
+    )
+    django.setup()
+    from musycweb.ingest import read_dataset, read_canonical, write_canonical
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100000, 1000000])
+    args = parser.parse_args()
+
+    for n_rows in args.sizes:
+        csv = make_screen(n_rows, batches=True).to_csv(index=False).encode()
+
+        t_csv, (data, _, _) = _time(
+            lambda: read_dataset(io.BytesIO(csv), warn=lambda msg: None))
+        canonical = write_canonical(data)
+        t_canonical, (data2, _) = _time(
+            lambda: read_canonical(io.BytesIO(canonical)))
+
+        assert data2.equals(data)
+        print(f'{data.shape[0]} rows: CSV {len(csv) / 2 ** 20:.1f} MB in '
+              f'{t_csv:.3f}s, canonical {len(canonical) / 2 ** 20:.1f} MB '
+              f'in {t_canonical:.3f}s ({t_csv / t_canonical:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
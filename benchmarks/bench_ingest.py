@@ -0,0 +1,95 @@
+""" Benchmark peak memory use when reading an uploaded dataset
+
+Compares reading the whole file with filtered copies, as process_dataset
+previously did, against chunked ingestion with read_dataset. Each method
+runs in a fresh subprocess so that peak RSS figures are independent.
+
+Usage: python -m benchmarks.bench_ingest [--sizes 100000 400000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from .synthetic import make_screen
+
+
+def _legacy(path):
+    import pandas as pd
+    from musycweb.ingest import FIELDS
+    data = pd.read_table(path, delimiter=',', dtype=FIELDS)
+    for col, pattern in (('drug1', ','), ('drug2', ','), ('sample', ','),
+                         ('drug1.units', '[^0-9a-zA-Z_]+'),
+                         ('drug2.units', '[^0-9a-zA-Z_]+'),
+                         ('sample', '[^0-9a-zA-Z_]+')):
+        assert data.loc[data[col].str.contains(pattern), :].empty
+    data.dropna(axis=0, how='all', inplace=True)
+    data = data[data['effect'].notna()]
+    data['effect.sd'] = data['effect.95ci'] / (2 * 1.96)
+    copies = [
+        data.loc[(data['drug1.conc'] == 0) & (data['drug2.conc'] == 0)],
+        data.loc[(data['drug1.conc'] == 0) & (data['drug2.conc'] != 0)],
+        data.loc[(data['drug1.conc'] != 0) & (data['drug2.conc'] == 0)],
+        data.loc[(data['drug1.conc'] != 0) & (data['drug2.conc'] != 0)]
+    ]
+    return data.shape[0], sum(c.shape[0] for c in copies)
+
+
+def _chunked(path, chunksize):
+    from musycweb.ingest import read_dataset
+    from musycweb.partition import CombinationPartitioner
+    data, use_batches, _ = read_dataset(path, warn=print,
+                                        chunksize=chunksize)
+    return data.shape[0], len(CombinationPartitioner(data, use_batches))
+
+
+def _run(method, path, chunksize):
+    from musycweb.ingest import peak_rss_mb
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if method == 'legacy':
+        _legacy(path)
+    else:
+        _chunked(path, chunksize)
+    print(json.dumps({'time': time.perf_counter() - start,
+                      'baseline_mb': baseline,
+                      'peak_mb': peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100000, 400000])
+    parser.add_argument('--chunksize', type=int, default=50000)
+    parser.add_argument('--run', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        _run(args.run[0], args.run[1], args.chunksize)
+        return
+
+    print(f'{"rows":>8} {"file MB":>8} {"method":>8} {"time (s)":>9} '
+          f'{"peak RSS MB":>12} {"above baseline":>15}')
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'dataset.csv')
+            make_screen(size, batches=True).to_csv(path, index=False)
+            file_mb = os.path.getsize(path) / 2 ** 20
+            for method in ('legacy', 'chunked'):
+                out = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.bench_ingest',
+                     '--chunksize', str(args.chunksize),
+                     '--run', method, path],
+                    check=True, stdout=subprocess.PIPE,
+                    universal_newlines=True
+                ).stdout.splitlines()[-1]
+                res = json.loads(out)
+                print(f'{size:8d} {file_mb:8.1f} {method:>8} '
+                      f'{res["time"]:9.2f} {res["peak_mb"]:12.1f} '
+                      f'{res["peak_mb"] - res["baseline_mb"]:15.1f}')
+
+
+if __name__ == '__main__':
+    main()
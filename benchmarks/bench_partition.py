@@ -0,0 +1,133 @@
+""" Benchmark splitting a dataset into drug combinations
+
+Compares the per-combination boolean filtering previously used by
+process_dataset with CombinationPartitioner, checking both produce the same
+fit data, at increasing row counts.
+
+Usage: python -m benchmarks.bench_partition [--sizes 10000 30000 100000]
+"""
+import argparse
+import itertools
+import time
+from musycweb.partition import CombinationPartitioner
+from .synthetic import make_screen, normalise
+
+
+def _swap_drug1_drug2(data):
+    return data.rename(columns={
+        'drug1': 'drug2',
+        'drug2': 'drug1',
+        'drug1.conc': 'drug2.conc',
+        'drug2.conc': 'drug1.conc',
+        'drug1.units': 'drug2.units',
+        'drug2.units': 'drug1.units'
+    })
+
+
+def legacy_partition(data, use_batches):
+    """ Combination splitting as previously done inline in process_dataset """
+    data_ctrl = data.loc[(data['drug1.conc'] == 0) & (data['drug2.conc'] == 0)]
+    data_sa_1 = data.loc[(data['drug1.conc'] == 0) & (data['drug2.conc'] != 0)]
+    data_sa_2 = data.loc[(data['drug1.conc'] != 0) & (data['drug2.conc'] == 0)]
+    data_expt = data.loc[(data['drug1.conc'] != 0) & (data['drug2.conc'] != 0)]
+
+    def lfrom(lists, attr):
+        return list(itertools.chain(*(l[attr].array for l in lists)))
+
+    def sfrom(lists, attr):
+        return list(set(itertools.chain(*(l[attr].array for l in lists))))
+
+    outer_grouping = ['batch', 'sample'] if use_batches else ['sample']
+
+    for bat_smp, samp_grp in data_expt.groupby(outer_grouping, sort=False):
+        if use_batches:
+            batch, sample = bat_smp
+            data_ctrl_s = data_ctrl.loc[
+                (data_ctrl['batch'] == batch) &
+                (data_ctrl['sample'] == sample)]
+            data_sa_1_s = data_sa_1.loc[
+                (data_sa_1['batch'] == batch) &
+                (data_sa_1['sample'] == sample)]
+            data_sa_2_s = data_sa_2.loc[
+                (data_sa_2['batch'] == batch) &
+                (data_sa_2['sample'] == sample)]
+        else:
+            sample = bat_smp[0] if isinstance(bat_smp, tuple) else bat_smp
+            batch = None
+            data_ctrl_s = data_ctrl.loc[data_ctrl['sample'] == sample]
+            data_sa_1_s = data_sa_1.loc[data_sa_1['sample'] == sample]
+            data_sa_2_s = data_sa_2.loc[data_sa_2['sample'] == sample]
+
+        for drug_names, grp_dat in samp_grp.groupby(
+                ['drug1', 'drug2'], sort=False):
+            drug1_name, drug2_name = drug_names
+            df_list = [
+                grp_dat,
+                data_ctrl_s,
+                data_sa_1_s.loc[data_sa_1_s['drug2'] == drug2_name],
+                data_sa_2_s.loc[data_sa_2_s['drug1'] == drug1_name],
+                _swap_drug1_drug2(
+                    data_sa_1_s.loc[data_sa_1_s['drug2'] == drug1_name]),
+                _swap_drug1_drug2(
+                    data_sa_2_s.loc[data_sa_2['drug1'] == drug2_name])
+            ]
+            yield (batch, sample, drug1_name, drug2_name), dict(
+                d1=lfrom(df_list, 'drug1.conc'),
+                d2=lfrom(df_list, 'drug2.conc'),
+                dip=lfrom(df_list, 'effect'),
+                dip_sd=lfrom(df_list, 'effect.sd'),
+                drug1_units=sfrom(df_list, 'drug1.units'),
+                drug2_units=sfrom(df_list, 'drug2.units'),
+                expt_date=sfrom(df_list, 'expt.date')
+            )
+
+
+def indexed_partition(data, use_batches):
+    partitions = CombinationPartitioner(data, use_batches)
+    for key in partitions:
+        yield key, partitions.fit_data(*key)
+
+
+def _comparable(combinations):
+    return [(key, {k: sorted(v) if k in ('drug1_units', 'drug2_units',
+                                         'expt_date') else list(v)
+                   for k, v in fit_data.items()})
+            for key, fit_data in combinations]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 30000, 100000])
+    parser.add_argument('--batches', action='store_true')
+    parser.add_argument('--legacy-max', type=int, default=100000,
+                        help='Skip the legacy method above this row count')
+    args = parser.parse_args()
+
+    print(f'{"rows":>8} {"combos":>7} {"legacy (s)":>11} '
+          f'{"indexed (s)":>12} {"speedup":>8}')
+    for size in args.sizes:
+        data = normalise(make_screen(size, batches=args.batches))
+
+        start = time.perf_counter()
+        indexed = list(indexed_partition(data, args.batches))
+        t_indexed = time.perf_counter() - start
+
+        if size <= args.legacy_max:
+            start = time.perf_counter()
+            legacy = list(legacy_partition(data, args.batches))
+            t_legacy = time.perf_counter() - start
+            assert _comparable(legacy) == _comparable(indexed), \
+                'Partition outputs differ'
+            legacy_str = f'{t_legacy:11.2f}'
+            speedup_str = f'{t_legacy / t_indexed:7.1f}x'
+        else:
+            legacy_str = f'{"-":>11}'
+            speedup_str = f'{"-":>8}'
+
+        print(f'{len(data):8d} {len(indexed):7d} {legacy_str} '
+              f'{t_indexed:12.3f} {speedup_str}')
+
+
+if __name__ == '__main__':
+    main()
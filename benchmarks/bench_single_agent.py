@@ -0,0 +1,87 @@
+""" Benchmark shared single agent fits
+
+Reports how many single agent curves each dataset has, against how many
+times they were previously re-estimated (twice per combination), and the
+time to fit them all once. With musyc_code installed, also times MuSyC_2D
+on each combination of the dataset with and without single agent bounds.
+
+Usage: python -m benchmarks.bench_single_agent [--drugs 40] [--musyc]
+"""
+import argparse
+import time
+import pandas as pd
+from .synthetic import make_screen, normalise, ROWS_PER_COMBINATION
+
+DEMO_DATASET = 'static/musyc_demo_dataset.csv'
+
+
+def _load_demo():
+    data = pd.read_csv(DEMO_DATASET, dtype={'batch': str})
+    return normalise(data), True
+
+
+def _report(name, data, use_batches):
+    from musycweb.partition import CombinationPartitioner
+    from musycweb.singleagent import fit_single_agents
+
+    partitions = CombinationPartitioner(data, use_batches)
+    start = time.perf_counter()
+    fits = fit_single_agents(partitions)
+    elapsed = time.perf_counter() - start
+    print(f'{name}: {len(partitions)} combinations, {len(fits)} single agent '
+          f'curves (previously estimated {2 * len(partitions)} times); '
+          f'fitted once in {elapsed:.3f}s, '
+          f'{sum(f is None for f in fits.values())} failed')
+    return partitions, fits
+
+
+def _time_musyc(partitions, fits):
+    from musyc_code.SynergyCalculator.SynergyCalculator import MuSyC_2D
+    from musycweb.singleagent import prior_bounds
+    from musycweb.tasks import FIT_SETTINGS
+
+    for batch, sample, drug1, drug2 in partitions:
+        data = partitions.fit_data(batch, sample, drug1, drug2)
+        e_bnd = prior_bounds(fits.get((batch, sample, drug1)),
+                             fits.get((batch, sample, drug2)))
+        for label, bounds in (('unbounded', None), ('single agent', e_bnd)):
+            start = time.perf_counter()
+            T = MuSyC_2D(data['d1'], data['d2'], data['dip'],
+                         data['dip_sd'], drug1, drug2, E_bnd=bounds,
+                         fit_alg='nlls_mcnlls', to_plot=False,
+                         sample=sample, expt='benchmark',
+                         metric_name='Percent effect', hill_orient=1,
+                         to_save=False, direc=None, init_seed=0,
+                         **FIT_SETTINGS)
+            print(f'  [{batch}] {drug1}+{drug2} {label}: '
+                  f'{time.perf_counter() - start:.1f}s, '
+                  f'beta={T["beta"]}, log_alpha1={T["log_alpha1"]}, '
+                  f'log_alpha2={T["log_alpha2"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--drugs', type=int, default=40,
+                        help='Drugs in the synthetic all-pairs screen')
+    parser.add_argument('--musyc', action='store_true',
+                        help='Time MuSyC_2D on the demo dataset (slow)')
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+    settings.configure()
+    django.setup()
+
+    demo = _report('Demo dataset', *_load_demo())
+
+    n_pairs = args.drugs * (args.drugs - 1) // 2
+    screen = normalise(make_screen(n_pairs * ROWS_PER_COMBINATION,
+                                   n_samples=1))
+    _report(f'{args.drugs}-drug all-pairs screen', screen, False)
+
+    if args.musyc:
+        _time_musyc(*demo)
+
+
+if __name__ == '__main__':
+    main()
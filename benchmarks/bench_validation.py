@@ -0,0 +1,82 @@
+""" Benchmark dataset validation
+
+Compares the previous sequence of checks (one regex scan per column and
+rule, stopping at the first failure) with the single-pass validation in
+musycweb.validation, on the same parsed data. Also reports validation of
+a file with errors, which previously stopped at the first one.
+
+Usage: python -m benchmarks.bench_validation [--sizes 100000 1000000]
+"""
+import argparse
+import time
+from .synthetic import make_screen
+
+
+def _legacy(data, use_batches):
+    for col, pattern in (('drug1', ','), ('drug2', ','), ('sample', ','),
+                         ('drug1.units', '[^0-9a-zA-Z_]+'),
+                         ('drug2.units', '[^0-9a-zA-Z_]+'),
+                         ('sample', '[^0-9a-zA-Z_]+')):
+        if not data.loc[data[col].str.contains(pattern), :].empty:
+            return False
+    if (data['drug1.conc'] < 0).any() or (data['drug2.conc'] < 0).any():
+        return False
+    if use_batches and (data['batch'].isna().any() or
+                        (data['batch'].str.strip() == '').any()):
+        return False
+    if 'effect.95ci' in data.columns:
+        if data['effect.95ci'].isna().any() or \
+                (data['effect.95ci'] <= 0).any():
+            return False
+    return True
+
+
+def _single_pass(data, use_batches):
+    from musycweb.validation import ValidationReport, validate_chunk
+    report = ValidationReport()
+    validate_chunk(data, use_batches, report)
+    return report
+
+
+def _time(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    import django
+    from django.conf import settings
+    settings.configure()
+    django.setup()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100000, 1000000])
+    args = parser.parse_args()
+
+    for n_rows in args.sizes:
+        data = make_screen(n_rows, batches=True)
+        t_legacy, _ = _time(lambda: _legacy(data, True))
+        t_new, report = _time(lambda: _single_pass(data, True))
+        assert report.is_valid
+        print(f'{data.shape[0]} rows: legacy {t_legacy:.3f}s, '
+              f'single pass {t_new:.3f}s ({t_legacy / t_new:.1f}x, '
+              f'{report.us_per_row:.2f} us/row)')
+
+        # Errors scattered through the file: every violation is reported
+        bad = data.copy()
+        bad.loc[bad.index[::997], 'sample'] = 'bad sample'
+        bad.loc[bad.index[::1009], 'drug1.conc'] = -1.0
+        t_bad, report = _time(lambda: _single_pass(bad, True))
+        print(f'  with errors: {t_bad:.3f}s')
+        for message in report.messages():
+            print(f'  {message}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+""" Synthetic drug combination screens for benchmarking """
+import itertools
+import numpy as np
+import pandas as pd
+
+# Rows per (drug1, drug2, sample): 4x4 combination grid and two 4-point
+# single agent curves. Each sample also has CONTROLS_PER_SAMPLE controls
+ROWS_PER_COMBINATION = 16 + 8
+CONTROLS_PER_SAMPLE = 8
+
+
+def make_screen(n_rows, n_samples=4, batches=False, seed=0):
+    """ Generate a screen of roughly n_rows rows in the upload CSV format
+
+    Drugs are tested all-pairs within each sample, with the number of drugs
+    chosen to reach the requested size. Drug order is not canonicalised,
+    so roughly half of the rows have drug1 after drug2 alphabetically.
+    """
+    rng = np.random.RandomState(seed)
+    n_pairs = max(1, n_rows // (ROWS_PER_COMBINATION * n_samples))
+    n_drugs = 2
+    while n_drugs * (n_drugs - 1) // 2 < n_pairs:
+        n_drugs += 1
+    drugs = [f'drug{i:03d}' for i in range(n_drugs)]
+    pairs = list(itertools.islice(itertools.combinations(drugs, 2), n_pairs))
+    concs = np.array([1e-9, 1e-8, 1e-7, 1e-6])
+
+    columns = {k: [] for k in ('expt.date', 'drug1', 'drug1.conc',
+                               'drug1.units', 'drug2', 'drug2.conc',
+                               'drug2.units', 'sample', 'effect',
+                               'effect.95ci', 'batch')}
+
+    def add(sample, batch, drug1, conc1, drug2, conc2):
+        if rng.rand() < 0.5:
+            drug1, conc1, drug2, conc2 = drug2, conc2, drug1, conc1
+        columns['expt.date'].append('2020-01-01')
+        columns['drug1'].append(drug1)
+        columns['drug1.conc'].append(conc1)
+        columns['drug1.units'].append('M')
+        columns['drug2'].append(drug2)
+        columns['drug2.conc'].append(conc2)
+        columns['drug2.units'].append('M')
+        columns['sample'].append(sample)
+        columns['effect'].append(100 * rng.rand())
+        columns['effect.95ci'].append(1 + rng.rand())
+        columns['batch'].append(batch)
+
+    for s in range(n_samples):
+        sample = f'sample{s}'
+        batch = f'batch{s % 2}'
+        for drug1, drug2 in pairs:
+            for c1, c2 in itertools.product(concs, concs):
+                add(sample, batch, drug1, c1, drug2, c2)
+            for c in concs:
+                add(sample, batch, drug1, c, drug2, 0.0)
+                add(sample, batch, drug1, 0.0, drug2, c)
+        for _ in range(CONTROLS_PER_SAMPLE):
+            add(sample, batch, drugs[0], 0.0, drugs[1], 0.0)
+
+    data = pd.DataFrame(columns)
+    if not batches:
+        del data['batch']
+    return data
+
+
+def normalise(data):
+    """ Apply process_dataset's drug order canonicalisation and SD column """
+    data = data.copy()
+    out_of_order = data['drug1'] > data['drug2']
+    cols1 = ['drug1', 'drug1.conc', 'drug1.units']
+    cols2 = ['drug2', 'drug2.conc', 'drug2.units']
+    data.loc[out_of_order, cols1 + cols2] = \
+        data.loc[out_of_order, cols2 + cols1].values
+    data['effect.sd'] = data['effect.95ci'] / (2 * 1.96)
+    return data
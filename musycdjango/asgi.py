@@ -3,6 +3,9 @@ ASGI config for musycdjango project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Besides the Django application, it serves the task status event streams
+(see musycweb.events), which need a long-lived connection per browser.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
@@ -13,4 +16,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'musycdjango.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from musycweb import events  # noqa: E402 (needs Django set up)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and events.PATH.match(scope['path']):
+        await events.dataset_events(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
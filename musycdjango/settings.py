@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import tempfile
 try:
     import debug_toolbar
 except ImportError:
@@ -230,13 +231,146 @@ CELERY_TASK_QUEUES = (
     Queue('celery', Exchange('celery'),
           routing_key='celery',
           queue_arguments={'x-max-priority': CELERY_TASK_QUEUE_MAX_PRIORITY}),
+    Queue('prepare', Exchange('prepare'),
+          routing_key='prepare',
+          queue_arguments={'x-max-priority': CELERY_TASK_QUEUE_MAX_PRIORITY}),
 )
+# Dataset preparation and exports have their own queue, served by workers
+# which don't run fits, so they don't wait for long running fits to finish
+CELERY_TASK_ROUTES = {
+    'musycweb.tasks.prepare_dataset': {'queue': 'prepare'},
+    'musycweb.tasks.export_dataset': {'queue': 'prepare'},
+}
 # Time limit before tasks are aborted (24 hours)
 CELERY_TASK_SOFT_TIME_LIMIT = 60 * 60 * 24
-# Datasets with more tasks than this are run at priority=3
-CELERY_DEPRIORITISE_SIZE_L3 = 1000
-# Datasets with more tasks than this are run at priority=2
-CELERY_DEPRIORITISE_SIZE_L2 = 10000
+# Priority for dataset preparation (validation and task submission), and
+# exports, within the prepare queue
+CELERY_PREPARE_PRIORITY = 9
+# Datasets with more estimated fit time (seconds) than this are run at
+# priority=3
+CELERY_DEPRIORITISE_COST_L3 = 60 * 60 * 3
+# Datasets with more estimated fit time (seconds) than this are run at
+# priority=2
+CELERY_DEPRIORITISE_COST_L2 = 60 * 60 * 30
+
+# Fit runtime estimates
+# Number of recent fit results used to train the runtime model
+RUNTIME_ESTIMATOR_HISTORY = 5000
+# Interval between retraining the runtime model (seconds)
+RUNTIME_ESTIMATOR_REFRESH = 60 * 60
+# Estimated fit time (seconds) when there isn't enough history
+RUNTIME_ESTIMATE_DEFAULT = 300
+# Each fit's soft time limit is its estimated time multiplied by this
+# factor, at least RUNTIME_LIMIT_MIN and at most CELERY_TASK_SOFT_TIME_LIMIT.
+# Fits without enough history for an estimate get CELERY_TASK_SOFT_TIME_LIMIT
+RUNTIME_LIMIT_FACTOR = 20
+RUNTIME_LIMIT_MIN = 60 * 60
+# Number of fitting worker processes, for wall clock time estimates
+FIT_WORKER_CONCURRENCY = int(os.environ.get('FIT_WORKER_CONCURRENCY', 4))
+
+# Dataset ingestion
+# Rows per chunk when reading uploaded dataset files. Smaller chunks reduce
+# peak memory use at some cost in speed
+DATASET_READ_CHUNKSIZE = int(os.environ.get('DATASET_READ_CHUNKSIZE', 50000))
+# DatasetTasks are created, and their fitting tasks published, in batches
+# of this size
+DATASET_SUBMIT_BATCH_SIZE = 500
+# Number of example rows reported for each validation rule
+DATASET_VALIDATION_MAX_ROWS_PER_RULE = 10
+# Validation cost above which a warning is logged (microseconds per row)
+DATASET_VALIDATION_BUDGET_US_PER_ROW = 5.0
+# Minimum interval between dataset preparation progress updates (seconds)
+DATASET_PREPARATION_PROGRESS_INTERVAL = 2
+# Number of datasets whose fit data are cached by each process, for
+# re-assembling fits' data arrays (e.g. for plots)
+FIT_DATA_CACHE_DATASETS = 4
+# Minimum interval between fit progress updates (seconds)
+FIT_PROGRESS_INTERVAL = 30
+# Number of results read from the database at a time by dataset CSV exports
+DATASET_EXPORT_CHUNK_SIZE = 2000
+# Serve saved dataset exports with nginx's X-Accel-Redirect, from the
+# internal location DATASET_EXPORT_ACCEL_PREFIX (see nginx.site-basic.conf)
+DATASET_EXPORT_ACCEL_REDIRECT = os.environ.get(
+    'DATASET_EXPORT_ACCEL_REDIRECT', 'false').lower() == 'true'
+DATASET_EXPORT_ACCEL_PREFIX = '/_exports/'
+# Task metrics report: number of recent fits included, and the fraction
+# of a worker host's memory available to fits
+TASK_METRICS_REPORT_HISTORY = 10000
+TASK_METRICS_MEMORY_HEADROOM = 0.8
+# Status polls' since cursors are moved back by this many seconds, so
+# state changes recorded late (or by hosts with skewed clocks) are not missed
+TASK_STATUS_CURSOR_OVERLAP = 10
+# Maximum number of rows per task table page
+TASK_TABLE_MAX_PAGE_SIZE = 1000
+# Task status events (see musycweb.events): 'broker' (via the Celery
+# broker, for separate ASGI and worker processes), 'memory' (within one
+# process, for development) or 'none'
+TASK_EVENTS_BACKEND = os.environ.get('TASK_EVENTS_BACKEND', 'memory')
+TASK_EVENTS_EXCHANGE = 'musyc.task_events'
+# Keepalive comment interval (s), and browsers' reconnection delay (ms)
+TASK_EVENTS_KEEPALIVE = 15
+TASK_EVENTS_RETRY_MS = 5000
+TASK_EVENTS_RECONNECT_INTERVAL = 5
+
+# MCMC sampling: 'fixed' uses MuSyC's default sample count. 'adaptive' runs
+# FIT_ADAPTIVE_CHAINS independent fits at each stage's sample count, until
+# every parameter's R-hat across them is within FIT_ADAPTIVE_RHAT. Only
+# adaptive fits use the process pool and checkpoints below, so it is the
+# default. Changing it changes every fit's fingerprint, so datasets are
+# refitted in full when next processed
+FIT_SAMPLING = os.environ.get('FIT_SAMPLING', 'adaptive')
+FIT_ADAPTIVE_STAGES = (5000, 12500, 25000)
+FIT_ADAPTIVE_CHAINS = 2
+FIT_ADAPTIVE_RHAT = 1.05
+
+# Run adaptive sampling's independent fits in a local process pool, using
+# the host's cores not in use by other fits (at most
+# FIT_PARALLEL_MAX_PROCESSES per fit). Fits on a host record their process
+# use in FIT_PARALLEL_SLOTS_DIR, which should be shared by all workers on
+# the host. FIT_PARALLEL_CPUS overrides the detected number of cores. Fixed
+# sampling fits run in a single process
+FIT_PARALLEL = os.environ.get('FIT_PARALLEL', 'true').lower() == 'true'
+FIT_PARALLEL_MAX_PROCESSES = int(os.environ.get('FIT_PARALLEL_MAX_PROCESSES',
+                                                8))
+FIT_PARALLEL_CPUS = int(os.environ.get('FIT_PARALLEL_CPUS', 0)) or None
+FIT_PARALLEL_SLOTS_DIR = os.environ.get(
+    'FIT_PARALLEL_SLOTS_DIR',
+    os.path.join(tempfile.gettempdir(), 'musyc-fit-slots'))
+
+# Fit checkpoints
+# Adaptive sampling saves each completed run, so an interrupted fit resumes
+# from them; fixed sampling and fast fits aren't checkpointed. A fit
+# exceeding its time limit is retried up to FIT_CHECKPOINT_RETRIES times if
+# it saved any runs. Checkpoints of fits never resumed are removed after
+# FIT_CHECKPOINT_MAX_AGE_DAYS
+FIT_CHECKPOINTS_ENABLED = os.environ.get('FIT_CHECKPOINTS_ENABLED',
+                                         'true').lower() == 'true'
+FIT_CHECKPOINT_RETRIES = 1
+FIT_CHECKPOINT_MAX_AGE_DAYS = 14
+# Acknowledge fits after they finish, rather than when they start, so fits
+# interrupted by a worker restart are redelivered and resume. RabbitMQ's
+# consumer_timeout must then exceed CELERY_TASK_SOFT_TIME_LIMIT, and each
+# worker process should prefetch only one task
+FIT_ACKS_LATE = os.environ.get('FIT_ACKS_LATE', 'false').lower() == 'true'
+if FIT_ACKS_LATE:
+    CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Fit each single agent dose response once per dataset, and bound each
+# combination's E0, E1 and E2 to within SINGLE_AGENT_PRIOR_WIDTH standard
+# errors of the single agent estimates
+SINGLE_AGENT_PRIORS = os.environ.get('SINGLE_AGENT_PRIORS',
+                                     'false').lower() == 'true'
+SINGLE_AGENT_PRIOR_WIDTH = 3.0
+
+# Fit result cache
+# Results are reused for fits with identical inputs, fitting options and
+# musyc_code version. The version is a hash of the musyc_code source,
+# unless set explicitly
+FIT_CACHE_ENABLED = os.environ.get('FIT_CACHE_ENABLED',
+                                   'true').lower() == 'true'
+FIT_CACHE_MAX_ENTRIES = 100000
+FIT_CACHE_MAX_AGE_DAYS = 90
+MUSYC_CODE_VERSION = os.environ.get('MUSYC_CODE_VERSION', None)
 
 # Sentry
 import sentry_sdk
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Dataset, DatasetTask
+from .models import Dataset, DatasetTask, FitCacheEntry, FitCacheStats, \
+    FitResult, TaskMetrics
+from . import metrics
 from django.urls import reverse
 from django.utils.html import format_html
 from django_celery_results.models import TaskResult
@@ -9,7 +11,8 @@ admin.site.site_title = 'MuSyC Admin'
 
 
 class DatasetAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'creation_date', 'owner')
+    list_display = ('id', 'name', 'creation_date', 'owner', 'fit_mode',
+                    'preparation_status', 'submission_time')
 
 
 class DatasetTaskAdmin(admin.ModelAdmin):
@@ -44,5 +47,50 @@ class DatasetTaskAdmin(admin.ModelAdmin):
         return obj.dataset.owner.email
 
 
+class FitCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('fingerprint', 'created', 'last_used', 'hits')
+    ordering = ('-last_used', )
+
+
+class FitCacheStatsAdmin(admin.ModelAdmin):
+    list_display = ('hits', 'misses', 'hit_rate')
+
+    def hit_rate(self, obj):
+        total = obj.hits + obj.misses
+        return f'{obj.hits / total:.1%}' if total else '-'
+    hit_rate.short_description = 'Hit rate'
+
+
+class FitResultAdmin(admin.ModelAdmin):
+    list_display = ('dataset_task', 'drug1_name', 'drug2_name', 'sample',
+                    'beta', 'log_alpha1', 'log_alpha2', 'R2')
+    list_select_related = ('dataset_task', 'dataset_task__dataset',
+                           'dataset_task__dataset__owner')
+    search_fields = ('drug1_name', 'drug2_name', 'sample')
+
+
+class TaskMetricsAdmin(admin.ModelAdmin):
+    list_display = ('task_id', 'started', 'status', 'fit_alg', 'num_points',
+                    'dataset_size', 'hostname', 'queue_wait', 'wall_time',
+                    'cpu_time', 'peak_rss_mb')
+    list_filter = ('fit_alg', 'sampling', 'fit_mode', 'status', 'hostname')
+    ordering = ('-started', )
+    change_list_template = 'admin/musycweb/taskmetrics/change_list.html'
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        try:
+            queryset = response.context_data['cl'].queryset
+        except (AttributeError, KeyError):
+            # Redirects and errors have no change list
+            return response
+        response.context_data['report'] = metrics.report(queryset)
+        return response
+
+
 admin.site.register(Dataset, DatasetAdmin)
 admin.site.register(DatasetTask, DatasetTaskAdmin)
+admin.site.register(FitCacheEntry, FitCacheEntryAdmin)
+admin.site.register(FitCacheStats, FitCacheStatsAdmin)
+admin.site.register(FitResult, FitResultAdmin)
+admin.site.register(TaskMetrics, TaskMetricsAdmin)
@@ -0,0 +1,50 @@
+""" Compact, JSON-safe encoding of numeric arrays
+
+Arrays are packed as little-endian float64, zlib compressed when that makes
+them smaller (e.g. repeated concentrations), and base64 encoded, so they
+can travel in Celery's JSON task messages and be stored in JSON results.
+"""
+import base64
+import zlib
+import numpy as np
+
+DTYPE = '<f8'
+# Fit data arrays in fit_drug_combination's arguments and results
+ARRAY_FIELDS = ('d1', 'd2', 'dip', 'dip_sd')
+
+
+def pack_array(values, dtype=DTYPE):
+    """ Encode a 1D array-like as a JSON-safe dict, as float64 by default """
+    raw = np.ascontiguousarray(values, dtype=dtype).tobytes()
+    packed = {'__ndarray__': None, 'dtype': dtype}
+    compressed = zlib.compress(raw)
+    if len(compressed) < len(raw):
+        raw = compressed
+        packed['zlib'] = True
+    packed['__ndarray__'] = base64.b64encode(raw).decode('ascii')
+    return packed
+
+
+def is_packed(value):
+    return isinstance(value, dict) and '__ndarray__' in value
+
+
+def unpack_array(value):
+    """ Decode a packed array to a (writable) ndarray
+
+    Plain lists, as used before arrays were packed, are also accepted.
+    """
+    if not is_packed(value):
+        return np.array(value)
+    raw = base64.b64decode(value['__ndarray__'])
+    if value.get('zlib'):
+        raw = zlib.decompress(raw)
+    return np.frombuffer(bytearray(raw), dtype=value['dtype'])
+
+
+def unpack_arrays(d):
+    """ Decode the fit data arrays in a task result dict, in place """
+    for k in ARRAY_FIELDS:
+        if k in d:
+            d[k] = unpack_array(d[k])
+    return d
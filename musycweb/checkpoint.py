@@ -0,0 +1,75 @@
+""" Checkpoints of the completed runs within a fit
+
+Adaptive sampling fits in several independent MuSyC_2D runs. Each run's
+result is saved as it completes, keyed by the fit's fingerprint, so a fit
+interrupted by a worker restart or time limit resumes from its completed
+runs when redelivered, retried or resubmitted. A fit's checkpoints are
+cleared once it finishes.
+
+Fixed sampling and fast fits are single MuSyC_2D runs, with no completed
+runs to save, so they aren't checkpointed and restart from the beginning.
+"""
+import json
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from .models import FitCheckpoint
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def load(fingerprint):
+    """ Saved runs for a fit, as a dict of (stage, chain) to result dict """
+    if not settings.FIT_CHECKPOINTS_ENABLED:
+        return {}
+
+    return {(stage, chain): json.loads(result) for stage, chain, result in
+            FitCheckpoint.objects.filter(fingerprint=fingerprint).values_list(
+                'stage', 'chain', 'result')}
+
+
+def save(fingerprint, stage, chain, result):
+    """ Save a completed run """
+    if not settings.FIT_CHECKPOINTS_ENABLED:
+        return
+
+    try:
+        FitCheckpoint.objects.create(fingerprint=fingerprint, stage=stage,
+                                     chain=chain,
+                                     result=json.dumps(
+                                         result, default=_json_default))
+    except IntegrityError:
+        # Already saved by another delivery of the same fit
+        pass
+
+
+def exists(fingerprint):
+    """ Whether a fit has any saved runs """
+    return FitCheckpoint.objects.filter(fingerprint=fingerprint).exists()
+
+
+def clear(fingerprint):
+    """ Remove a fit's saved runs """
+    if not settings.FIT_CHECKPOINTS_ENABLED:
+        return
+
+    FitCheckpoint.objects.filter(fingerprint=fingerprint).delete()
+
+
+def evict():
+    """ Remove checkpoints of fits which were never resumed
+
+    Returns the number of checkpoints removed.
+    """
+    cutoff = timezone.now() - timedelta(
+        days=settings.FIT_CHECKPOINT_MAX_AGE_DAYS)
+    num_deleted, _ = FitCheckpoint.objects.filter(created__lt=cutoff).delete()
+    return num_deleted
@@ -0,0 +1,69 @@
+""" Convergence diagnostics across independent MuSyC fits
+
+MuSyC_2D only returns posterior summaries (point estimates and credible
+intervals), not its MCMC traces. Convergence is therefore assessed across
+independent runs (chains) of the same fit: the Gelman-Rubin potential
+scale reduction factor is computed from each run's mean and standard
+deviation, the latter derived from its 95% interval.
+"""
+import re
+import numpy as np
+
+# Fitted parameters checked for convergence
+PARAMETERS = ('beta', 'log_alpha1', 'log_alpha2', 'E0', 'E1', 'E2', 'E3',
+              'log_C1', 'log_C2', 'log_h1', 'log_h2')
+
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?inf',
+                     re.IGNORECASE)
+
+
+def _float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if np.isfinite(value) else None
+
+
+def interval(value):
+    """ Parse a credible interval as (lower, upper), or None
+
+    Accepts a 2-element sequence or its string representation.
+    """
+    if isinstance(value, str):
+        value = _NUMBER.findall(value)
+    try:
+        lower, upper = (_float(v) for v in value)
+    except (TypeError, ValueError):
+        return None
+    if lower is None or upper is None or upper < lower:
+        return None
+    return lower, upper
+
+
+def rhat(means, sds, num_samples):
+    """ Potential scale reduction factor from per-chain means and SDs """
+    means = np.asarray(means, dtype=float)
+    within = np.mean(np.square(sds))
+    if within <= 0:
+        return 1.0 if np.ptp(means) == 0 else np.inf
+    between = np.var(means, ddof=1)
+    pooled = (num_samples - 1) / num_samples * within + between
+    return float(np.sqrt(pooled / within))
+
+
+def diagnostics(runs, num_samples, parameters=PARAMETERS):
+    """ R-hat of each parameter across runs (MuSyC_2D result dicts)
+
+    Parameters without a usable estimate and interval in every run are
+    omitted. Returns a dict of parameter name to R-hat.
+    """
+    result = {}
+    for param in parameters:
+        means = [_float(run.get(param)) for run in runs]
+        intervals = [interval(run.get(f'{param}_ci')) for run in runs]
+        if any(m is None for m in means) or any(i is None for i in intervals):
+            continue
+        sds = [(upper - lower) / (2 * 1.96) for lower, upper in intervals]
+        result[param] = rhat(means, sds, num_samples)
+    return result
@@ -0,0 +1,200 @@
+""" Fit run time estimates, learnt from previous fits
+
+Fit time (time_total in stored results) is modelled as a power law in the
+number of data points, log(t) = a + b * log(n), fitted separately for each
+(fit_alg, sampling, constrained, boundary_sampling) group. Groups with too
+little history fall back to a model fitted on all results, then to a
+default.
+
+Estimates set dataset priorities and per-task time limits, and are
+reported by the dry run endpoint before anything is queued.
+"""
+import json
+import logging
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django_celery_results.models import TaskResult, states
+from .arrays import unpack_array
+
+logger = logging.getLogger(__name__)
+
+# Minimum number of results needed to fit a group's model
+MIN_SAMPLES = 20
+
+_model = None
+_model_time = None
+_model_lock = threading.Lock()
+
+
+def is_boundary(d1, d2):
+    """ Whether a combination is fitted with boundary sampling """
+    return bool(len(np.unique(d1)) == 2 or len(np.unique(d2)) == 2)
+
+
+def features(d1, d2, fit_alg, constrained, sampling='fixed'):
+    """ Model features for a combination, as (group, num_points) """
+    return (fit_alg, sampling, bool(constrained), is_boundary(d1, d2)), \
+        len(d1)
+
+
+def _result_features(result):
+    constrained = result.get('E_fix') is not None or \
+        result.get('E_bnd') is not None
+    fit_alg = result.get('fit_method', 'nlls_mcnlls')
+    sampling = result.get('sampling', 'fixed')
+    if 'd1' not in result:
+        return (fit_alg, sampling, constrained, bool(result['boundary'])), \
+            int(result['num_points'])
+
+    # Results which hold their data arrays
+    d1 = unpack_array(result['d1'])
+    d2 = unpack_array(result['d2'])
+    return features(d1, d2, fit_alg, constrained, sampling)
+
+
+def _fit(num_points, times):
+    """ Least squares fit of log(t) = a + b * log(n), as (a, b) """
+    x = np.log(num_points)
+    y = np.log(times)
+    if np.ptp(x) == 0:
+        return y.mean(), 0.0
+    b, a = np.polyfit(x, y, 1)
+    return a, b
+
+
+class RuntimeModel(object):
+    """ Per-group power law models of fit time """
+    def __init__(self, samples=()):
+        """ samples is an iterable of (group, num_points, time_total) """
+        by_group = {}
+        for group, num_points, time_total in samples:
+            by_group.setdefault(group, []).append((num_points, time_total))
+
+        self.num_samples = sum(len(v) for v in by_group.values())
+        self.groups = {
+            group: _fit(*np.array(v).T)
+            for group, v in by_group.items() if len(v) >= MIN_SAMPLES
+        }
+        if self.num_samples >= MIN_SAMPLES:
+            self.overall = _fit(*np.array(
+                [s for v in by_group.values() for s in v]).T)
+        else:
+            self.overall = None
+
+    def predict(self, group, num_points):
+        """ Estimated fit time in seconds, or None without enough history """
+        params = self.groups.get(group, self.overall)
+        if params is None:
+            return None
+        a, b = params
+        return float(np.exp(a + b * np.log(max(num_points, 1))))
+
+
+def train(limit=None):
+    """ Fit a RuntimeModel to the most recent successful fits """
+    from .tasks import fit_drug_combination
+
+    if limit is None:
+        limit = settings.RUNTIME_ESTIMATOR_HISTORY
+    results = TaskResult.objects.filter(
+        task_name=fit_drug_combination.name,
+        status=states.SUCCESS
+    ).order_by('-date_done').values_list('result', flat=True)[:limit]
+
+    samples = []
+    for result in results.iterator():
+        try:
+            result = json.loads(result)
+            time_total = float(result['time_total'])
+            group, num_points = _result_features(result)
+        except (ValueError, TypeError, KeyError):
+            continue
+        if time_total > 0:
+            samples.append((group, num_points, time_total))
+
+    model = RuntimeModel(samples)
+    logger.info('Runtime model trained on %d results, %d groups',
+                model.num_samples, len(model.groups))
+    return model
+
+
+def get_model():
+    """ The current RuntimeModel, retrained periodically """
+    global _model, _model_time
+    with _model_lock:
+        if _model is None or time.monotonic() - _model_time > \
+                settings.RUNTIME_ESTIMATOR_REFRESH:
+            _model = train()
+            _model_time = time.monotonic()
+        return _model
+
+
+def priority(total_seconds):
+    """ Task priority for a dataset's total estimated fit time
+
+    Returns None for the default priority.
+    """
+    if total_seconds >= settings.CELERY_DEPRIORITISE_COST_L2:
+        return 2
+    if total_seconds >= settings.CELERY_DEPRIORITISE_COST_L3:
+        return 3
+    return None
+
+
+def expected(estimate):
+    """ An estimated fit time, or the default if there is no estimate """
+    if estimate is None:
+        return settings.RUNTIME_ESTIMATE_DEFAULT
+    return estimate
+
+
+def time_limit(estimate):
+    """ Soft time limit for a fit, in seconds, from its estimated time
+
+    Fits without an estimate get the full CELERY_TASK_SOFT_TIME_LIMIT.
+    """
+    if estimate is None:
+        return settings.CELERY_TASK_SOFT_TIME_LIMIT
+    return int(min(
+        max(estimate * settings.RUNTIME_LIMIT_FACTOR,
+            settings.RUNTIME_LIMIT_MIN),
+        settings.CELERY_TASK_SOFT_TIME_LIMIT
+    ))
+
+
+def wall_time(estimates):
+    """ Estimated wall clock time to run fits across the fitting workers
+
+    Assumes the workers are otherwise idle, and assigns each fit (longest
+    first) to the least loaded worker.
+    """
+    workers = np.zeros(max(settings.FIT_WORKER_CONCURRENCY, 1))
+    for estimate in sorted(estimates, reverse=True):
+        workers[workers.argmin()] += estimate
+    return float(workers.max())
+
+
+def dataset_progress(tasks):
+    """ Overall progress of a dataset's fits
+
+    tasks is an iterable of (estimated_time, fraction, remaining) for each
+    fit, as from DatasetTask.progress, where unknown values are None.
+    Fits are weighted by estimated time. Returns (fraction, remaining),
+    where remaining is the wall_time of the fits' remaining work.
+    """
+    total = done = 0.0
+    remaining = []
+    for estimate, fraction, seconds in tasks:
+        estimate = expected(estimate)
+        if fraction is None:
+            fraction = 0.0
+        total += estimate
+        done += estimate * fraction
+        if fraction < 1:
+            remaining.append(estimate * (1 - fraction) if seconds is None
+                             else seconds)
+    if not total:
+        return 1.0, 0.0
+    return done / total, wall_time(remaining)
@@ -0,0 +1,220 @@
+""" Task status events, pushed to browsers with Server-Sent Events
+
+When a task changes status, musycweb.taskstatus publishes the change, and
+a status report for its dataset (as returned by ajax_task_status, without
+the cursor) is built for any browsers viewing the dataset. The ASGI
+application (musycdjango.asgi) streams these from dataset/<id>/events.
+
+TASK_EVENTS_BACKEND selects how changes reach the ASGI process: 'broker'
+publishes them to a fanout exchange on the Celery broker, for separate
+worker and ASGI processes; 'memory' delivers them within the publishing
+process, for development (e.g. with eager tasks); 'none' disables them.
+Reports are only built where a dataset has subscribers, i.e. in the ASGI
+processes with the broker backend, so publishing a change is cheap when
+nobody is watching.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from importlib import import_module
+from types import SimpleNamespace
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+from django.http.cookie import parse_cookie
+from kombu import Connection, Exchange, Queue
+from .models import Dataset
+
+logger = logging.getLogger(__name__)
+
+PATH = re.compile(r'^/dataset/(\d+)/events$')
+
+
+class _Hub(object):
+    """ Subscribers' event queues, by dataset
+
+    Events may be dispatched from any thread; each is put on the queue of
+    each of the dataset's subscribers, in the subscriber's event loop.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, dataset_id):
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(dataset_id, set()).add(
+                (asyncio.get_event_loop(), queue))
+        return queue
+
+    def unsubscribe(self, dataset_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(dataset_id, set())
+            subscribers.difference_update(
+                [s for s in subscribers if s[1] is queue])
+            if not subscribers:
+                self._subscribers.pop(dataset_id, None)
+
+    def has_subscribers(self, dataset_id):
+        with self._lock:
+            return dataset_id in self._subscribers
+
+    def dispatch(self, dataset_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(dataset_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+
+hub = _Hub()
+_consumer = None
+_consumer_lock = threading.Lock()
+
+
+def _exchange():
+    return Exchange(settings.TASK_EVENTS_EXCHANGE, type='fanout',
+                    durable=False)
+
+
+def _dispatch(dataset_id, pk):
+    """ Send subscribers a dataset's status report, if it has any """
+    if hub.has_subscribers(dataset_id):
+        from .taskstatus import status_event
+
+        hub.dispatch(dataset_id, status_event(dataset_id, pk))
+
+
+def publish(dataset_id, pk=None):
+    """ Publish a change to a dataset's tasks (pk, if a single task) """
+    backend = settings.TASK_EVENTS_BACKEND
+    if backend == 'memory':
+        _dispatch(dataset_id, pk)
+    elif backend == 'broker':
+        from musycdjango.celery import app
+
+        body = {'dataset_id': dataset_id, 'pk': pk}
+        with app.producer_or_acquire() as producer:
+            producer.publish(body, exchange=_exchange(),
+                             declare=[_exchange()], serializer='json',
+                             retry=True)
+
+
+def _consume():
+    """ Dispatch events from the broker to the hub, reconnecting on error """
+    def on_message(body, message):
+        try:
+            _dispatch(body['dataset_id'], body.get('pk'))
+        except Exception:
+            logger.exception('Could not send status of dataset %s',
+                             body.get('dataset_id'))
+        finally:
+            close_old_connections()
+
+    name = f'{settings.TASK_EVENTS_EXCHANGE}.{socket.gethostname()}.' \
+           f'{os.getpid()}'
+    while True:
+        try:
+            with Connection(settings.CELERY_BROKER_URL) as connection:
+                queue = Queue(name, exchange=_exchange(), exclusive=True,
+                              auto_delete=True, durable=False)
+                with connection.Consumer(queue, callbacks=[on_message],
+                                         accept=['json'], no_ack=True):
+                    while True:
+                        connection.drain_events()
+        except Exception:
+            logger.exception('Task event consumer failed, reconnecting')
+            time.sleep(settings.TASK_EVENTS_RECONNECT_INTERVAL)
+
+
+def _start_consumer():
+    global _consumer
+    with _consumer_lock:
+        if _consumer is None and settings.TASK_EVENTS_BACKEND == 'broker':
+            _consumer = threading.Thread(target=_consume, daemon=True,
+                                         name='task-events')
+            _consumer.start()
+
+
+def _can_view(headers, dataset_id):
+    """ Whether the session in a request's cookies can view a dataset """
+    close_old_connections()
+    try:
+        cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin1'))
+        session = import_module(settings.SESSION_ENGINE).SessionStore(
+            cookies.get(settings.SESSION_COOKIE_NAME))
+        user = get_user(SimpleNamespace(session=session))
+        if not user.is_authenticated:
+            return False
+        datasets = Dataset.objects.filter(pk=dataset_id, deleted_date=None)
+        if not user.is_staff:
+            datasets = datasets.filter(owner=user)
+        return datasets.exists()
+    finally:
+        close_old_connections()
+
+
+def _message(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+async def _send_not_found(send):
+    await send({'type': 'http.response.start', 'status': 404,
+                'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': b'Not found'})
+
+
+async def dataset_events(scope, receive, send):
+    """ ASGI application streaming a dataset's task status events
+
+    Each event is a 'status' message, whose data is a JSON status report.
+    Comments are sent periodically to keep the connection open.
+    """
+    dataset_id = int(PATH.match(scope['path']).group(1))
+    headers = dict(scope['headers'])
+    if settings.TASK_EVENTS_BACKEND == 'none' or \
+            not await sync_to_async(_can_view)(headers, dataset_id):
+        await _send_not_found(send)
+        return
+
+    _start_consumer()
+    queue = hub.subscribe(dataset_id)
+    receiving = event = None
+    try:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream'),
+                                (b'cache-control', b'no-cache'),
+                                (b'x-accel-buffering', b'no')]})
+        await send({'type': 'http.response.body', 'more_body': True,
+                    'body': f'retry: {settings.TASK_EVENTS_RETRY_MS}\n\n'
+                    .encode()})
+
+        receiving = asyncio.ensure_future(receive())
+        event = asyncio.ensure_future(queue.get())
+        while True:
+            done, _ = await asyncio.wait(
+                (receiving, event), timeout=settings.TASK_EVENTS_KEEPALIVE,
+                return_when=asyncio.FIRST_COMPLETED)
+            if receiving in done:
+                if receiving.result()['type'] == 'http.disconnect':
+                    break
+                receiving = asyncio.ensure_future(receive())
+            if event in done:
+                body = _message('status', event.result())
+                event = asyncio.ensure_future(queue.get())
+            elif not done:
+                body = b': keepalive\n\n'
+            else:
+                continue
+            await send({'type': 'http.response.body', 'body': body,
+                        'more_body': True})
+    finally:
+        for future in (receiving, event):
+            if future is not None:
+                future.cancel()
+        hub.unsubscribe(dataset_id, queue)
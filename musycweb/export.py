@@ -0,0 +1,180 @@
+""" Dataset result exports
+
+Typed (columnar) exports of one or more datasets' fit results are built
+by results_frame and write. Results are read from FitResult, so each
+parameter is a float column and credible intervals are separate
+_ci_lower and _ci_upper float columns. Text columns (drug, sample, etc.)
+are dictionary encoded. Only successful fits are exported; results
+stored before FitResult was added need backfill_fit_results to be run
+first.
+
+Tables are built column-wise with pandas and pyarrow, without formatting
+values row by row.
+
+Each dataset's CSV export is also saved, gzip compressed, to
+Dataset.export_file once all its fits have finished, so downloads can be
+served as a file (by nginx, with DATASET_EXPORT_ACCEL_REDIRECT). It is
+removed when the dataset is re-processed, renamed or deleted.
+"""
+import gzip
+import logging
+import tempfile
+from itertools import islice
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.core.files import File
+from django.db.models import prefetch_related_objects
+from . import fitresults
+from .fitresults import TEXT_FIELDS
+from .models import Dataset, DatasetStatusCount, DatasetTask, FitResult
+
+logger = logging.getLogger(__name__)
+
+# Format name: (content type, file extension)
+FORMATS = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+# Columns identifying each result's dataset and task
+KEY_COLUMNS = ('dataset_id', 'dataset_name', 'task_id')
+KEY_FIELDS = ('dataset_task__dataset_id', 'dataset_task__dataset__name',
+              'dataset_task__task_id')
+
+
+def result_fields():
+    """ FitResult fields exported, in model order """
+    return [f.name for f in FitResult._meta.concrete_fields
+            if f.name not in ('id', 'dataset_task', 'csv_line')]
+
+
+def results_frame(dataset_ids):
+    """ A DataFrame of the FitResults of the given datasets """
+    fields = result_fields()
+    rows = FitResult.objects.filter(
+        dataset_task__dataset_id__in=dataset_ids
+    ).order_by('dataset_task__dataset_id', 'pk').values_list(
+        *KEY_FIELDS, *fields).iterator(
+        chunk_size=settings.DATASET_EXPORT_CHUNK_SIZE)
+    df = pd.DataFrame.from_records(rows, columns=KEY_COLUMNS + tuple(fields))
+
+    df['dataset_id'] = df['dataset_id'].astype('int32')
+    df['task_id'] = df['task_id'].astype(str)
+    for column in ('dataset_name', ) + TEXT_FIELDS:
+        df[column] = df[column].astype('category')
+    for column in fields:
+        if column not in TEXT_FIELDS:
+            df[column] = df[column].astype('float64')
+    return df
+
+
+def write(df, fmt):
+    """ A results DataFrame as bytes in one of FORMATS """
+    if fmt == 'ndjson':
+        return df.to_json(orient='records', lines=True).encode()
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    if fmt == 'parquet':
+        pq.write_table(table, sink)
+    elif fmt == 'arrow':
+        writer = pa.RecordBatchStreamWriter(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+    else:
+        raise ValueError(f'Unknown export format: {fmt}')
+    return sink.getvalue().to_pybytes()
+
+
+def csv_lines(dataset):
+    """ A dataset's results as CSV text, in chunks of lines """
+    tasks = DatasetTask.objects.filter(dataset=dataset).select_related(
+        'fit_result').order_by('pk').iterator(
+        chunk_size=settings.DATASET_EXPORT_CHUNK_SIZE)
+
+    yield DatasetTask(dataset=dataset).result_csv_header + '\n'
+    while True:
+        chunk = list(islice(tasks, settings.DATASET_EXPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        # Results without a precomputed CSV line are read from their
+        # TaskResult, fetched for the whole chunk
+        missing = []
+        for task in chunk:
+            task.dataset = dataset
+            try:
+                if task.fit_result.csv_line is None:
+                    missing.append(task)
+            except FitResult.DoesNotExist:
+                missing.append(task)
+        prefetch_related_objects(missing, 'task')
+        missing = set(missing)
+
+        yield ''.join(
+            (task.result_csv_line if task in missing else
+             fitresults.csv_line(task.fit_result, task)) + '\n'
+            for task in chunk)
+
+
+def fits_finished(dataset_id):
+    """ Whether a dataset has fits, none queued or running
+
+    Read from the dataset's status counts (see musycweb.taskstatus), so
+    this is cheap enough to check as each fit finishes.
+    """
+    counts = dict(DatasetStatusCount.objects.filter(
+        dataset_id=dataset_id).values_list('group', 'count'))
+    return sum(counts.values()) > 0 and not counts.get('queued') and \
+        not counts.get('started')
+
+
+def is_complete(dataset):
+    """ Whether a prepared dataset's fits have all finished """
+    if dataset.deleted_date is not None or \
+            dataset.preparation_status != 'ready':
+        return False
+    return fits_finished(dataset.pk)
+
+
+def materialise(dataset_id):
+    """ Save a dataset's CSV export, if its fits have all finished
+
+    Returns whether the export was saved.
+    """
+    try:
+        dataset = Dataset.objects.get(pk=dataset_id)
+    except Dataset.DoesNotExist:
+        return False
+    if dataset.export_file or not is_complete(dataset):
+        return False
+    name = dataset.name
+
+    with tempfile.TemporaryFile() as f:
+        with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+            for chunk in csv_lines(dataset):
+                gz.write(chunk.encode())
+        f.seek(0)
+        dataset.export_file.save(f'{dataset.pk}.csv.gz', File(f),
+                                 save=False)
+
+    # Discard the export if the dataset changed while it was written
+    dataset.refresh_from_db(fields=['name', 'preparation_status',
+                                    'deleted_date'])
+    if dataset.name != name or not is_complete(dataset) or \
+            Dataset.objects.filter(
+                pk=dataset.pk, export_file='').update(
+                export_file=dataset.export_file.name) == 0:
+        dataset.export_file.delete(save=False)
+        return False
+    logger.info('Saved export of dataset %d', dataset.pk)
+    return True
+
+
+def invalidate(dataset):
+    """ Remove a dataset's saved CSV export, if any """
+    if dataset.export_file:
+        dataset.export_file.delete(save=False)
+    Dataset.objects.filter(pk=dataset.pk).update(export_file='')
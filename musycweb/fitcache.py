@@ -0,0 +1,121 @@
+""" Content-addressed cache of fit_drug_combination results
+
+Results are keyed by a fingerprint of everything that determines a fit: the
+data arrays, fitting constraints and options, sampler settings and the
+musyc_code version. A matching result is reused instead of refitting.
+"""
+import functools
+import hashlib
+import importlib.util
+import json
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .arrays import ARRAY_FIELDS, unpack_array
+from .models import FitCacheEntry, FitCacheStats
+
+
+@functools.lru_cache(maxsize=None)
+def musyc_code_version():
+    """ Version of the fitting code, as a hash of its source files """
+    if settings.MUSYC_CODE_VERSION:
+        return settings.MUSYC_CODE_VERSION
+
+    spec = importlib.util.find_spec('musyc_code.SynergyCalculator')
+    h = hashlib.sha256()
+    for path in spec.submodule_search_locations:
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                if filename.endswith('.py'):
+                    with open(os.path.join(root, filename), 'rb') as f:
+                        h.update(f.read())
+    return h.hexdigest()
+
+
+def fit_fingerprint(fit_inputs):
+    """ Fingerprint of a fit's inputs
+
+    fit_inputs is a dict of the fit_drug_combination arguments which affect
+    the fit, plus the sampler settings. Arrays may be packed or ndarrays.
+    Labels which don't affect the fit, such as the dataset name, batch and
+    units, should not be included.
+    """
+    h = hashlib.sha256()
+    params = {}
+    for k, v in sorted(fit_inputs.items()):
+        if k in ARRAY_FIELDS:
+            h.update(k.encode())
+            h.update(unpack_array(v).tobytes())
+        else:
+            params[k] = v
+    params['musyc_code_version'] = musyc_code_version()
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _count(hits=0, misses=0):
+    FitCacheStats.objects.get_or_create(pk=1)
+    FitCacheStats.objects.filter(pk=1).update(
+        hits=F('hits') + hits, misses=F('misses') + misses)
+
+
+def lookup(fingerprints, count=True):
+    """ Look up cached results
+
+    Returns a dict of fingerprint to result dict, for those fingerprints
+    found in the cache. Last used times are updated, and hit/miss counters
+    too if count is True.
+    """
+    if not settings.FIT_CACHE_ENABLED or not fingerprints:
+        return {}
+
+    fingerprints = set(fingerprints)
+    found = {fp: json.loads(result) for fp, result in
+             FitCacheEntry.objects.filter(
+                 fingerprint__in=fingerprints
+             ).values_list('fingerprint', 'result')}
+    if found:
+        FitCacheEntry.objects.filter(fingerprint__in=found.keys()).update(
+            last_used=timezone.now(), hits=F('hits') + 1)
+    if count:
+        _count(hits=len(found), misses=len(fingerprints) - len(found))
+    return found
+
+
+def get(fingerprint, count=True):
+    """ Get a cached result dict, or None if not found """
+    return lookup([fingerprint], count=count).get(fingerprint)
+
+
+def store(fingerprint, result):
+    """ Store a successful fit result """
+    if not settings.FIT_CACHE_ENABLED:
+        return
+
+    FitCacheEntry.objects.update_or_create(
+        fingerprint=fingerprint,
+        defaults={'result': json.dumps(result)}
+    )
+
+
+def evict():
+    """ Remove expired entries, then least recently used entries over limit
+
+    Returns the number of entries removed.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.FIT_CACHE_MAX_AGE_DAYS)
+    num_deleted, _ = FitCacheEntry.objects.filter(
+        last_used__lt=cutoff).delete()
+
+    lru_cutoff = FitCacheEntry.objects.order_by('-last_used').values_list(
+        'last_used', flat=True)[settings.FIT_CACHE_MAX_ENTRIES:
+                                settings.FIT_CACHE_MAX_ENTRIES + 1]
+    if lru_cutoff:
+        num_lru, _ = FitCacheEntry.objects.filter(
+            last_used__lte=lru_cutoff[0]).delete()
+        num_deleted += num_lru
+
+    return num_deleted
@@ -0,0 +1,93 @@
+""" Typed fit results (FitResult), from fit_drug_combination's results
+
+A FitResult is saved for each successful fit, from the task_success hook
+in musycweb.tasks, or when a result is reused from the fit cache. Results
+stored before FitResult was added are filled in by the
+backfill_fit_results management command.
+"""
+import numpy as np
+from .convergence import interval
+from .models import DatasetTask, FitResult
+
+# Text columns; the rest of DatasetTask.FIELDS_CSV are floats, or split
+# into lower and upper floats for credible intervals (*_ci)
+TEXT_FIELDS = ('sample', 'drug1_name', 'drug2_name', 'expt', 'batch',
+               'drug1_units', 'drug2_units', 'metric_name', 'fit_method')
+# Not part of the result dict
+DERIVED_FIELDS = ('task_status', 'dataset_name')
+# Fields of FitResult.csv_line
+CSV_LINE_FIELDS = DatasetTask.FIELDS_CSV[:-1]
+assert DatasetTask.FIELDS_CSV[-1] == 'dataset_name'
+
+
+def _float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if np.isfinite(value) else None
+
+
+def fields(result):
+    """ FitResult field values from a task's result dict """
+    values = {'csv_line': DatasetTask.csv_line(
+        dict(result, task_status='SUCCESS'), CSV_LINE_FIELDS)}
+    for field in DatasetTask.FIELDS_CSV:
+        if field in DERIVED_FIELDS:
+            continue
+        value = result.get(field)
+        if field in TEXT_FIELDS:
+            values[field] = None if value is None else str(value)
+        elif field.endswith('_ci'):
+            lower, upper = interval(value) or (None, None)
+            values[f'{field}_lower'] = lower
+            values[f'{field}_upper'] = upper
+        else:
+            values[field] = _float(value)
+    return values
+
+
+def build(dataset_task, result):
+    """ An unsaved FitResult for a DatasetTask's result dict """
+    return FitResult(dataset_task=dataset_task, **fields(result))
+
+
+def save(task_id, result):
+    """ Save (or replace) the FitResult for a task, if it still exists """
+    dataset_task = DatasetTask.objects.filter(task_id=task_id).first()
+    if dataset_task is None:
+        return None
+    fit_result, _ = FitResult.objects.update_or_create(
+        dataset_task=dataset_task, defaults=fields(result))
+    return fit_result
+
+
+def csv_line(fit_result, dataset_task):
+    """ A result's CSV line, as DatasetTask.result_csv_line """
+    return fit_result.csv_line + ',' + DatasetTask.csv_line(
+        {'dataset_name': dataset_task.dataset.name}, ('dataset_name', ))
+
+
+def plot_row(fit_result, dataset_task):
+    """ A result as the row of strings used by the analysis plot modules
+
+    Matches DatasetTask.result_csv_line with quotes and spaces removed.
+    """
+    row = []
+    for field in DatasetTask.FIELDS_CSV:
+        if field == 'task_status':
+            value = 'SUCCESS'
+        elif field == 'dataset_name':
+            value = dataset_task.dataset.name
+        elif field in TEXT_FIELDS:
+            value = getattr(fit_result, field)
+        elif field.endswith('_ci'):
+            value = [getattr(fit_result, f'{field}_lower'),
+                     getattr(fit_result, f'{field}_upper')]
+            value = [np.nan if v is None else v for v in value]
+        else:
+            value = getattr(fit_result, field)
+            if value is None:
+                value = np.nan
+        row.append(str(value).replace(' ', '').replace('"', ''))
+    return row
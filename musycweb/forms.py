@@ -1,32 +1,69 @@
 from crispy_forms.helper import FormHelper
-from crispy_forms.layout import Submit
+from crispy_forms.layout import Button, Submit
 from allauth.account import forms as allauth_forms
 from allauth.account.adapter import DefaultAccountAdapter
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.admin.widgets import FilteredSelectMultiple
 from django.contrib.auth.models import Group
 from .models import Dataset, Profile
+from . import ingest
 import numpy as np
 import swot
 
 
+def clean_dataset_file(f):
+    """ Check an uploaded dataset file's encoding, header and first rows
+
+    The whole file is validated by prepare_dataset, off the request path.
+    """
+    try:
+        c = next(f.chunks())
+    except StopIteration:
+        raise forms.ValidationError('File is empty!')
+
+    try:
+        c = c.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise forms.ValidationError(
+            'File needs to use Unicode UTF-8 '
+            'encoding. Either the encoding is wrong, or this isn\'t a '
+            'CSV file.')
+
+    first_line = c.splitlines()[0]
+    if ',' not in first_line:
+        raise forms.ValidationError(
+            'No comma detected in first line. Check separator is comma '
+            'and not tab, for example.')
+    if first_line.lower() != first_line:
+        raise forms.ValidationError('Column names must be in lower case')
+
+    headers = set(first_line.split(','))
+    # Remove quotes, if applicable
+    if all(h.startswith('"') and h.endswith('"') for h in headers):
+        headers = [h[1:-1] for h in headers]
+    missing_headers = ingest.REQUIRED_FIELDS.keys() - headers
+    if missing_headers:
+        raise forms.ValidationError(
+            f'Missing required fields: {", ".join(missing_headers)}'
+        )
+
+    # Run the same row-level checks as the worker, on the first chunk, so
+    # common mistakes are reported on upload
+    f.seek(0)
+    report = ingest.validate_dataset(
+        f, nrows=settings.DATASET_READ_CHUNKSIZE)
+    f.seek(0)
+    if not report.is_valid:
+        raise forms.ValidationError(report.messages())
+
+    return f
+
+
 class CreateDatasetForm(forms.Form):
-    REQUIRED_FIELDS = {
-        'expt.date': str,
-        'drug1.conc': float,
-        'drug2.conc': float,
-        'effect': float,
-        'sample': str,
-        'drug1': str,
-        'drug2': str,
-        'drug1.units': str,
-        'drug2.units': str
-    }
-    OPTIONAL_FIELDS = {
-        'batch': str,
-        'effect.95ci': float
-    }
+    REQUIRED_FIELDS = ingest.REQUIRED_FIELDS
+    OPTIONAL_FIELDS = ingest.OPTIONAL_FIELDS
 
     name = forms.CharField()
     file = forms.FileField()
@@ -37,6 +74,10 @@ class CreateDatasetForm(forms.Form):
     metric_name = forms.CharField(
         max_length=32,
         initial=Dataset._meta.get_field('metric_name').default)
+    fit_mode = forms.ChoiceField(
+        choices=Dataset.FIT_MODE_CHOICES,
+        widget=forms.RadioSelect,
+        initial=Dataset._meta.get_field('fit_mode').default)
     effect_constraint = forms.ChoiceField(
         choices=(('none', 'Unconstrained'),
                  ('fixed', 'Fixed (No synergistic efficacy, beta=0)'),
@@ -56,43 +97,14 @@ class CreateDatasetForm(forms.Form):
 
         self.helper = FormHelper()
         self.helper.form_id = 'create-dataset-form'
+        self.helper.add_input(Button('estimate', 'Estimate Run Time',
+                                     css_id='btn-estimate',
+                                     css_class='btn-secondary btn-block'))
         self.helper.add_input(Submit('submit', 'Create Dataset',
                                      css_class='btn-block'))
 
     def clean_file(self):
-        f = self.cleaned_data['file']
-        try:
-            c = next(f.chunks())
-        except StopIteration:
-            raise forms.ValidationError('File is empty!')
-
-        try:
-            c = c.decode('utf-8-sig')
-        except UnicodeDecodeError:
-            raise forms.ValidationError(
-                'File needs to use Unicode UTF-8 '
-                'encoding. Either the encoding is wrong, or this isn\'t a '
-                'CSV file.')
-
-        first_line = c.splitlines()[0]
-        if ',' not in first_line:
-            raise forms.ValidationError(
-                'No comma detected in first line. Check separator is comma '
-                'and not tab, for example.')
-        if first_line.lower() != first_line:
-            raise forms.ValidationError('Column names must be in lower case')
-
-        headers = set(first_line.split(','))
-        # Remove quotes, if applicable
-        if all(h.startswith('"') and h.endswith('"') for h in headers):
-            headers = [h[1:-1] for h in headers]
-        missing_headers = self.REQUIRED_FIELDS.keys() - headers
-        if missing_headers:
-            raise forms.ValidationError(
-                f'Missing required fields: {", ".join(missing_headers)}'
-            )
-
-        return f
+        return clean_dataset_file(self.cleaned_data['file'])
 
     def _clean_orientation(self):
         try:
@@ -212,6 +224,13 @@ class CreateDatasetForm(forms.Form):
         return self.cleaned_data
 
 
+class ReplaceDatasetFileForm(forms.Form):
+    file = forms.FileField()
+
+    def clean_file(self):
+        return clean_dataset_file(self.cleaned_data['file'])
+
+
 class CentredAuthForm(allauth_forms.LoginForm):
     def __init__(self, *args, **kwargs):
         super(CentredAuthForm, self).__init__(*args, **kwargs)
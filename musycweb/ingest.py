@@ -0,0 +1,281 @@
+import io
+import logging
+import resource
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+from django.conf import settings
+from .validation import ValidationReport, validate_chunk
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = {
+    'expt.date': str,
+    'drug1.conc': float,
+    'drug2.conc': float,
+    'effect': float,
+    'sample': str,
+    'drug1': str,
+    'drug2': str,
+    'drug1.units': str,
+    'drug2.units': str
+}
+OPTIONAL_FIELDS = {
+    'batch': str,
+    'effect.95ci': float
+}
+FIELDS = {**REQUIRED_FIELDS, **OPTIONAL_FIELDS}
+STRING_FIELDS = [f for f, v in FIELDS.items() if v is str]
+FLOAT_FIELDS = [f for f, v in FIELDS.items() if v is float]
+
+
+class DataError(Exception):
+    pass
+
+
+class DataWarning(UserWarning):
+    pass
+
+
+def peak_rss_mb():
+    """ Peak resident set size of this process so far, in megabytes """
+    try:
+        # Unlike ru_maxrss, VmHWM is not inherited from a parent process
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _canonicalise_drug_order(chunk):
+    """ Swap drug columns so drug1 comes alphabetically first """
+    out_of_order = (chunk['drug1'] > chunk['drug2']).to_numpy()
+    if not out_of_order.any():
+        return
+    cols1 = ['drug1', 'drug1.conc', 'drug1.units']
+    cols2 = ['drug2', 'drug2.conc', 'drug2.units']
+    swapped = chunk.loc[out_of_order, cols2 + cols1]
+    # Assign raw values, as .loc would otherwise align on column names
+    for col, src in zip(cols1 + cols2, cols2 + cols1):
+        chunk.loc[out_of_order, col] = swapped[src].to_numpy()
+
+
+def _concat_compact(chunks):
+    """ Concatenate chunks whose string columns are categoricals """
+    columns = {}
+    for col in chunks[0].columns:
+        parts = [c[col] for c in chunks]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            columns[col] = pd.Series(union_categoricals(parts))
+        else:
+            columns[col] = pd.Series(np.concatenate(
+                [p.to_numpy() for p in parts]))
+    return pd.DataFrame(columns)
+
+
+def _read_chunks(f, warn, chunksize, report, numeric_as_text=False,
+                 nrows=None):
+    """ Read a dataset CSV in chunks, cleaning and validating each
+
+    Yields (chunk, use_batches) tuples. Violations are recorded in report.
+    With numeric_as_text, numeric columns are read as strings and
+    converted during validation, so unparseable values can be located.
+    Only the first nrows rows are read, if given.
+    """
+    dtype = {k: str for k in FIELDS} if numeric_as_text else FIELDS
+    reader = pd.read_csv(f, delimiter=',', dtype=dtype, chunksize=chunksize,
+                         nrows=nrows)
+    first_chunk = True
+    for chunk in reader:
+        if first_chunk:
+            first_chunk = False
+            # Warn about surplus columns
+            surplus_columns = set(chunk.columns) - set(FIELDS.keys())
+            if surplus_columns:
+                warn(f'Extra columns were ignored: '
+                     f'{", ".join(surplus_columns)}')
+
+        # Warn about capitalized column names and convert
+        if any(c != str(c).lower() for c in chunk.columns):
+            chunk.columns = [str(c).lower() for c in chunk.columns]
+            warn('Converting column names to lowercase')
+        chunk = chunk[[c for c in chunk.columns if c in FIELDS]]
+        use_batches = 'batch' in chunk.columns
+
+        # Drop empty rows
+        nrows = chunk.shape[0]
+        chunk = chunk.dropna(axis=0, how='all')
+        if chunk.shape[0] != nrows:
+            warn('Empty rows have been dropped')
+
+        yield validate_chunk(chunk.copy(), use_batches, report), use_batches
+
+
+def _validated_chunks(f, warn, chunksize, report, nrows=None):
+    """ Valid chunks of a dataset CSV, as (chunk, use_batches) tuples
+
+    Reading stops at the first chunk with a violation, but validation
+    continues to the end of the file, so report holds every violation.
+    If a numeric column can't be parsed, the file is validated again with
+    numeric columns read as text, to find the rows responsible.
+    """
+    try:
+        chunks = _read_chunks(f, warn, chunksize, report, nrows=nrows)
+        for chunk, use_batches in chunks:
+            if report.is_valid:
+                yield chunk, use_batches
+    except ValueError as e:
+        if 'could not convert string to float' not in str(e):
+            # Re-raise any unknown error
+            raise
+
+        report.clear()
+        f.seek(0)
+        for _ in _read_chunks(f, lambda msg: None, chunksize, report,
+                              numeric_as_text=True, nrows=nrows):
+            pass
+        if report.is_valid:
+            raise DataError(
+                'Error in one or more of the '
+                f'{", ".join(FLOAT_FIELDS)} columns: {e}')
+
+
+def _check_budget(report):
+    logger.info('Validated %d rows in %.2fs (%.2f us/row)',
+                report.rows_checked, report.elapsed, report.us_per_row)
+    # Fixed overheads dominate the per-row cost of small files
+    if report.rows_checked >= 10000 and \
+            report.us_per_row > settings.DATASET_VALIDATION_BUDGET_US_PER_ROW:
+        logger.warning('Dataset validation over budget: %.2f us/row '
+                       '(budget: %.2f us/row)', report.us_per_row,
+                       settings.DATASET_VALIDATION_BUDGET_US_PER_ROW)
+
+
+def validate_dataset(f, warn=None, chunksize=None, nrows=None):
+    """ Validate a dataset CSV without keeping its data
+
+    Runs the same checks as read_dataset, on the first nrows rows if given.
+    Returns a ValidationReport.
+    """
+    if chunksize is None:
+        chunksize = settings.DATASET_READ_CHUNKSIZE
+    report = ValidationReport(
+        max_rows=settings.DATASET_VALIDATION_MAX_ROWS_PER_RULE)
+    for _ in _validated_chunks(f, warn or (lambda msg: None), chunksize,
+                               report, nrows=nrows):
+        pass
+    _check_budget(report)
+    return report
+
+
+def read_dataset(f, warn, chunksize=None):
+    """ Read, validate and normalise an uploaded dataset CSV in chunks
+
+    Each chunk is validated as it is read, and its string columns stored
+    as categoricals, so only one compact copy of the dataset is held in
+    memory. Drug order is canonicalised and the effect.sd column is added.
+
+    warn is called with a message for each (non-fatal) data issue. Fatal
+    issues raise DataError.
+
+    Returns (data, use_batches, stats), where stats is a dict of ingestion
+    statistics, including peak memory use.
+    """
+    if chunksize is None:
+        chunksize = settings.DATASET_READ_CHUNKSIZE
+
+    start = time.perf_counter()
+    warned = set()
+
+    def warn_once(message):
+        if message not in warned:
+            warned.add(message)
+            warn(message)
+
+    report = ValidationReport(
+        max_rows=settings.DATASET_VALIDATION_MAX_ROWS_PER_RULE)
+    chunks = []
+    use_batches = False
+    for chunk, use_batches in _validated_chunks(f, warn_once, chunksize,
+                                                report):
+        # Remove rows with missing effect value
+        if chunk['effect'].isna().any():
+            warn_once('Effect columns which are missing/NaN will be removed')
+            chunk = chunk[chunk['effect'].notna()]
+
+        _canonicalise_drug_order(chunk)
+        for col in STRING_FIELDS:
+            if col in chunk.columns:
+                chunk[col] = chunk[col].astype('category')
+        chunks.append(chunk)
+
+    _check_budget(report)
+    if not report.is_valid:
+        raise DataError(report.error_message())
+
+    if not chunks:
+        raise DataError('File contains no data')
+
+    num_chunks = len(chunks)
+    data = _concat_compact(chunks)
+    del chunks
+
+    if data.shape[0] == 0:
+        raise DataError('File contains no rows with an effect value')
+
+    # Add in optional effect.95ci column if not present
+    if 'effect.95ci' not in data.columns:
+        ci_val = abs(min(data['effect']/100.))
+        if ci_val == 0:
+            ci_val = 1e-16
+        data['effect.95ci'] = ci_val
+
+    # Add SD
+    data['effect.sd'] = data['effect.95ci'] / (2 * 1.96)
+
+    stats = {
+        'rows_read': report.rows_checked,
+        'rows': data.shape[0],
+        'chunks': num_chunks,
+        'memory_mb': data.memory_usage(deep=True).sum() / 2 ** 20,
+        'peak_rss_mb': peak_rss_mb(),
+        'validation_us_per_row': report.us_per_row,
+        'read_time': time.perf_counter() - start
+    }
+    logger.info('Read dataset: %(rows)d rows in %(chunks)d chunks, '
+                '%(memory_mb).1f MB in memory, peak RSS %(peak_rss_mb).1f MB, '
+                '%(read_time).2fs', stats)
+
+    return data, use_batches, stats
+
+
+def write_canonical(data):
+    """ Serialise a dataset from read_dataset as Parquet, returning bytes
+
+    Columns keep their types, including categoricals, so the canonical copy
+    can be read back without parsing or validating the CSV again.
+    """
+    buf = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(data, preserve_index=False), buf)
+    return buf.getvalue()
+
+
+def read_canonical(f):
+    """ Read a dataset written by write_canonical
+
+    Returns (data, use_batches), as for read_dataset.
+    """
+    data = pq.read_table(f).to_pandas()
+    return data, 'batch' in data.columns
+
+
+def read_canonical_columns(f, columns):
+    """ Read only the given columns of a dataset written by write_canonical """
+    return pq.read_table(f, columns=list(columns)).to_pandas()
@@ -0,0 +1,43 @@
+import json
+from django.core.management.base import BaseCommand
+from django_celery_results.models import states
+from musycweb.fitresults import build
+from musycweb.models import DatasetTask, FitResult
+
+
+class Command(BaseCommand):
+    help = 'Create FitResults for successful fits stored before FitResults ' \
+           'were added'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        tasks = DatasetTask.objects.filter(
+            task__status=states.SUCCESS,
+            fit_result__isnull=True
+        ).select_related('task').order_by('pk')
+
+        num_created = num_skipped = 0
+        last_pk = 0
+        while True:
+            batch = list(tasks.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            fit_results = []
+            for dataset_task in batch:
+                try:
+                    result = json.loads(dataset_task.task.result)
+                except (TypeError, ValueError):
+                    num_skipped += 1
+                    continue
+                fit_results.append(build(dataset_task, result))
+            FitResult.objects.bulk_create(fit_results)
+            num_created += len(fit_results)
+            self.stdout.write(f'{num_created} created...')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {num_created} FitResults ({num_skipped} unreadable '
+            f'results skipped)'))
@@ -0,0 +1,195 @@
+""" Resource accounting for fitting tasks
+
+Each run of a tracked task records its queue wait, wall clock time, CPU
+time (including any local process pool it used) and peak memory to
+TaskMetrics, from Celery's task_prerun and task_postrun signals. The
+admin report aggregates these to size worker concurrency.
+"""
+import logging
+import os
+import resource
+import socket
+import time
+import numpy as np
+from celery.signals import task_prerun, task_postrun
+from django.conf import settings
+from django.utils import timezone
+from .arrays import unpack_array
+from .ingest import peak_rss_mb
+from .models import DatasetTask, TaskMetrics
+
+logger = logging.getLogger(__name__)
+
+_tracked = set()
+_running = {}
+
+
+def _cpu_time():
+    """ CPU time used by this process and its reaped children, in seconds """
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _reset_peak_rss():
+    """ Reset this process's peak RSS (VmHWM), where supported """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _host_memory_mb():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / \
+            2 ** 20
+    except (ValueError, OSError):
+        return None
+
+
+def track(task):
+    """ Record TaskMetrics for each run of a Celery task """
+    _tracked.add(task.name)
+
+
+@task_prerun.connect
+def _prerun(task_id=None, task=None, **kwargs):
+    if task is None or task.name not in _tracked:
+        return
+    _reset_peak_rss()
+    _running[task_id] = (timezone.now(), time.monotonic(), _cpu_time())
+
+
+@task_postrun.connect
+def _postrun(task_id=None, task=None, kwargs=None, retval=None, state=None,
+             **extra):
+    try:
+        started, wall_start, cpu_start = _running.pop(task_id)
+    except KeyError:
+        return
+
+    try:
+        wall_time = time.monotonic() - wall_start
+        cpu_time = _cpu_time() - cpu_start
+        kwargs = kwargs or {}
+        try:
+            num_points = len(unpack_array(kwargs['d1']))
+        except (KeyError, TypeError, ValueError):
+            num_points = None
+
+        dataset_id = kwargs.get('dataset_id')
+        queue_wait = None
+        submitted = DatasetTask.objects.filter(task_id=task_id).values_list(
+            'submitted_date', flat=True).first()
+        if submitted:
+            queue_wait = max((started - submitted).total_seconds(), 0.0)
+
+        TaskMetrics.objects.create(
+            task_id=task_id,
+            dataset_id=dataset_id,
+            dataset_size=DatasetTask.objects.filter(
+                dataset_id=dataset_id).count() if dataset_id else None,
+            num_points=num_points,
+            fit_alg=kwargs.get('fit_alg'),
+            sampling=kwargs.get('sampling'),
+            fit_mode=kwargs.get('fit_mode'),
+            status=state,
+            hostname=task.request.hostname or socket.gethostname(),
+            host_cpus=os.cpu_count(),
+            host_memory_mb=_host_memory_mb(),
+            processes=retval.get('fit_processes', 1)
+            if isinstance(retval, dict) else 1,
+            started=started,
+            queue_wait=queue_wait,
+            wall_time=wall_time,
+            cpu_time=cpu_time,
+            peak_rss_mb=peak_rss_mb()
+        )
+    except Exception:
+        # Accounting must never fail the task
+        logger.exception('Could not record metrics for task %s', task_id)
+
+
+def _bucket(value, base):
+    """ The power of base range containing value, as (lower, label) """
+    if value is None or value <= 0:
+        return 0, 'unknown'
+    lower = int(base ** np.floor(np.log(value) / np.log(base) + 1e-9))
+    return lower, f'{lower}-{lower * base - 1}'
+
+
+def _summarise(rows):
+    wall = np.array([r['wall_time'] for r in rows])
+    cpu = np.array([r['cpu_time'] for r in rows])
+    rss = np.array([r['peak_rss_mb'] for r in rows
+                    if r['peak_rss_mb'] is not None])
+    waits = np.array([r['queue_wait'] for r in rows
+                      if r['queue_wait'] is not None])
+    return {
+        'count': len(rows),
+        'wall_mean': wall.mean(),
+        'wall_p95': np.percentile(wall, 95),
+        'cpu_mean': cpu.mean(),
+        'cpu_utilisation': cpu.sum() / wall.sum() if wall.sum() else None,
+        'rss_mean': rss.mean() if len(rss) else None,
+        'rss_p95': np.percentile(rss, 95) if len(rss) else None,
+        'queue_wait_mean': waits.mean() if len(waits) else None,
+    }
+
+
+def report(queryset, limit=None):
+    """ Aggregate TaskMetrics for capacity planning
+
+    Returns a dict of lists of summary rows: 'by_points' grouped by fit_alg
+    and number of data points, 'by_dataset' by dataset size (combinations)
+    and 'by_host' by worker host, with a suggested worker concurrency for
+    each host. limit restricts the report to the most recent results.
+    """
+    if limit is None:
+        limit = settings.TASK_METRICS_REPORT_HISTORY
+    rows = list(queryset.order_by('-started').values(
+        'fit_alg', 'num_points', 'dataset_size', 'hostname', 'host_cpus',
+        'host_memory_mb', 'processes', 'wall_time', 'cpu_time',
+        'peak_rss_mb', 'queue_wait')[:limit])
+
+    def grouped(key, label):
+        """ Summaries of rows grouped (and sorted) by key(row) """
+        groups = {}
+        for row in rows:
+            groups.setdefault(key(row), []).append(row)
+        return [dict(_summarise(v), label=label(k), rows=v)
+                for k, v in sorted(groups.items())]
+
+    by_host = grouped(lambda r: r['hostname'] or '', lambda k: k)
+    for summary in by_host:
+        host_rows = summary.pop('rows')
+        cpus = max(r['host_cpus'] or 0 for r in host_rows)
+        memory = max(r['host_memory_mb'] or 0 for r in host_rows)
+        limits = []
+        if cpus and summary['cpu_utilisation']:
+            limits.append(cpus / summary['cpu_utilisation'])
+        if memory and summary['rss_p95']:
+            limits.append(memory * settings.TASK_METRICS_MEMORY_HEADROOM /
+                          summary['rss_p95'])
+        summary.update(
+            cpus=cpus or None, memory_mb=memory or None,
+            concurrency=max(int(min(limits)), 1) if limits else None)
+
+    by_points = grouped(
+        lambda r: (r['fit_alg'] or 'unknown', _bucket(r['num_points'], 2)),
+        lambda k: f'{k[0]}, {k[1][1]} points' if k[1][0] else
+        f'{k[0]}, unknown')
+    by_dataset = grouped(lambda r: _bucket(r['dataset_size'], 10),
+                         lambda k: f'{k[1]} combinations' if k[0] else
+                         'unknown')
+    for summary in by_points + by_dataset:
+        del summary['rows']
+
+    return {
+        'by_points': by_points,
+        'by_dataset': by_dataset,
+        'by_host': by_host,
+    }
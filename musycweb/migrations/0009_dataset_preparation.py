@@ -0,0 +1,33 @@
+# Generated by Django 3.0.3 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0008_user_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='preparation_error',
+            field=models.TextField(default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='preparation_progress',
+            field=models.FloatField(default=1.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='preparation_status',
+            field=models.CharField(choices=[('preparing', 'Preparing'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='preparation_warnings',
+            field=models.TextField(default='[]', editable=False),
+        ),
+    ]
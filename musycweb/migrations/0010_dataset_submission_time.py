@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0009_dataset_preparation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='submission_time',
+            field=models.FloatField(default=None, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.0.3 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0010_dataset_submission_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FitCacheEntry',
+            fields=[
+                ('fingerprint', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('result', models.TextField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_used', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('hits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'fit cache entries',
+            },
+        ),
+        migrations.CreateModel(
+            name='FitCacheStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hits', models.BigIntegerField(default=0)),
+                ('misses', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'fit cache stats',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0011_fit_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasettask',
+            name='fingerprint',
+            field=models.CharField(default=None, editable=False, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0012_datasettask_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasettask',
+            name='estimated_time',
+            field=models.FloatField(default=None, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0013_datasettask_estimated_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='canonical_file',
+            field=models.FileField(blank=True, editable=False, upload_to='_state/canonical'),
+        ),
+    ]
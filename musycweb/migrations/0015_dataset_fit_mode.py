@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0014_dataset_canonical_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='fit_mode',
+            field=models.CharField(choices=[('standard', 'Standard (full Monte Carlo confidence intervals)'), ('fast', 'Fast (point estimates, approximate confidence intervals)')], default='standard', editable=False, max_length=16),
+        ),
+    ]
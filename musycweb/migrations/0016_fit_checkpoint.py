@@ -0,0 +1,27 @@
+# Generated by Django 3.0.3 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0015_dataset_fit_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FitCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(db_index=True, max_length=64)),
+                ('stage', models.PositiveSmallIntegerField()),
+                ('chain', models.PositiveSmallIntegerField()),
+                ('result', models.TextField()),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'unique_together': {('fingerprint', 'stage', 'chain')},
+            },
+        ),
+    ]
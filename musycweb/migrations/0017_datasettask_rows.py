@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0016_fit_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasettask',
+            name='rows',
+            field=models.TextField(default=None, editable=False, null=True),
+        ),
+    ]
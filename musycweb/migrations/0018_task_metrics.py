@@ -0,0 +1,45 @@
+# Generated by Django 3.0.3 on 2026-10-18 14:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0017_datasettask_rows'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasettask',
+            name='submitted_date',
+            field=models.DateTimeField(default=None, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='TaskMetrics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(db_index=True, max_length=255)),
+                ('dataset_size', models.PositiveIntegerField(null=True)),
+                ('num_points', models.PositiveIntegerField(null=True)),
+                ('fit_alg', models.CharField(max_length=50, null=True)),
+                ('sampling', models.CharField(max_length=20, null=True)),
+                ('fit_mode', models.CharField(max_length=20, null=True)),
+                ('status', models.CharField(max_length=50, null=True)),
+                ('hostname', models.CharField(max_length=255, null=True)),
+                ('host_cpus', models.PositiveIntegerField(null=True)),
+                ('host_memory_mb', models.FloatField(null=True)),
+                ('processes', models.PositiveIntegerField(default=1)),
+                ('started', models.DateTimeField(db_index=True)),
+                ('queue_wait', models.FloatField(null=True)),
+                ('wall_time', models.FloatField()),
+                ('cpu_time', models.FloatField()),
+                ('peak_rss_mb', models.FloatField(null=True)),
+                ('dataset', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='musycweb.Dataset')),
+            ],
+            options={
+                'verbose_name_plural': 'task metrics',
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 3.0.3 on 2026-10-18 15:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0018_task_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FitResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sample', models.TextField(null=True)),
+                ('drug1_name', models.TextField(null=True)),
+                ('drug2_name', models.TextField(null=True)),
+                ('expt', models.TextField(null=True)),
+                ('batch', models.TextField(null=True)),
+                ('converge_mc_nlls', models.FloatField(null=True)),
+                ('beta', models.FloatField(db_index=True, null=True)),
+                ('beta_ci_lower', models.FloatField(null=True)),
+                ('beta_ci_upper', models.FloatField(null=True)),
+                ('beta_obs', models.FloatField(null=True)),
+                ('beta_obs_ci_lower', models.FloatField(null=True)),
+                ('beta_obs_ci_upper', models.FloatField(null=True)),
+                ('log_alpha1', models.FloatField(db_index=True, null=True)),
+                ('log_alpha1_ci_lower', models.FloatField(null=True)),
+                ('log_alpha1_ci_upper', models.FloatField(null=True)),
+                ('log_alpha2', models.FloatField(db_index=True, null=True)),
+                ('log_alpha2_ci_lower', models.FloatField(null=True)),
+                ('log_alpha2_ci_upper', models.FloatField(null=True)),
+                ('R2', models.FloatField(db_index=True, null=True)),
+                ('log_like_mc_nlls', models.FloatField(null=True)),
+                ('E0', models.FloatField(null=True)),
+                ('E0_ci_lower', models.FloatField(null=True)),
+                ('E0_ci_upper', models.FloatField(null=True)),
+                ('E1', models.FloatField(null=True)),
+                ('E1_ci_lower', models.FloatField(null=True)),
+                ('E1_ci_upper', models.FloatField(null=True)),
+                ('E2', models.FloatField(null=True)),
+                ('E2_ci_lower', models.FloatField(null=True)),
+                ('E2_ci_upper', models.FloatField(null=True)),
+                ('E3', models.FloatField(null=True)),
+                ('E3_ci_lower', models.FloatField(null=True)),
+                ('E3_ci_upper', models.FloatField(null=True)),
+                ('E1_obs', models.FloatField(null=True)),
+                ('E1_obs_ci_lower', models.FloatField(null=True)),
+                ('E1_obs_ci_upper', models.FloatField(null=True)),
+                ('E2_obs', models.FloatField(null=True)),
+                ('E2_obs_ci_lower', models.FloatField(null=True)),
+                ('E2_obs_ci_upper', models.FloatField(null=True)),
+                ('E3_obs', models.FloatField(null=True)),
+                ('E3_obs_ci_lower', models.FloatField(null=True)),
+                ('E3_obs_ci_upper', models.FloatField(null=True)),
+                ('log_C1', models.FloatField(null=True)),
+                ('log_C1_ci_lower', models.FloatField(null=True)),
+                ('log_C1_ci_upper', models.FloatField(null=True)),
+                ('log_C2', models.FloatField(null=True)),
+                ('log_C2_ci_lower', models.FloatField(null=True)),
+                ('log_C2_ci_upper', models.FloatField(null=True)),
+                ('log_h1', models.FloatField(null=True)),
+                ('log_h1_ci_lower', models.FloatField(null=True)),
+                ('log_h1_ci_upper', models.FloatField(null=True)),
+                ('log_h2', models.FloatField(null=True)),
+                ('log_h2_ci_lower', models.FloatField(null=True)),
+                ('log_h2_ci_upper', models.FloatField(null=True)),
+                ('h1', models.FloatField(null=True)),
+                ('h2', models.FloatField(null=True)),
+                ('C1', models.FloatField(null=True)),
+                ('C2', models.FloatField(null=True)),
+                ('time_total', models.FloatField(null=True)),
+                ('drug1_units', models.TextField(null=True)),
+                ('drug2_units', models.TextField(null=True)),
+                ('metric_name', models.TextField(null=True)),
+                ('fit_beta', models.FloatField(null=True)),
+                ('boundary_sampling', models.FloatField(null=True)),
+                ('max_conc_d1', models.FloatField(null=True)),
+                ('max_conc_d2', models.FloatField(null=True)),
+                ('min_conc_d1', models.FloatField(null=True)),
+                ('min_conc_d2', models.FloatField(null=True)),
+                ('fit_method', models.TextField(null=True)),
+                ('dataset_task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fit_result', to='musycweb.DatasetTask')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0019_fit_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fitresult',
+            name='csv_line',
+            field=models.TextField(null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0020_fitresult_csv_line'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='export_file',
+            field=models.FileField(blank=True, editable=False, upload_to='_state/exports'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 3.0.3 on 2026-10-18 16:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def _group(status):
+    if status in ('QUEUED', 'PENDING'):
+        return 'queued'
+    if status == 'SUCCESS':
+        return 'success'
+    if status in ('FAILURE', 'REVOKED'):
+        return 'failure'
+    return 'started'
+
+
+def forwards_func(apps, schema_editor):
+    Dataset = apps.get_model('musycweb', 'Dataset')
+    DatasetTask = apps.get_model('musycweb', 'DatasetTask')
+    DatasetStatusCount = apps.get_model('musycweb', 'DatasetStatusCount')
+    TaskResult = apps.get_model('django_celery_results', 'TaskResult')
+    db_alias = schema_editor.connection.alias
+
+    for dataset_id in Dataset.objects.using(db_alias).values_list(
+            'id', flat=True).iterator():
+        tasks = DatasetTask.objects.using(db_alias).filter(
+            dataset_id=dataset_id)
+        statuses = dict(TaskResult.objects.using(db_alias).filter(
+            task_id__in=tasks.values('task_id')
+        ).values_list('task_id', 'status'))
+
+        by_status = {}
+        totals = {g: [0, 0.0] for g in
+                  ('queued', 'started', 'success', 'failure')}
+        for pk, task_id, estimated_time in tasks.values_list(
+                'pk', 'task_id', 'estimated_time'):
+            status = statuses.get(task_id, 'QUEUED')
+            by_status.setdefault(status, []).append(pk)
+            total = totals[_group(status)]
+            total[0] += 1
+            total[1] += settings.RUNTIME_ESTIMATE_DEFAULT \
+                if estimated_time is None else estimated_time
+
+        for status, pks in by_status.items():
+            if status != 'QUEUED':
+                for i in range(0, len(pks), 500):
+                    DatasetTask.objects.using(db_alias).filter(
+                        pk__in=pks[i:i + 500]).update(state=status)
+        DatasetStatusCount.objects.using(db_alias).bulk_create([
+            DatasetStatusCount(dataset_id=dataset_id, group=g, count=count,
+                               estimated_time=estimated_time)
+            for g, (count, estimated_time) in totals.items()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_celery_results', '0007_remove_taskresult_hidden'),
+        ('musycweb', '0021_dataset_export_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasettask',
+            name='state',
+            field=models.CharField(default='QUEUED', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='datasettask',
+            name='state_changed',
+            field=models.DateTimeField(default=None, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='datasettask',
+            index=models.Index(fields=['dataset', 'state_changed'], name='musycweb_da_dataset_895937_idx'),
+        ),
+        migrations.CreateModel(
+            name='DatasetStatusCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(choices=[('queued', 'Queued'), ('started', 'Started'), ('success', 'Success'), ('failure', 'Failure')], max_length=16)),
+                ('count', models.IntegerField(default=0)),
+                ('estimated_time', models.FloatField(default=0.0)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_counts', to='musycweb.Dataset')),
+            ],
+            options={
+                'unique_together': {('dataset', 'group')},
+            },
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
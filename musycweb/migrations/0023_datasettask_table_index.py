@@ -0,0 +1,17 @@
+# Generated by Django 3.0.3 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musycweb', '0022_task_status_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='datasettask',
+            index=models.Index(fields=['dataset', 'drug1', 'drug2', 'sample'], name='musycweb_da_dataset_c26ccb_idx'),
+        ),
+    ]
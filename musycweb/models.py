@@ -1,8 +1,11 @@
 from django.db import models
 from django.conf import settings
-from django_celery_results.models import TaskResult
+from django_celery_results.models import TaskResult, states
+from .arrays import unpack_arrays
+from . import rawdata
 import json
 import io
+import time
 
 
 class Profile(models.Model):
@@ -20,12 +23,28 @@ class Dataset(models.Model):
         (0, 'Emax>E0'),
         (1, 'Emax<E0')
     )
+    FIT_MODE_CHOICES = (
+        ('standard', 'Standard (full Monte Carlo confidence intervals)'),
+        ('fast', 'Fast (point estimates, approximate confidence intervals)')
+    )
+    PREPARATION_CHOICES = (
+        ('preparing', 'Preparing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed')
+    )
     owner = models.ForeignKey(settings.AUTH_USER_MODEL,
                               on_delete=models.CASCADE)
     name = models.TextField()
     creation_date = models.DateTimeField(auto_now_add=True)
     deleted_date = models.DateTimeField(null=True, default=None, editable=False)
     file = models.FileField(upload_to='_state/datasets', editable=False)
+    # Validated, normalised copy of file, in Parquet format
+    canonical_file = models.FileField(upload_to='_state/canonical',
+                                      blank=True, editable=False)
+    # Gzipped CSV export, saved when the dataset's fits have all finished
+    # (see musycweb.export)
+    export_file = models.FileField(upload_to='_state/exports', blank=True,
+                                   editable=False)
     orientation = models.PositiveSmallIntegerField(
         choices=ORIENTATION_CHOICES,
         default=1,
@@ -36,10 +55,37 @@ class Dataset(models.Model):
     emax_upper = models.FloatField(default=None, null=True, editable=False)
     e0_lower = models.FloatField(default=None, null=True, editable=False)
     e0_upper = models.FloatField(default=None, null=True, editable=False)
+    fit_mode = models.CharField(max_length=16,
+                                choices=FIT_MODE_CHOICES,
+                                default='standard',
+                                editable=False)
+    # Validation, splitting and task submission runs in the background
+    preparation_status = models.CharField(
+        max_length=16,
+        choices=PREPARATION_CHOICES,
+        default='ready',
+        editable=False
+    )
+    preparation_progress = models.FloatField(default=1.0, editable=False)
+    preparation_warnings = models.TextField(default='[]', editable=False)
+    preparation_error = models.TextField(null=True, default=None,
+                                         editable=False)
+    # Time taken to submit the dataset's fitting tasks (seconds)
+    submission_time = models.FloatField(null=True, default=None,
+                                        editable=False)
 
     def __str__(self):
         return f'[{self.id}] {self.name} <{self.owner.email}>'
 
+    @property
+    def preparation_dict(self):
+        return {
+            'status': self.preparation_status,
+            'progress': self.preparation_progress,
+            'warnings': json.loads(self.preparation_warnings),
+            'error': self.preparation_error
+        }
+
 
 class DatasetTask(models.Model):
     dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE)
@@ -51,6 +97,26 @@ class DatasetTask(models.Model):
                                 on_delete=models.CASCADE,
                                 db_constraint=False,
                                 to_field='task_id')
+    # Fingerprint of the fit inputs, used to detect changed combinations
+    # when a dataset is re-processed
+    fingerprint = models.CharField(max_length=64, null=True, default=None,
+                                   editable=False)
+    # Estimated fit time (seconds), from the runtime estimator
+    estimated_time = models.FloatField(null=True, default=None,
+                                       editable=False)
+    # Fit data row positions in the dataset's canonical copy (JSON, see
+    # CombinationPartitioner.row_refs). Results stored before this was
+    # added hold their data arrays instead
+    rows = models.TextField(null=True, default=None, editable=False)
+    # When the fitting task was published, for queue wait metrics
+    submitted_date = models.DateTimeField(null=True, default=None,
+                                          editable=False)
+    # The task's status, kept in step with its TaskResult (QUEUED if there
+    # is none and it hasn't started), and when it last changed (see
+    # musycweb.taskstatus)
+    state = models.CharField(max_length=50, default='QUEUED', editable=False)
+    state_changed = models.DateTimeField(null=True, default=None,
+                                         editable=False)
     FIELDS_CSV = (
         'sample', 'drug1_name', 'drug2_name', 'expt', 'batch', 'task_status',
         'converge_mc_nlls', 'beta', 'beta_ci', 'beta_obs', 'beta_obs_ci',
@@ -63,6 +129,8 @@ class DatasetTask(models.Model):
         'boundary_sampling', 'max_conc_d1', 'max_conc_d2', 'min_conc_d1',
         'min_conc_d2', 'fit_method', 'dataset_name'
     )
+    # Upper limit on the progress reported for a fit still running
+    MAX_RUNNING_PROGRESS = 0.99
     FIELD_RENAMES = {
         'log_alpha1': 'log_alpha12',
         'log_alpha2': 'log_alpha21',
@@ -70,6 +138,13 @@ class DatasetTask(models.Model):
         'log_alpha2_ci': 'log_alpha21_ci'
     }
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['dataset', 'state_changed']),
+            # Default task table order
+            models.Index(fields=['dataset', 'drug1', 'drug2', 'sample'])
+        ]
+
     def __str__(self):
         return f'{self.task_id} [DS:{self.dataset_id}] ' \
                f'<{self.dataset.owner.email}>'
@@ -90,10 +165,43 @@ class DatasetTask(models.Model):
         if d.get('exc_type', '') == 'DataError' and 'exc_message' in d:
             return d['exc_message'][0]
         elif d.get('exc_type', '') == 'SoftTimeLimitExceeded':
+            if self.fingerprint and FitCheckpoint.objects.filter(
+                    fingerprint=self.fingerprint).exists():
+                return 'Time limit exceeded (progress was saved, and will ' \
+                       'be resumed if the dataset is reprocessed)'
             return 'Time limit exceeded'
         else:
             return 'Unknown error'
 
+    @property
+    def progress(self):
+        """ Fraction of the fit complete, and estimated seconds remaining
+
+        Uses the task's state; its TaskResult is only read if running. A
+        running fit is assumed to progress in proportion to its estimated
+        time, or as far as it has reported if that is further. Either value
+        is None if unknown.
+        """
+        status = self.state
+        if status in states.READY_STATES:
+            return 1.0, 0.0
+        if status == 'QUEUED':
+            return 0.0, self.estimated_time
+
+        try:
+            meta = json.loads(self.task.result)
+            elapsed = max(time.time() - float(meta['started']), 0.0)
+            fraction = float(meta.get('progress', 0.0))
+        except (TypeError, ValueError, KeyError, TaskResult.DoesNotExist):
+            return None, None
+        if self.estimated_time:
+            fraction = max(fraction, elapsed / self.estimated_time)
+        # A fit is never reported complete until it has finished
+        fraction = min(fraction, self.MAX_RUNNING_PROGRESS)
+        if fraction <= 0:
+            return 0.0, self.estimated_time
+        return fraction, elapsed * (1 - fraction) / fraction
+
     @property
     def result_dict(self):
         if self.status != 'SUCCESS':
@@ -108,6 +216,17 @@ class DatasetTask(models.Model):
         d['dataset_name'] = self.dataset.name
         return d
 
+    @property
+    def result_data_dict(self):
+        """ result_dict, with the fitted data arrays as ndarrays """
+        d = self.result_dict
+        if self.status == 'SUCCESS':
+            if 'd1' in d or self.rows is None:
+                unpack_arrays(d)
+            else:
+                d.update(rawdata.task_arrays(self, d))
+        return d
+
     @property
     def result_csv_header(self):
         return ','.join(f'"{self.FIELD_RENAMES.get(f, f)}"'
@@ -115,10 +234,198 @@ class DatasetTask(models.Model):
 
     @property
     def result_csv_line(self):
-        d = self.result_dict
+        return self.csv_line(self.result_dict)
+
+    @classmethod
+    def csv_line(cls, d, fields=None):
+        """ A result dict's values as a CSV line (FIELDS_CSV by default) """
         return ','.join('"'+str(d.get(k, '')).replace('"', '\"')+'"'
-                        for k in self.FIELDS_CSV)
+                        for k in (fields or cls.FIELDS_CSV))
 
     @property
     def result_csv(self):
         return f'{self.result_csv_header}\n{self.result_csv_line}'
+
+
+class FitResult(models.Model):
+    """ A successful fit's result, with a column per parameter
+
+    Filled from the task's result dict when it succeeds (see
+    musycweb.fitresults), so results can be filtered and sorted in SQL.
+    Field names follow the result dict; credible intervals are split into
+    lower and upper bounds.
+    """
+    dataset_task = models.OneToOneField(DatasetTask,
+                                        on_delete=models.CASCADE,
+                                        related_name='fit_result')
+    # The result's CSV line, up to but excluding dataset_name (the last
+    # field), which can change
+    csv_line = models.TextField(null=True)
+    sample = models.TextField(null=True)
+    drug1_name = models.TextField(null=True)
+    drug2_name = models.TextField(null=True)
+    expt = models.TextField(null=True)
+    batch = models.TextField(null=True)
+    converge_mc_nlls = models.FloatField(null=True)
+    beta = models.FloatField(null=True, db_index=True)
+    beta_ci_lower = models.FloatField(null=True)
+    beta_ci_upper = models.FloatField(null=True)
+    beta_obs = models.FloatField(null=True)
+    beta_obs_ci_lower = models.FloatField(null=True)
+    beta_obs_ci_upper = models.FloatField(null=True)
+    log_alpha1 = models.FloatField(null=True, db_index=True)
+    log_alpha1_ci_lower = models.FloatField(null=True)
+    log_alpha1_ci_upper = models.FloatField(null=True)
+    log_alpha2 = models.FloatField(null=True, db_index=True)
+    log_alpha2_ci_lower = models.FloatField(null=True)
+    log_alpha2_ci_upper = models.FloatField(null=True)
+    R2 = models.FloatField(null=True, db_index=True)
+    log_like_mc_nlls = models.FloatField(null=True)
+    E0 = models.FloatField(null=True)
+    E0_ci_lower = models.FloatField(null=True)
+    E0_ci_upper = models.FloatField(null=True)
+    E1 = models.FloatField(null=True)
+    E1_ci_lower = models.FloatField(null=True)
+    E1_ci_upper = models.FloatField(null=True)
+    E2 = models.FloatField(null=True)
+    E2_ci_lower = models.FloatField(null=True)
+    E2_ci_upper = models.FloatField(null=True)
+    E3 = models.FloatField(null=True)
+    E3_ci_lower = models.FloatField(null=True)
+    E3_ci_upper = models.FloatField(null=True)
+    E1_obs = models.FloatField(null=True)
+    E1_obs_ci_lower = models.FloatField(null=True)
+    E1_obs_ci_upper = models.FloatField(null=True)
+    E2_obs = models.FloatField(null=True)
+    E2_obs_ci_lower = models.FloatField(null=True)
+    E2_obs_ci_upper = models.FloatField(null=True)
+    E3_obs = models.FloatField(null=True)
+    E3_obs_ci_lower = models.FloatField(null=True)
+    E3_obs_ci_upper = models.FloatField(null=True)
+    log_C1 = models.FloatField(null=True)
+    log_C1_ci_lower = models.FloatField(null=True)
+    log_C1_ci_upper = models.FloatField(null=True)
+    log_C2 = models.FloatField(null=True)
+    log_C2_ci_lower = models.FloatField(null=True)
+    log_C2_ci_upper = models.FloatField(null=True)
+    log_h1 = models.FloatField(null=True)
+    log_h1_ci_lower = models.FloatField(null=True)
+    log_h1_ci_upper = models.FloatField(null=True)
+    log_h2 = models.FloatField(null=True)
+    log_h2_ci_lower = models.FloatField(null=True)
+    log_h2_ci_upper = models.FloatField(null=True)
+    h1 = models.FloatField(null=True)
+    h2 = models.FloatField(null=True)
+    C1 = models.FloatField(null=True)
+    C2 = models.FloatField(null=True)
+    time_total = models.FloatField(null=True)
+    drug1_units = models.TextField(null=True)
+    drug2_units = models.TextField(null=True)
+    metric_name = models.TextField(null=True)
+    fit_beta = models.FloatField(null=True)
+    boundary_sampling = models.FloatField(null=True)
+    max_conc_d1 = models.FloatField(null=True)
+    max_conc_d2 = models.FloatField(null=True)
+    min_conc_d1 = models.FloatField(null=True)
+    min_conc_d2 = models.FloatField(null=True)
+    fit_method = models.TextField(null=True)
+
+    def __str__(self):
+        return f'{self.drug1_name} + {self.drug2_name} [{self.sample}]'
+
+
+class FitCacheEntry(models.Model):
+    """ A cached fit result, keyed by a fingerprint of the fit's inputs """
+    fingerprint = models.CharField(max_length=64, primary_key=True)
+    result = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(auto_now_add=True, db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'fit cache entries'
+
+    def __str__(self):
+        return self.fingerprint
+
+
+class FitCacheStats(models.Model):
+    """ Fit cache hit/miss counters (single row) """
+    hits = models.BigIntegerField(default=0)
+    misses = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'fit cache stats'
+
+    def __str__(self):
+        return f'{self.hits} hits, {self.misses} misses'
+
+
+class FitCheckpoint(models.Model):
+    """ A completed run within a multi-run fit, kept so the fit can resume """
+    fingerprint = models.CharField(max_length=64, db_index=True)
+    stage = models.PositiveSmallIntegerField()
+    chain = models.PositiveSmallIntegerField()
+    result = models.TextField()
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('fingerprint', 'stage', 'chain')
+
+    def __str__(self):
+        return f'{self.fingerprint} [{self.stage}:{self.chain}]'
+
+
+class TaskMetrics(models.Model):
+    """ Resources used by one run of a fitting task """
+    task_id = models.CharField(max_length=255, db_index=True)
+    dataset = models.ForeignKey(Dataset, null=True, on_delete=models.SET_NULL)
+    # Number of combinations in the dataset
+    dataset_size = models.PositiveIntegerField(null=True)
+    num_points = models.PositiveIntegerField(null=True)
+    fit_alg = models.CharField(max_length=50, null=True)
+    sampling = models.CharField(max_length=20, null=True)
+    fit_mode = models.CharField(max_length=20, null=True)
+    status = models.CharField(max_length=50, null=True)
+    hostname = models.CharField(max_length=255, null=True)
+    host_cpus = models.PositiveIntegerField(null=True)
+    host_memory_mb = models.FloatField(null=True)
+    # Processes used by the fit, including any local process pool
+    processes = models.PositiveIntegerField(default=1)
+    started = models.DateTimeField(db_index=True)
+    # Times in seconds
+    queue_wait = models.FloatField(null=True)
+    wall_time = models.FloatField()
+    cpu_time = models.FloatField()
+    peak_rss_mb = models.FloatField(null=True)
+
+    class Meta:
+        verbose_name_plural = 'task metrics'
+
+    def __str__(self):
+        return f'{self.task_id} ({self.started})'
+
+
+class DatasetStatusCount(models.Model):
+    """ Number of a dataset's tasks in a status group
+
+    Kept up to date as tasks change status (see musycweb.taskstatus), with
+    the tasks' total estimated fit time.
+    """
+    GROUP_CHOICES = (
+        ('queued', 'Queued'),
+        ('started', 'Started'),
+        ('success', 'Success'),
+        ('failure', 'Failure')
+    )
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE,
+                                related_name='status_counts')
+    group = models.CharField(max_length=16, choices=GROUP_CHOICES)
+    count = models.IntegerField(default=0)
+    estimated_time = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ('dataset', 'group')
+
+    def __str__(self):
+        return f'[DS:{self.dataset_id}] {self.group}: {self.count}'
@@ -0,0 +1,124 @@
+""" Local process pools for running parts of a single fit in parallel
+
+Each fit in progress on a host records the number of processes it uses in
+a file under FIT_PARALLEL_SLOTS_DIR. A fit asking for more than one process
+is granted the host's cores not already in use by other fits, so a lone
+large fit can use an otherwise idle host, while a busy worker runs each fit
+serially as before.
+"""
+import fcntl
+import os
+from contextlib import contextmanager
+from billiard.pool import Pool
+from django.conf import settings
+
+
+def _cpu_count():
+    return settings.FIT_PARALLEL_CPUS or os.cpu_count() or 1
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _processes_in_use(slots_dir):
+    """ Processes used by other fits on this host, removing stale slots """
+    in_use = 0
+    for name in os.listdir(slots_dir):
+        if not name.isdigit() or int(name) == os.getpid():
+            continue
+        path = os.path.join(slots_dir, name)
+        if not _pid_alive(int(name)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        try:
+            with open(path) as f:
+                in_use += int(f.read() or 1)
+        except (FileNotFoundError, ValueError):
+            continue
+    return in_use
+
+
+@contextmanager
+def reserve(wanted=1):
+    """ Reserve up to wanted processes on this host for the current fit
+
+    Yields the number of processes granted, which is always at least one.
+    More than one is only granted when FIT_PARALLEL is enabled.
+    """
+    slots_dir = settings.FIT_PARALLEL_SLOTS_DIR
+    os.makedirs(slots_dir, exist_ok=True)
+    path = os.path.join(slots_dir, str(os.getpid()))
+
+    with open(os.path.join(slots_dir, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        granted = 1
+        if settings.FIT_PARALLEL and wanted > 1:
+            spare = _cpu_count() - _processes_in_use(slots_dir)
+            granted = max(1, min(wanted, spare,
+                                 settings.FIT_PARALLEL_MAX_PROCESSES))
+        with open(path, 'w') as f:
+            f.write(str(granted))
+
+    try:
+        yield granted
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class _Deferred(object):
+    """ A call run in this process when its result is first requested """
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+
+    def get(self):
+        if self.fn is not None:
+            self.result = self.fn(*self.args)
+            self.fn = self.args = None
+        return self.result
+
+
+class LocalPool(object):
+    """ Run calls in a local process pool, or in this process
+
+    Calls are started in submission order. Results are retrieved with
+    get(), which re-raises any exception from the call. Calls still queued
+    or running when the pool is closed are abandoned. With one process,
+    calls run lazily in this process when their result is requested, so
+    results never requested cost nothing.
+
+    Celery's prefork workers are daemon processes, which multiprocessing
+    does not allow to have children, so billiard's pool is used.
+    """
+    def __init__(self, processes):
+        self.processes = processes
+        self._pool = None
+
+    def __enter__(self):
+        if self.processes > 1:
+            self._pool = Pool(self.processes)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def submit(self, fn, *args):
+        if self._pool is None:
+            return _Deferred(fn, args)
+        return self._pool.apply_async(fn, args)
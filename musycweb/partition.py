@@ -0,0 +1,203 @@
+import numpy as np
+from .arrays import pack_array, unpack_array
+
+# Columns of a normalised dataset holding fit data
+FIT_DATA_COLUMNS = ('drug1.conc', 'drug2.conc', 'effect', 'effect.sd')
+# Packed row position differences, see CombinationPartitioner.row_refs
+ROW_DTYPE = '<i4'
+
+
+def _as_tuple(key):
+    # groupby on a single-element list gives scalar keys in some pandas
+    # versions and tuples in others
+    return key if isinstance(key, tuple) else (key, )
+
+
+def fit_arrays(data, row_refs):
+    """ A combination's d1, d2, dip and dip_sd arrays, from its row_refs()
+
+    data is the normalised dataset the refs were taken from, or at least
+    its FIT_DATA_COLUMNS.
+    """
+    parts = [(np.cumsum(unpack_array(deltas)), bool(swapped))
+             for deltas, swapped in row_refs]
+    d1 = data['drug1.conc'].to_numpy()
+    d2 = data['drug2.conc'].to_numpy()
+    dip = data['effect'].to_numpy()
+    dip_sd = data['effect.sd'].to_numpy()
+    values = CombinationPartitioner._values
+    return dict(
+        d1=values(parts, d1, d2),
+        d2=values(parts, d2, d1),
+        dip=values(parts, dip, dip),
+        dip_sd=values(parts, dip_sd, dip_sd)
+    )
+
+
+def _group_rows(data, rows, keys):
+    """ Map each key tuple to the positions of the matching rows
+
+    Rows with a missing value in any key column are dropped, as they would
+    be by a pandas groupby. Positions are returned in their original order.
+    """
+    if not len(rows):
+        return {}
+    indices = data[keys].iloc[rows].groupby(
+        keys, sort=False, observed=True).indices
+    return {_as_tuple(k): rows[v] for k, v in indices.items()}
+
+
+class CombinationPartitioner(object):
+    """ Split a dataset into (drug1, drug2, sample, batch) combinations
+
+    Control, single agent and combination rows are grouped once, keyed by
+    (batch, sample, drug), and each combination's arrays are assembled by
+    index lookup into the full dataset rather than by re-filtering it.
+
+    The dataset must already be normalised by process_dataset, i.e. drug
+    order canonicalised and the effect.sd column added.
+    """
+    def __init__(self, data, use_batches):
+        self.use_batches = use_batches
+        outer = ['batch', 'sample'] if use_batches else ['sample']
+
+        self._d1 = data['drug1.conc'].to_numpy()
+        self._d2 = data['drug2.conc'].to_numpy()
+        self._dip = data['effect'].to_numpy()
+        self._dip_sd = data['effect.sd'].to_numpy()
+        self._units1 = data['drug1.units'].to_numpy()
+        self._units2 = data['drug2.units'].to_numpy()
+        self._expt_date = data['expt.date'].to_numpy()
+
+        no_d1 = self._d1 == 0
+        no_d2 = self._d2 == 0
+
+        # Control (no drug)
+        self._ctrl = _group_rows(
+            data, np.flatnonzero(no_d1 & no_d2), outer)
+        # Single agent (exactly one drug added), keyed by the added drug
+        self._sa_1 = _group_rows(
+            data, np.flatnonzero(no_d1 & ~no_d2), outer + ['drug2'])
+        self._sa_2 = _group_rows(
+            data, np.flatnonzero(~no_d1 & no_d2), outer + ['drug1'])
+        # Dual agent (two drugs added in non-zero concentration)
+        self._expt = _group_rows(
+            data, np.flatnonzero(~no_d1 & ~no_d2),
+            outer + ['drug1', 'drug2'])
+
+        # Order combinations as a nested groupby (sort=False) would, by
+        # first appearance of the (batch, sample), then of the drug pair
+        outer_first = {}
+        for key, rows in self._expt.items():
+            outer_key = key[:-2]
+            outer_first[outer_key] = min(outer_first.get(outer_key, rows[0]),
+                                         rows[0])
+        self._order = sorted(
+            self._expt.keys(),
+            key=lambda k: (outer_first[k[:-2]], self._expt[k][0])
+        )
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        """ Iterate over (batch, sample, drug1, drug2) combinations """
+        for key in self._order:
+            if self.use_batches:
+                batch, sample, drug1, drug2 = key
+            else:
+                batch = None
+                sample, drug1, drug2 = key
+            yield batch, sample, drug1, drug2
+
+    def _key(self, batch, sample):
+        return (batch, sample) if self.use_batches else (sample, )
+
+    def combination_rows(self, batch, sample, drug1, drug2):
+        """ Row positions making up a combination's fit data
+
+        Returns a list of (positions, swapped) tuples. Swapped rows are
+        single agent rows where the drug is in the other drug column, so
+        drug1 and drug2 values need to be exchanged.
+        """
+        outer = self._key(batch, sample)
+        empty = np.empty(0, dtype=np.intp)
+        return [
+            (self._expt[outer + (drug1, drug2)], False),
+            (self._ctrl.get(outer, empty), False),
+            (self._sa_1.get(outer + (drug2, ), empty), False),
+            (self._sa_2.get(outer + (drug1, ), empty), False),
+            (self._sa_1.get(outer + (drug1, ), empty), True),
+            (self._sa_2.get(outer + (drug2, ), empty), True)
+        ]
+
+    def row_refs(self, batch, sample, drug1, drug2):
+        """ A combination's fit data rows, in a compact, JSON-safe form
+
+        Returns combination_rows() as [positions, swapped] pairs, with the
+        positions delta encoded and packed, so runs of consecutive rows
+        compress well. See fit_arrays() to re-assemble the fit data.
+        """
+        return [
+            [pack_array(np.diff(rows, prepend=0), dtype=ROW_DTYPE),
+             int(swapped)]
+            for rows, swapped in self.combination_rows(batch, sample,
+                                                       drug1, drug2)
+            if len(rows)
+        ]
+
+    @staticmethod
+    def _values(parts, col1, col2):
+        return np.concatenate([
+            (col2 if swapped else col1)[rows] for rows, swapped in parts
+        ])
+
+    def concentrations(self, batch, sample, drug1, drug2):
+        """ A combination's (d1, d2) concentration arrays """
+        parts = self.combination_rows(batch, sample, drug1, drug2)
+        return (self._values(parts, self._d1, self._d2),
+                self._values(parts, self._d2, self._d1))
+
+    def single_agents(self):
+        """ Iterate over (batch, sample, drug) tested as a single agent """
+        for key in dict.fromkeys(list(self._sa_1) + list(self._sa_2)):
+            if self.use_batches:
+                batch, sample, drug = key
+            else:
+                batch = None
+                sample, drug = key
+            yield batch, sample, drug
+
+    def single_agent_data(self, batch, sample, drug):
+        """ A drug's single agent (d, dip, dip_sd) arrays, with controls """
+        outer = self._key(batch, sample)
+        empty = np.empty(0, dtype=np.intp)
+        parts = [
+            (self._ctrl.get(outer, empty), False),
+            (self._sa_1.get(outer + (drug, ), empty), True),
+            (self._sa_2.get(outer + (drug, ), empty), False)
+        ]
+        return (self._values(parts, self._d1, self._d2),
+                self._values(parts, self._dip, self._dip),
+                self._values(parts, self._dip_sd, self._dip_sd))
+
+    def fit_data(self, batch, sample, drug1, drug2):
+        """ Assemble fit_drug_combination's data arguments for a combination
+
+        Returns a dict with d1, d2, dip and dip_sd ndarrays, and lists of
+        the unique drug1_units, drug2_units and expt_date values.
+        """
+        parts = self.combination_rows(batch, sample, drug1, drug2)
+
+        def values(col1, col2):
+            return self._values(parts, col1, col2)
+
+        return dict(
+            d1=values(self._d1, self._d2),
+            d2=values(self._d2, self._d1),
+            dip=values(self._dip, self._dip),
+            dip_sd=values(self._dip_sd, self._dip_sd),
+            drug1_units=list(set(values(self._units1, self._units2))),
+            drug2_units=list(set(values(self._units2, self._units1))),
+            expt_date=list(set(values(self._expt_date, self._expt_date)))
+        )
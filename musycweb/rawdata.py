@@ -0,0 +1,54 @@
+""" Fit data re-assembled from a dataset's canonical copy
+
+Task results don't store the data arrays each fit used, which are mostly
+shared single agent and control rows. Instead, DatasetTask.rows holds
+the fit's row positions in the dataset's canonical (Parquet) copy, and
+the arrays are re-assembled on demand, e.g. for plots. Recently used
+datasets' fit data columns are cached per process.
+"""
+import json
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from .ingest import read_canonical_columns
+from .partition import FIT_DATA_COLUMNS, fit_arrays
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _fit_data_columns(dataset):
+    if not dataset.canonical_file:
+        # Written as a side effect of loading the uploaded file
+        from .tasks import load_dataset
+        load_dataset(dataset, warn=False)
+
+    storage = dataset.canonical_file.storage
+    key = (dataset.canonical_file.name,
+           storage.get_modified_time(dataset.canonical_file.name))
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    with dataset.canonical_file.open('rb') as f:
+        data = read_canonical_columns(f, FIT_DATA_COLUMNS)
+
+    with _cache_lock:
+        _cache[key] = data
+        while len(_cache) > settings.FIT_DATA_CACHE_DATASETS:
+            _cache.popitem(last=False)
+    return data
+
+
+def task_arrays(dataset_task, result):
+    """ The d1, d2, dip and dip_sd arrays fitted by a DatasetTask
+
+    result is the task's result dict, used to undo any swap of drug 1 and
+    drug 2 made by fit_drug_combination.
+    """
+    arrays = fit_arrays(_fit_data_columns(dataset_task.dataset),
+                        json.loads(dataset_task.rows))
+    if result.get('drug1_name') == dataset_task.drug2:
+        arrays['d1'], arrays['d2'] = arrays['d2'], arrays['d1']
+    return arrays
@@ -0,0 +1,113 @@
+""" Single agent dose-response fits, shared across drug combinations
+
+Each (batch, sample, drug) single agent curve is fitted once, with a Hill
+equation, rather than being re-estimated within every combination fit
+that involves the drug. The fits narrow each combination's E0, E1 and E2
+bounds, which shrinks the space MuSyC_2D has to search.
+"""
+import logging
+import time
+import warnings
+import numpy as np
+from scipy.optimize import OptimizeWarning, curve_fit
+
+logger = logging.getLogger(__name__)
+
+# Minimum bound half-width, as a fraction of a curve's effect range, so
+# that a very confident single agent fit doesn't pin a combination's E
+HALF_WIDTH_FLOOR = 0.1
+
+
+def hill(d, E0, Emax, log_C, h):
+    """ Hill equation, with C (EC50) on a log10 scale """
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        return Emax + (E0 - Emax) / (1 + np.power(d / 10 ** log_C, h))
+
+
+def fit_hill(d, dip, dip_sd):
+    """ Fit a single agent dose response, weighted by effect SD
+
+    Returns a dict of E0, Emax, log_C and h estimates, with their standard
+    errors (e.g. E0_sd), or None if the curve can't be fitted.
+    """
+    dosed = d > 0
+    if len(d) < 4 or len(np.unique(d[dosed])) < 2:
+        return None
+
+    log_d = np.log10(d[dosed])
+    E0 = dip[~dosed].mean() if (~dosed).any() else dip[d.argmin()]
+    p0 = [E0, dip[d.argmax()], np.median(log_d), 1.0]
+    bounds = ([-np.inf, -np.inf, log_d.min() - 3, 0.01],
+              [np.inf, np.inf, log_d.max() + 3, 10.0])
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', OptimizeWarning)
+            popt, pcov = curve_fit(hill, d, dip, p0=p0, sigma=dip_sd,
+                                   absolute_sigma=True, bounds=bounds,
+                                   max_nfev=2000)
+    except (RuntimeError, ValueError, OptimizeWarning):
+        return None
+
+    sds = np.sqrt(np.diag(pcov))
+    if not np.isfinite(popt).all() or not np.isfinite(sds).all():
+        return None
+
+    fit = {}
+    for name, value, sd in zip(('E0', 'Emax', 'log_C', 'h'), popt, sds):
+        fit[name] = float(value)
+        fit[f'{name}_sd'] = float(sd)
+    return fit
+
+
+def fit_single_agents(partitions):
+    """ Fit every single agent curve in a CombinationPartitioner
+
+    Returns a dict of (batch, sample, drug) to fit dict, or None where the
+    curve couldn't be fitted.
+    """
+    start = time.perf_counter()
+    fits = {
+        key: fit_hill(*partitions.single_agent_data(*key))
+        for key in partitions.single_agents()
+    }
+    logger.info('Fitted %d single agent curves (%d failed) in %.2fs',
+                len(fits), sum(f is None for f in fits.values()),
+                time.perf_counter() - start)
+    return fits
+
+
+def _interval(fit, param, width):
+    half = max(width * fit[f'{param}_sd'],
+               HALF_WIDTH_FLOOR * abs(fit['E0'] - fit['Emax']))
+    return fit[param] - half, fit[param] + half
+
+
+def prior_bounds(fit1, fit2, e_bnd=None, width=3.0):
+    """ E_bnd for a combination, from its drugs' single agent fits
+
+    E0 is bounded by the union of both fits' intervals, and E1 and E2 by
+    drug 1 and drug 2's Emax, each within width standard errors. E3 keeps
+    any dataset bounds. Returns e_bnd unchanged if either fit is missing,
+    or if the bounds would conflict with e_bnd.
+    """
+    if fit1 is None or fit2 is None:
+        return e_bnd
+
+    if e_bnd is None:
+        lower, upper = [-np.inf] * 4, [np.inf] * 4
+    else:
+        lower, upper = list(e_bnd[0]), list(e_bnd[1])
+
+    e0_1 = _interval(fit1, 'E0', width)
+    e0_2 = _interval(fit2, 'E0', width)
+    intervals = (
+        (0, (min(e0_1[0], e0_2[0]), max(e0_1[1], e0_2[1]))),
+        (1, _interval(fit1, 'Emax', width)),
+        (2, _interval(fit2, 'Emax', width))
+    )
+    for i, (lo, hi) in intervals:
+        lo, hi = max(lo, lower[i]), min(hi, upper[i])
+        if not lo < hi:
+            return e_bnd
+        lower[i], upper[i] = lo, hi
+    return [lower, upper]
@@ -1,22 +1,168 @@
 from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.signals import task_postrun, task_success
+from kombu.utils.json import dumps as json_dumps, loads as json_loads
+from celery.utils import uuid
 from musycdjango.celery import app
 import time
-from .models import Dataset, DatasetTask
-import pandas as pd
+import json
+from .models import Dataset, DatasetTask, FitResult
 import numpy as np
-import re
-import string
 from musyc_code.SynergyCalculator.SynergyCalculator import MuSyC_2D
-import itertools
 from django_celery_results.models import TaskResult, states
-from .forms import CreateDatasetForm
+from .ingest import read_dataset, read_canonical, write_canonical, \
+    DataError, DataWarning
+from .partition import CombinationPartitioner
+from .arrays import ARRAY_FIELDS, pack_array, unpack_array
+from . import checkpoint, convergence, estimator, export, fitcache, \
+    fitresults, metrics, parallel, singleagent, taskstatus
 from django.contrib.messages import warning
 import warnings
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.core.files.base import ContentFile
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_FIT_ALG = 'nlls_mcnlls'
+# Sampler and optimiser settings for MuSyC_2D
+FIT_SETTINGS = dict(
+    SAMPLES=50000,
+    BURN=5000,
+    PSO_PARTICLES=100,
+    PSO_ITER=50,
+    PSO_SPEED=10
+)
+# Fast fits, for quick point estimates: a short Monte Carlo stage, giving
+# approximate confidence intervals, and a smaller optimiser swarm
+FAST_FIT_SETTINGS = dict(
+    SAMPLES=2000,
+    BURN=200,
+    PSO_PARTICLES=25,
+    PSO_ITER=20,
+    PSO_SPEED=10
+)
+
+
+def _fit_method(fit_alg, fit_mode='standard'):
+    """ fit_method recorded in results, for a fit_alg and fit mode """
+    return fit_alg if fit_mode == 'standard' else f'{fit_alg}_{fit_mode}'
+
+
+def _fit_fingerprint(d1, d2, dip, dip_sd, drug1_name, drug2_name, sample,
+                     E_fix, E_bnd, metric_name, hill_orient, init_seed=None,
+                     fit_alg='nlls_mcnlls', find_opt=False, fit_gamma=False,
+                     sampling='fixed', fit_mode='standard', **kwargs):
+    """ Fingerprint of fit_drug_combination's arguments, for the fit cache
+
+    Accepts fit_drug_combination's keyword arguments, with the same
+    defaults. Arguments which only label the fit are ignored.
+    """
+    fit_inputs = dict(
+        d1=d1, d2=d2, dip=dip, dip_sd=dip_sd,
+        drug1_name=drug1_name, drug2_name=drug2_name, sample=sample,
+        E_fix=E_fix, E_bnd=E_bnd, metric_name=metric_name,
+        hill_orient=hill_orient, init_seed=init_seed, fit_alg=fit_alg,
+        find_opt=find_opt, fit_gamma=fit_gamma, **FIT_SETTINGS
+    )
+    if fit_mode == 'fast':
+        fit_inputs.update(FAST_FIT_SETTINGS, fit_mode=fit_mode)
+    elif sampling != 'fixed':
+        fit_inputs.update(
+            sampling=sampling,
+            adaptive_stages=settings.FIT_ADAPTIVE_STAGES,
+            adaptive_chains=settings.FIT_ADAPTIVE_CHAINS,
+            adaptive_rhat=settings.FIT_ADAPTIVE_RHAT
+        )
+    return fitcache.fit_fingerprint(fit_inputs)
+
+
+def _musyc_2d(args, kwargs):
+    """ Run MuSyC_2D, translating known input errors to DataError """
+    try:
+        return MuSyC_2D(*args, **kwargs)
+    except ValueError as e:
+        err = str(e)
+        if 'lower bound must be strictly less than each upper bound' in err:
+            raise DataError(
+                'Lower bound must be strictly less than upper bound')
+
+        # Re-raise any unknown error
+        raise
 
 
-class DataError(Exception):
-    pass
+def _fit_adaptive(musyc_args, fit_kwargs, init_seed=None, fingerprint=None,
+                  progress=None):
+    """ Fit with the smallest MCMC budget at which independent runs agree
+
+    fit_kwargs(samples, burn, seed) gives MuSyC_2D's keyword arguments.
+    Each stage runs FIT_ADAPTIVE_CHAINS independent fits with the stage's
+    sample count, stopping once the largest R-hat across parameters is
+    within FIT_ADAPTIVE_RHAT, or after the last stage. Returns the first
+    fit of the final stage, with the samples used and diagnostics added.
+
+    With spare cores on the host (see musycweb.parallel), a stage's chains
+    run concurrently, and later stages start speculatively on any cores
+    left over. The result is the same as running the stages in turn.
+
+    Each run is checkpointed under the fit's fingerprint as it is
+    collected, and runs already checkpointed are not repeated.
+
+    progress, if supplied, is called after each stage with the samples
+    drawn so far and the most that could be drawn.
+    """
+    chains = settings.FIT_ADAPTIVE_CHAINS
+    stages = settings.FIT_ADAPTIVE_STAGES
+    total_samples = 0
+    max_samples = chains * sum(stages)
+    total_time = 0.0
+    saved = checkpoint.load(fingerprint) if fingerprint else {}
+    with parallel.reserve(chains * len(stages) - len(saved)) as processes, \
+            parallel.LocalPool(processes) as pool:
+        pending = []
+        for stage, samples in enumerate(stages):
+            # Keep the same burn-in fraction as fixed sampling
+            burn = samples * FIT_SETTINGS['BURN'] // FIT_SETTINGS['SAMPLES']
+            pending.append([
+                saved[stage, i] if (stage, i) in saved else
+                pool.submit(_musyc_2d, musyc_args, fit_kwargs(
+                    samples, burn,
+                    None if init_seed is None else
+                    init_seed + stage * chains + i))
+                for i in range(chains)
+            ])
+
+        for stage, samples in enumerate(stages):
+            runs = []
+            for i, result in enumerate(pending[stage]):
+                if not isinstance(result, dict):
+                    result = result.get()
+                    if fingerprint:
+                        checkpoint.save(fingerprint, stage, i, result)
+                runs.append(result)
+            total_samples += samples * chains
+            total_time += sum(float(r.get('time_total', 0)) for r in runs)
+            rhats = convergence.diagnostics(runs, samples)
+            rhat_max = max(rhats.values(), default=np.inf)
+            if rhat_max <= settings.FIT_ADAPTIVE_RHAT:
+                break
+            if progress:
+                progress(total_samples, max_samples)
+
+    T = runs[0]
+    T['mcmc_samples'] = samples
+    T['mcmc_samples_total'] = total_samples
+    T['mcmc_stages'] = stage + 1
+    T['mcmc_converged'] = bool(rhat_max <= settings.FIT_ADAPTIVE_RHAT)
+    T['rhat'] = rhats
+    T['rhat_max'] = rhat_max if np.isfinite(rhat_max) else None
+    # Compute time across all chains, not wall clock time
+    T['time_total'] = total_time
+    T['fit_processes'] = processes
+    return T
 
 
 @shared_task(bind=True)
@@ -27,7 +173,7 @@ def test_add(self, x, y, sleep=0):
     return x + y
 
 
-@shared_task(bind=True)
+@shared_task(bind=True, acks_late=settings.FIT_ACKS_LATE)
 def fit_drug_combination(
         self, dataset_id, drug1_name, drug2_name, sample,
         d1, d2, dip, dip_sd,
@@ -40,13 +186,25 @@ def fit_drug_combination(
         fit_alg='nlls_mcnlls',
         find_opt=False,
         fit_gamma=False,
-        batch=None
+        batch=None,
+        sampling='fixed',
+        fit_mode='standard'
 ):
-    # Mark task as started
-    if not self.request.called_directly:
-        self.update_state(state='STARTED')
-        # self.update_state(state='PROGRESS',
-        #                   meta={'current': i, 'total': len(filenames)})
+    # Mark task as started. Progress is reported in the task's metadata
+    # (see DatasetTask.progress), at most every FIT_PROGRESS_INTERVAL
+    started = time.time()
+    last_update = time.monotonic()
+
+    def progress(force=False, **meta):
+        nonlocal last_update
+        if self.request.called_directly or (
+                not force and time.monotonic() - last_update <
+                settings.FIT_PROGRESS_INTERVAL):
+            return
+        last_update = time.monotonic()
+        self.update_state(state='STARTED', meta=dict(meta, started=started))
+
+    progress(force=True)
 
     if len(drug1_units) > 1:
         raise DataError(f'drug1.units contains multiple values: {", ".join(drug1_units)}')
@@ -57,13 +215,23 @@ def fit_drug_combination(
     drug1_units = drug1_units[0]
     drug2_units = drug2_units[0]
 
-    # Convert d1, d2, dip, dip_sd, expt_date back to ndarrays
-    d1 = np.array(d1)
-    d2 = np.array(d2)
-    dip = np.array(dip)
-    dip_sd = np.array(dip_sd)
+    # Decode d1, d2, dip, dip_sd to ndarrays
+    d1 = unpack_array(d1)
+    d2 = unpack_array(d2)
+    dip = unpack_array(dip)
+    dip_sd = unpack_array(dip_sd)
     expt_date = np.array(expt_date)
 
+    # Fingerprint the inputs as submitted, before any adjustments below
+    fingerprint = _fit_fingerprint(
+        d1=d1, d2=d2, dip=dip, dip_sd=dip_sd,
+        drug1_name=drug1_name, drug2_name=drug2_name, sample=sample,
+        E_fix=E_fix, E_bnd=E_bnd, metric_name=metric_name,
+        hill_orient=hill_orient, init_seed=init_seed, fit_alg=fit_alg,
+        find_opt=find_opt, fit_gamma=fit_gamma, sampling=sampling,
+        fit_mode=fit_mode
+    )
+
     # Check for -ve drug concentrations
     if (d1 < 0).any():
         raise DataError('Negative concentrations for drug1 - not supported')
@@ -91,6 +259,16 @@ def fit_drug_combination(
         raise DataError('At least four data points are needed to fit '
                         f'dose-response surface (found: {len(dip)})')
 
+    # Reuse a previous result for the same fit inputs, if available (e.g.
+    # stored since the task was submitted). The lookup on submission has
+    # already counted it as a miss.
+    expt_and_batch = f'{expt} [{batch}]' if batch else expt
+    T = fitcache.get(fingerprint, count=False)
+    if T is not None:
+        T.update(expt=expt_and_batch, batch=batch, drug1_units=drug1_units,
+                 drug2_units=drug2_units, expt_date=expt_date.tolist())
+        return T
+
     # Consider the special case when one of the drugs has no effect.
     # Flip drug names around so that the no effect drug is drug 1
     if E_fix is not None:
@@ -112,51 +290,114 @@ def fit_drug_combination(
         drug1_name, drug2_name = drug2_name, drug1_name
         d1, d2 = d2, d1
 
-    expt_and_batch = f'{expt} [{batch}]' if batch else expt
-
-    try:
-        T = MuSyC_2D(d1,d2,dip,dip_sd,drug1_name,drug2_name,E_fix=E_fix,E_bnd=E_bnd,find_opt=find_opt,fit_gamma=fit_gamma,
-                      fit_alg=fit_alg,to_plot=False,sample=sample,expt=expt_and_batch,metric_name=metric_name,
-                      hill_orient=hill_orient,to_save=False,direc=None,
-                      SAMPLES=50000,BURN=5000,PSO_PARTICLES=100,PSO_ITER=50,PSO_SPEED=10,
-                      init_seed=init_seed,
-                     # other_metrics=other_metrics
-                     )
-    except ValueError as e:
-        err = str(e)
-        if 'lower bound must be strictly less than each upper bound' in err:
-            raise DataError(
-                'Lower bound must be strictly less than upper bound')
-
-        # Re-raise any unknown error
-        raise
+    musyc_args = (d1, d2, dip, dip_sd, drug1_name, drug2_name)
+    musyc_kwargs = dict(E_fix=E_fix, E_bnd=E_bnd, find_opt=find_opt,
+                        fit_gamma=fit_gamma, fit_alg=fit_alg, to_plot=False,
+                        sample=sample, expt=expt_and_batch,
+                        metric_name=metric_name, hill_orient=hill_orient,
+                        to_save=False, direc=None,
+                        # other_metrics=other_metrics
+                        )
+
+    def fit_kwargs(samples, burn, seed, fit_settings=FIT_SETTINGS):
+        return dict(musyc_kwargs, **fit_settings, SAMPLES=samples, BURN=burn,
+                    init_seed=seed)
+
+    adaptive = fit_mode != 'fast' and sampling == 'adaptive' and \
+        fit_alg == 'nlls_mcnlls'
+    if fit_mode == 'fast':
+        T = _musyc_2d(musyc_args, fit_kwargs(
+            FAST_FIT_SETTINGS['SAMPLES'], FAST_FIT_SETTINGS['BURN'],
+            init_seed, FAST_FIT_SETTINGS))
+        T['mcmc_samples'] = FAST_FIT_SETTINGS['SAMPLES']
+        T['fit_method'] = _fit_method(fit_alg, fit_mode)
+    elif adaptive:
+        try:
+            T = _fit_adaptive(
+                musyc_args, fit_kwargs, init_seed, fingerprint,
+                progress=lambda samples, max_samples: progress(
+                    stage='mcmc', mcmc_samples=samples,
+                    mcmc_samples_max=max_samples,
+                    progress=samples / max_samples))
+        except SoftTimeLimitExceeded:
+            # Retry from the checkpointed runs, if any completed
+            if not self.request.called_directly and \
+                    self.request.retries < settings.FIT_CHECKPOINT_RETRIES \
+                    and checkpoint.exists(fingerprint):
+                raise self.retry(countdown=0)
+            raise
+    else:
+        T = _musyc_2d(musyc_args, fit_kwargs(
+            FIT_SETTINGS['SAMPLES'], FIT_SETTINGS['BURN'], init_seed))
+        T['mcmc_samples'] = FIT_SETTINGS['SAMPLES']
 
     T['E_fix'] = E_fix
     T['E_bnd'] = E_bnd
     T['drug1_units'] = drug1_units
     T['drug2_units'] = drug2_units
-    T['d1'] = d1.tolist()
-    T['d2'] = d2.tolist()
-    T['dip'] = dip.tolist()
-    T['dip_sd'] = dip_sd.tolist()
+    # The data arrays aren't stored (see musycweb.rawdata), only what the
+    # runtime estimator needs from them
+    T['num_points'] = len(d1)
+    T['boundary'] = estimator.is_boundary(d1, d2)
     T['expt_date'] = expt_date.tolist()
     T['batch'] = batch
+    T['sampling'] = sampling
 
     for k in ('save_direc', 'to_save_traces', 'to_save_plots', 'memory_Mb'):
         del T[k]
 
+    fitcache.store(fingerprint, T)
+    # Only adaptive sampling saves checkpoints (see musycweb.checkpoint)
+    if adaptive:
+        checkpoint.clear(fingerprint)
+
     return T
 
 
-def _swap_drug1_drug2(data):
-    return data.rename(columns={
-        'drug1': 'drug2',
-        'drug2': 'drug1',
-        'drug1.conc': 'drug2.conc',
-        'drug2.conc': 'drug1.conc',
-        'drug1.units': 'drug2.units',
-        'drug2.units': 'drug1.units'
-    })
+metrics.track(fit_drug_combination)
+taskstatus.track(fit_drug_combination)
+
+
+@task_success.connect
+def _save_fit_result(sender=None, result=None, **kwargs):
+    """ Save each successful fit's result as a FitResult """
+    if sender is None or sender.name != fit_drug_combination.name:
+        return
+    # As stored in the TaskResult, so CSV lines match result_csv_line
+    fitresults.save(sender.request.id, json_loads(json_dumps(result)))
+
+
+@shared_task(bind=True)
+def export_dataset(self, dataset_id):
+    """ Save a dataset's CSV export, if its fits have all finished """
+    export.materialise(dataset_id)
+
+
+def queue_export(dataset):
+    """ Queue export_dataset if a dataset's fits have all finished """
+    if not dataset.export_file and export.is_complete(dataset):
+        export_dataset.apply_async(
+            args=(dataset.id, ),
+            priority=settings.CELERY_PREPARE_PRIORITY
+        )
+
+
+@task_postrun.connect
+def _export_when_complete(sender=None, kwargs=None, state=None, **extra):
+    """ Export each dataset when its last fit finishes
+
+    Runs after taskstatus has counted the fit as finished, as taskstatus'
+    task_postrun handler is connected first.
+    """
+    if sender is None or sender.name != fit_drug_combination.name or \
+            state not in states.READY_STATES:
+        return
+    dataset_id = (kwargs or {}).get('dataset_id')
+    if not dataset_id or not export.fits_finished(dataset_id):
+        return
+    dataset = Dataset.objects.filter(pk=dataset_id).first()
+    if dataset is not None:
+        queue_export(dataset)
 
 
 def _warning(request, message):
@@ -164,20 +405,76 @@ def _warning(request, message):
         # Use Django warnings, if available
         warning(request, message)
     else:
-        warnings.warn(message)
+        warnings.warn(message, DataWarning)
+
+
+def load_dataset(dataset, request=None, warn=True, file_replaced=False):
+    """ Load a dataset's validated, normalised data
+
+    Reads the canonical (Parquet) copy if there is one. Otherwise, the
+    uploaded CSV is read, in chunks, with validation and normalisation,
+    and a canonical copy saved for next time if the dataset is saved.
+
+    With file_replaced, the uploaded CSV is read even if there is a
+    canonical copy, which is left for the caller to replace (see
+    save_canonical).
+
+    Returns (data, use_batches).
+    """
+    if dataset.canonical_file and not file_replaced:
+        with dataset.canonical_file.open('rb') as f:
+            return read_canonical(f)
+
+    data, use_batches, _ = read_dataset(
+        dataset.file,
+        warn=(lambda msg: _warning(request, msg)) if warn else
+        (lambda msg: None)
+    )
+    if dataset.pk and not file_replaced:
+        save_canonical(dataset, data)
+    return data, use_batches
+
+
+def save_canonical(dataset, data):
+    """ Save a dataset's canonical copy, replacing any previous one """
+    old_name = dataset.canonical_file.name
+    dataset.canonical_file.save(f'{dataset.pk}.parquet',
+                                ContentFile(write_canonical(data)),
+                                save=False)
+    dataset.save(update_fields=['canonical_file'])
+    if old_name:
+        storage = dataset.canonical_file.storage
+        transaction.on_commit(lambda: storage.delete(old_name))
 
 
 def process_dataset(dataset_or_id, clear_existing=None, request=None,
-                    priority=None):
-    """ Split a dataset into drug combinations and submit as tasks """
+                    priority=None, progress=None, file_replaced=False):
+    """ Split a dataset into drug combinations and submit as tasks
+
+    clear_existing controls what happens to the dataset's existing tasks:
+    True removes them all; 'unsuccessful' removes unsuccessful tasks and
+    skips successful combinations; 'changed' keeps combinations whose
+    fit inputs are unchanged, and replaces or removes the rest (e.g. after
+    the dataset file is replaced). By default, existing tasks are kept.
+
+    progress, if supplied, is called with the fraction of combinations
+    submitted so far.
+
+    file_replaced re-reads the dataset's uploaded file, after it has been
+    replaced. Its old canonical copy is kept, for reading kept tasks' fit
+    data, until their row positions have been updated.
+    """
     if isinstance(dataset_or_id, int):
         dataset = Dataset.objects.get(pk=dataset_or_id, deleted_date=None)
     else:
         dataset = dataset_or_id
 
-    assert clear_existing is None or clear_existing in ('unsuccessful', True)
+    assert clear_existing is None or \
+        clear_existing in ('unsuccessful', 'changed', True)
+
+    export.invalidate(dataset)
 
-    if clear_existing:
+    if clear_existing in ('unsuccessful', True):
         # Revoke any unprocessed tasks
         app.control.revoke(
             list(TaskResult.objects.filter(
@@ -202,140 +499,155 @@ def process_dataset(dataset_or_id, clear_existing=None, request=None,
             )
         ).delete()
 
-    if clear_existing == 'unsuccessful':
-        # Get list of completed tasks to skip
-        tasks_to_skip = set(
-            (t.drug1,
-             t.drug2,
-             t.sample,
-             t.batch)
-            for t in
+    # Existing combinations, as {(drug1, drug2, sample, batch):
+    # (task_id, fingerprint, pk)}. With 'unsuccessful', only successful tasks
+    # remain, and are skipped. With 'changed', combinations are skipped if
+    # their fingerprint is unchanged, and replaced otherwise.
+    if clear_existing in ('unsuccessful', 'changed'):
+        existing_tasks = {
+            (drug1, drug2, sample, batch): (task_id, fingerprint, pk)
+            for drug1, drug2, sample, batch, task_id, fingerprint, pk in
             DatasetTask.objects.filter(
-                dataset_id=dataset.id,
-                task__status=states.SUCCESS
-            )
-        )
+                dataset_id=dataset.id
+            ).values_list(
+                'drug1', 'drug2', 'sample', 'batch', 'task_id', 'fingerprint',
+                'pk'
+            ).iterator()
+        }
     else:
-        tasks_to_skip = set()
-
-    # Read in file
-    fields = {**CreateDatasetForm.REQUIRED_FIELDS,
-              **CreateDatasetForm.OPTIONAL_FIELDS}
-    try:
-        data = pd.read_table(
-            dataset.file,
-            delimiter=',',
-            dtype=fields
-        )
-    except ValueError as e:
-        err = str(e)
-        if 'could not convert string to float' in err:
-            float_fields = [f for f, v in fields.items() if v is float]
-            raise DataError(
-                'Error in one or more of the '
-                f'{", ".join(float_fields)} columns: {err}')
+        existing_tasks = {}
 
-        # Re-raise any unknown error
-        raise
+    data, use_batches = load_dataset(dataset, request=request,
+                                     file_replaced=file_replaced)
 
-    use_batches = 'batch' in data.columns
-
-    # Start of validation and normalisation
-
-    # Warn about surplus columns
-    surplus_columns = set(data.columns) - set(fields.keys())
-    if surplus_columns:
-        _warning(request,
-                 f'Extra columns were ignored: {", ".join(surplus_columns)}')
-        
-    # Warn about capitalized column names and convert
-    for col in data.columns:
-        res = any(letter.isupper() for letter in col)
-        if res:
-            data.columns = [str(x).lower() for x in data.columns]
-            _warning(request, 'Converting column names to lowercase')
-
-    # Check for commas in drug names and sample name
-    res1 = data.loc[data['drug1'].str.contains(','), :]
-    if not res1.empty:
-        raise DataError('Drug name should not contain commas')
-    
-    res2 = data.loc[data['drug2'].str.contains(','), :]
-    if not res2.empty:
-        raise DataError('Drug name should not contain commas')
-
-    res3 = data.loc[data['sample'].str.contains(','), :]
-    if not res3.empty:
-        raise DataError('Sample name should not contain commas')
-    
-    # Check for special characters in drug units and sample name
-    res4 = data.loc[data['drug1.units'].str.contains('[^0-9a-zA-Z_]+'), :]
-    if not res4.empty:
-        raise DataError('Drug units should not contain special characters')
-
-    res5 = data.loc[data['drug2.units'].str.contains('[^0-9a-zA-Z_]+'), :]
-    if not res5.empty:
-        raise DataError('Drug units should not contain special characters')
-    
-    res6 = data.loc[data['sample'].str.contains('[^0-9a-zA-Z_]+'), :]
-    if not res6.empty:
-        raise DataError('Sample name should not contain special characters')
-    
-    # TODO: Check that drug units are the same for all conditions -- per combination uploaded
-    # a = data['drug1.units'].to_numpy() # s.values (pandas<0.24)
-    #res7 = (a[0] == a).all()
-    #if not res7: 
-    #    raise DataError('Units for drug concentration must be the same for all conditions')
-    # b = data['drug2.units'].to_numpy() # s.values (pandas<0.24)
-    #res8 = (b[0] == b).all()
-    #if not res8: 
-    #    raise DataError('Units for drug concentration must be the same for all conditions')
-
-    # Drop empty rows
-    nrows = data.shape[0]
-    data.dropna(axis=0, how='all', thresh=None, subset=None, inplace=True)
-    if data.shape[0] != nrows:
-        _warning(request, 'Empty rows have been dropped')
-
-    # Drug concentrations should be non-negative
-    if (data['drug1.conc'] < 0).any() or (data['drug2.conc'] < 0).any():
-        raise DataError('Drug concentrations cannot be negative')
-
-    # Batches cannot contain empty values, if present
-    if use_batches and (data['batch'].isna().any() or
-                        (data['batch'].str.strip() == '').any()):
-        raise DataError('Batch column should not contain empty values')
-    # Remove rows with missing effect value
-    if data['effect'].isna().any():
-        _warning(request,
-                 'Effect columns which are missing/NaN will be removed')
-    data = data[data['effect'].notna()]
-    # Add in optional effect.95ci column if not present and validate
-    if 'effect.95ci' not in data.columns:
-        ci_val = abs(min(data['effect']/100.))
-        if ci_val == 0:
-            ci_val = 1e-16
-        data['effect.95ci'] = ci_val
-    else:
-        if data['effect.95ci'].isna().any():
-            raise DataError('effect.95ci column cannot contain blank/NA values')
-        if (data['effect.95ci'] <= 0).any():
-            raise DataError('effect.95ci column cannot contain zero or '
-                            'negative values')
+    e_fix, e_bnd = _fit_constraints(dataset)
+    partitions = CombinationPartitioner(data, use_batches)
+    estimates = _estimate_fit_times(partitions, e_fix, e_bnd,
+                                    dataset.fit_mode)
 
-    # Add SD
-    data['effect.sd'] = data['effect.95ci'] / (2 * 1.96)
+    # Fit each single agent curve once, to narrow combinations' E bounds
+    single_agent_fits = None
+    if settings.SINGLE_AGENT_PRIORS and e_fix is None:
+        single_agent_fits = singleagent.fit_single_agents(partitions)
 
     if priority is None:
-        if data.shape[0] >= settings.CELERY_DEPRIORITISE_SIZE_L2:
-            priority = 2
-        elif data.shape[0] >= settings.CELERY_DEPRIORITISE_SIZE_L3:
-            priority = 3
+        priority = estimator.priority(
+            sum(estimator.expected(e) for e in estimates))
         if priority:
             _warning(request, 'Tasks will run at lower priority due to large '
                               'dataset size')
 
-    # Global fitting bounds
+    # Loop through each (drug1, drug2, sample) combination and launch tasks.
+    # DatasetTasks are created in bulk before their tasks are published, and
+    # all tasks are published through a single producer
+    pending = []
+    replaced = []
+    kept = []
+    num_submitted = 0
+    num_replaced = 0
+    start = time.perf_counter()
+
+    with app.producer_or_acquire() as producer:
+        for i, (batch, sample, drug1_name, drug2_name) in \
+                enumerate(partitions):
+            if progress:
+                progress(i / len(partitions))
+
+            key = (drug1_name, drug2_name, sample, batch)
+            existing_task = existing_tasks.pop(key, None)
+            rows = json.dumps(partitions.row_refs(batch, sample,
+                                                    drug1_name, drug2_name))
+            if existing_task and clear_existing == 'unsuccessful':
+                kept.append(DatasetTask(pk=existing_task[2], rows=rows))
+                continue
+
+            combination_e_bnd = e_bnd
+            if single_agent_fits is not None:
+                combination_e_bnd = singleagent.prior_bounds(
+                    single_agent_fits.get((batch, sample, drug1_name)),
+                    single_agent_fits.get((batch, sample, drug2_name)),
+                    e_bnd,
+                    width=settings.SINGLE_AGENT_PRIOR_WIDTH
+                )
+
+            fit_data = partitions.fit_data(batch, sample,
+                                           drug1_name, drug2_name)
+            for k in ARRAY_FIELDS:
+                fit_data[k] = pack_array(fit_data[k])
+            kwargs = dict(
+                dataset_id=dataset.id,
+                drug1_name=drug1_name,
+                drug2_name=drug2_name,
+                sample=sample,
+                batch=batch,
+                **fit_data,
+                E_fix=e_fix,
+                E_bnd=combination_e_bnd,
+                output_dir=None,
+                expt=dataset.name,
+                metric_name=dataset.metric_name,
+                hill_orient=dataset.orientation,
+                fit_alg=DEFAULT_FIT_ALG,
+                sampling=settings.FIT_SAMPLING,
+                fit_mode=dataset.fit_mode
+            )
+            fingerprint = _fit_fingerprint(**kwargs)
+
+            if existing_task:
+                existing_task_id, existing_fingerprint, existing_pk = \
+                    existing_task
+                if existing_fingerprint == fingerprint:
+                    # Row positions change if the dataset file is replaced
+                    kept.append(DatasetTask(pk=existing_pk, rows=rows))
+                    continue
+                replaced.append(existing_task_id)
+
+            # Create DB entry for tracking this task
+            dataset_task = DatasetTask(
+                dataset=dataset,
+                drug1=drug1_name,
+                drug2=drug2_name,
+                sample=sample,
+                batch=batch,
+                task_id=uuid(),
+                fingerprint=fingerprint,
+                estimated_time=estimates[i],
+                rows=rows
+            )
+            pending.append((dataset_task, kwargs))
+
+            if len(pending) >= settings.DATASET_SUBMIT_BATCH_SIZE:
+                num_replaced += _remove_tasks(replaced)
+                num_submitted += _submit_tasks(pending, producer, priority)
+                pending = []
+                replaced = []
+
+        num_replaced += _remove_tasks(replaced)
+        num_submitted += _submit_tasks(pending, producer, priority)
+
+    # Kept tasks' rows and the canonical copy they refer to change together
+    with transaction.atomic():
+        DatasetTask.objects.bulk_update(
+            kept, ['rows'], batch_size=settings.DATASET_SUBMIT_BATCH_SIZE)
+        if file_replaced:
+            save_canonical(dataset, data)
+
+    # Remove combinations no longer in the dataset
+    num_removed = 0
+    if clear_existing == 'changed':
+        num_removed = _remove_tasks(
+            [task_id for task_id, _, _ in existing_tasks.values()])
+
+    dataset.submission_time = time.perf_counter() - start
+    dataset.save(update_fields=['submission_time'])
+    taskstatus.sync(dataset)
+    logger.info('Dataset %d: submitted %d tasks (%d replaced, %d removed) '
+                'in %.2fs', dataset.id, num_submitted, num_replaced,
+                num_removed, dataset.submission_time)
+
+
+def _fit_constraints(dataset):
+    """ A dataset's global fitting constraints, as (E_fix, E_bnd) """
     e_fix = None
     e_bnd = None
     if dataset.emax_lower is not None or \
@@ -355,104 +667,200 @@ def process_dataset(dataset_or_id, clear_existing=None, request=None,
             emax_lwr = dataset.emax_lower if dataset.emax_lower is not None else -np.Inf
             emax_upr = dataset.emax_upper if dataset.emax_upper is not None else np.Inf
             e_bnd = [[e0_lwr] + [emax_lwr] * 3, [e0_upr] + [emax_upr] * 3]
+    return e_fix, e_bnd
+
+
+def _estimate_fit_times(partitions, e_fix, e_bnd, fit_mode='standard'):
+    """ Estimated fit time of each combination, in partition order
+
+    Estimates are None for combinations without enough fit history.
+    """
+    model = estimator.get_model()
+    constrained = e_fix is not None or e_bnd is not None
+    return [
+        model.predict(*estimator.features(
+            *partitions.concentrations(*combination),
+            fit_alg=_fit_method(DEFAULT_FIT_ALG, fit_mode),
+            constrained=constrained,
+            sampling=settings.FIT_SAMPLING))
+        for combination in partitions
+    ]
+
+
+def estimate_dataset(dataset):
+    """ Estimate a dataset's fitting cost, without submitting anything
+
+    The dataset needn't be saved. Fit times are in seconds; results
+    already in the fit cache aren't taken into account.
+    """
+    data, use_batches = load_dataset(dataset, warn=False)
+    partitions = CombinationPartitioner(data, use_batches)
+    estimates = [estimator.expected(e) for e in _estimate_fit_times(
+        partitions, *_fit_constraints(dataset), dataset.fit_mode)]
+    fit_time = sum(estimates)
+    return {
+        'rows': data.shape[0],
+        'combinations': len(partitions),
+        'fit_time': fit_time,
+        'wall_time': estimator.wall_time(estimates),
+        'priority': estimator.priority(fit_time) or
+        settings.CELERY_TASK_DEFAULT_PRIORITY
+    }
+
+
+def _remove_tasks(task_ids):
+    """ Revoke tasks and delete their TaskResults and DatasetTasks
+
+    Returns the number of DatasetTasks deleted.
+    """
+    if not task_ids:
+        return 0
+
+    # Revoke tasks which haven't finished, including queued tasks which
+    # don't have a TaskResult yet
+    finished = set(TaskResult.objects.filter(
+        task_id__in=task_ids,
+        status__in=states.READY_STATES
+    ).values_list('task_id', flat=True))
+    app.control.revoke([t for t in task_ids if t not in finished])
+    TaskResult.objects.filter(task_id__in=task_ids).delete()
+    num_deleted, _ = DatasetTask.objects.filter(
+        task_id__in=task_ids).delete()
+    return num_deleted
+
+
+def _submit_tasks(pending, producer, priority):
+    """ Create DatasetTasks in bulk, then publish their fitting tasks
+
+    pending is a list of (DatasetTask, kwargs) tuples. Combinations with a
+    matching result in the fit cache get a successful TaskResult straight
+    away, and are not published. If publishing fails part way through,
+    DatasetTasks for unpublished tasks are deleted.
+
+    Returns the number of tasks published or completed from the cache.
+    """
+    if not pending:
+        return 0
+
+    # Single-valued units are checked by the task, so don't use the cache
+    # to skip that check
+    cached = fitcache.lookup([
+        t.fingerprint for t, kwargs in pending
+        if len(kwargs['drug1_units']) == 1 and len(kwargs['drug2_units']) == 1
+    ])
+
+    submitted_date = timezone.now()
+    for dataset_task, _ in pending:
+        dataset_task.submitted_date = submitted_date
+    DatasetTask.objects.bulk_create([t for t, _ in pending])
+
+    task_results = []
+    fit_results = {}
+    to_publish = []
+    for dataset_task, kwargs in pending:
+        result = cached.get(dataset_task.fingerprint)
+        if result is None:
+            to_publish.append((dataset_task, kwargs))
+            continue
+        batch = kwargs['batch']
+        result.update(
+            expt=f'{kwargs["expt"]} [{batch}]' if batch else kwargs['expt'],
+            batch=batch,
+            drug1_units=kwargs['drug1_units'][0],
+            drug2_units=kwargs['drug2_units'][0],
+            expt_date=kwargs['expt_date']
+        )
+        task_results.append(TaskResult(
+            task_id=dataset_task.task_id,
+            task_name=fit_drug_combination.name,
+            status=states.SUCCESS,
+            content_type='application/json',
+            content_encoding='utf-8',
+            result=json.dumps(result),
+            date_done=timezone.now()
+        ))
+        fit_results[dataset_task.task_id] = fitresults.fields(result)
+    TaskResult.objects.bulk_create(task_results)
+    if fit_results:
+        # DatasetTask primary keys aren't set by bulk_create on all databases
+        pks = dict(DatasetTask.objects.filter(
+            task_id__in=fit_results.keys()
+        ).values_list('task_id', 'pk'))
+        FitResult.objects.bulk_create([
+            FitResult(dataset_task_id=pks[task_id], **values)
+            for task_id, values in fit_results.items()
+        ])
+
+    num_published = 0
+    try:
+        for dataset_task, kwargs in to_publish:
+            fit_drug_combination.apply_async(
+                kwargs=kwargs,
+                task_id=dataset_task.task_id,
+                priority=priority,
+                soft_time_limit=estimator.time_limit(
+                    dataset_task.estimated_time),
+                producer=producer
+            )
+            num_published += 1
+    except Exception:
+        DatasetTask.objects.filter(task_id__in=[
+            t.task_id for t, _ in to_publish[num_published:]
+        ]).delete()
+        raise
 
-    # Canonicalise drug order, alphabetically
-    # i.e. drug1 should come alphabetically first
-    out_of_order = data['drug1'] > data['drug2']
-    data.loc[out_of_order, ['drug1', 'drug1.conc', 'drug1.units',
-                            'drug2', 'drug2.conc', 'drug2.units']] = \
-                data.loc[out_of_order, ['drug2', 'drug2.conc', 'drug2.units',
-                                        'drug1', 'drug1.conc', 'drug1.units']]
-
-    # Control filter (no drug)
-    data_ctrl = data.loc[(data['drug1.conc'] == 0) & (data['drug2.conc'] == 0)]
-
-    # SA = Single agent filter (exactly one drug added)
-    data_sa_1 = data.loc[(data['drug1.conc'] == 0) & (data['drug2.conc'] != 0)]
-    data_sa_2 = data.loc[(data['drug1.conc'] != 0) & (data['drug2.conc'] == 0)]
-
-    # Dual agent (two drugs added in non-zero concentration
-    data_expt = data.loc[(data['drug1.conc'] != 0) & (data['drug2.conc'] != 0)]
-
-    # Loop through each (drug1, drug2, sample) combination and launch tasks
-    dataset_tasks = []
-
-    def lfrom(lists, attr):
-        return list(itertools.chain(*(l[attr].array for l in lists)))
+    return len(task_results) + num_published
 
-    def sfrom(lists, attr):
-        return list(set(itertools.chain(*(l[attr].array for l in lists))))
 
-    outer_grouping = ['batch', 'sample'] if use_batches else ['sample']
+@shared_task(bind=True)
+def prepare_dataset(self, dataset_id, **kwargs):
+    """ Validate and split a dataset, and submit its fitting tasks
 
+    Runs process_dataset in the background, recording progress, data
+    warnings and any validation error on the Dataset's preparation fields.
+    Any keyword arguments are passed through to process_dataset.
+    """
     try:
-        for bat_smp, samp_grp in data_expt.groupby(outer_grouping, sort=False):
-            if use_batches:
-                batch, sample = bat_smp
-                data_ctrl_s = data_ctrl.loc[
-                      (data_ctrl['batch'] == batch) &
-                      (data_ctrl['sample'] == sample)]
-                data_sa_1_s = data_sa_1.loc[
-                      (data_sa_1['batch'] == batch) &
-                      (data_sa_1['sample'] == sample)]
-                data_sa_2_s = data_sa_2.loc[
-                      (data_sa_2['batch'] == batch) &
-                      (data_sa_2['sample'] == sample)]
-            else:
-                sample = bat_smp
-                batch = None
-                data_ctrl_s = data_ctrl.loc[data_ctrl['sample'] == sample]
-                data_sa_1_s = data_sa_1.loc[data_sa_1['sample'] == sample]
-                data_sa_2_s = data_sa_2.loc[data_sa_2['sample'] == sample]
-
-            for drug_names, grp_dat in samp_grp.groupby(
-                    ['drug1', 'drug2'], sort=False):
-                drug1_name, drug2_name = drug_names
-                if (drug1_name, drug2_name, sample, batch) in tasks_to_skip:
-                    continue
-
-                df_list = [
-                    grp_dat,
-                    data_ctrl_s,
-                    data_sa_1_s.loc[data_sa_1_s['drug2'] == drug2_name],
-                    data_sa_2_s.loc[data_sa_2_s['drug1'] == drug1_name],
-                    # Need to swap drugs in single agent case where drug is in wrong col
-                    _swap_drug1_drug2(data_sa_1_s.loc[data_sa_1_s['drug2'] == drug1_name]),
-                    _swap_drug1_drug2(data_sa_2_s.loc[data_sa_2['drug1'] == drug2_name])
-                ]
-
-                task = fit_drug_combination.apply_async(
-                    kwargs=dict(
-                        dataset_id=dataset.id,
-                        drug1_name=drug1_name,
-                        drug2_name=drug2_name,
-                        sample=sample,
-                        batch=batch,
-                        d1=lfrom(df_list, 'drug1.conc'),
-                        d2=lfrom(df_list, 'drug2.conc'),
-                        dip=lfrom(df_list, 'effect'),
-                        dip_sd=lfrom(df_list, 'effect.sd'),
-                        E_fix=e_fix,
-                        E_bnd=e_bnd,
-                        drug1_units=sfrom(df_list, 'drug1.units'),
-                        drug2_units=sfrom(df_list, 'drug2.units'),
-                        expt_date=sfrom(df_list, 'expt.date'),
-                        output_dir=None,
-                        expt=dataset.name,
-                        metric_name=dataset.metric_name,
-                        hill_orient=dataset.orientation
-                    ),
-                    priority=priority
-                )
-
-                # # Create DB entry for tracking this task
-                dataset_tasks.append(DatasetTask(
-                    dataset=dataset,
-                    drug1=drug1_name,
-                    drug2=drug2_name,
-                    sample=sample,
-                    batch=batch,
-                    task_id=task.id
-                ))
-    finally:
-        DatasetTask.objects.bulk_create(dataset_tasks)
+        dataset = Dataset.objects.get(pk=dataset_id, deleted_date=None)
+    except Dataset.DoesNotExist:
+        return
+
+    last_update = time.monotonic()
+
+    def progress(fraction):
+        nonlocal last_update
+        if time.monotonic() - last_update >= \
+                settings.DATASET_PREPARATION_PROGRESS_INTERVAL:
+            last_update = time.monotonic()
+            Dataset.objects.filter(pk=dataset_id).update(
+                preparation_progress=fraction)
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', DataWarning)
+        try:
+            process_dataset(dataset, progress=progress, **kwargs)
+            dataset.preparation_status = 'ready'
+            dataset.preparation_error = None
+        except DataError as e:
+            dataset.preparation_status = 'failed'
+            dataset.preparation_error = str(e)
+        except Exception:
+            dataset.preparation_status = 'failed'
+            dataset.preparation_error = 'An unexpected error occurred ' \
+                                        'processing this dataset'
+            raise
+        finally:
+            dataset.preparation_progress = 1.0
+            dataset.preparation_warnings = json.dumps([
+                str(w.message) for w in caught
+                if issubclass(w.category, DataWarning)
+            ])
+            dataset.save(update_fields=[
+                'preparation_status', 'preparation_error',
+                'preparation_progress', 'preparation_warnings'
+            ])
+
+    # All fits may have been reused from the fit cache
+    queue_export(dataset)
+    fitcache.evict()
+    checkpoint.evict()
@@ -0,0 +1,227 @@
+""" Per-dataset task status counts, kept up to date as tasks run
+
+Each DatasetTask's state mirrors its TaskResult's status, and is updated
+from Celery's task signals as tracked tasks start and finish, along with
+its dataset's DatasetStatusCount rows. Status polling then reads the
+counts, and only the tasks whose state changed since the last poll,
+rather than every task's TaskResult.
+
+Changes made without signals (tasks submitted, reused from the fit cache
+or removed) are picked up by sync, which process_dataset calls. Each change
+is published, and sent to browsers viewing the dataset as a status_event
+(see musycweb.events).
+"""
+import logging
+from celery.signals import task_prerun, task_postrun, task_revoked
+from django.db import transaction
+from django.db.models import F, Q, prefetch_related_objects
+from django.utils import timezone
+from django_celery_results.models import TaskResult, states
+from . import estimator, events
+from .models import DatasetTask, DatasetStatusCount
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'QUEUED'
+GROUPS = tuple(g for g, _ in DatasetStatusCount.GROUP_CHOICES)
+# States of tasks not running (queued or finished)
+NOT_RUNNING = (QUEUED, states.PENDING) + tuple(states.READY_STATES)
+# Attempts to change a task's state, if it changes concurrently
+MAX_ATTEMPTS = 5
+# Task IDs per update query in sync
+UPDATE_BATCH_SIZE = 500
+
+_tracked = set()
+
+
+def group(status):
+    """ The status group (see DatasetStatusCount) of a task status """
+    if status in (QUEUED, states.PENDING):
+        return 'queued'
+    if status == states.SUCCESS:
+        return 'success'
+    if status in states.READY_STATES:
+        return 'failure'
+    return 'started'
+
+
+def _lock_counts(dataset_id):
+    """ Lock a dataset's counts, serialising its status changes """
+    list(DatasetStatusCount.objects.select_for_update().filter(
+        dataset_id=dataset_id).order_by('pk').values_list('pk', flat=True))
+
+
+def counts(dataset):
+    """ A dataset's status counts, as {group: (count, estimated_time)} """
+    result = {g: (0, 0.0) for g in GROUPS}
+    result.update(
+        (g, (n, t)) for g, n, t in DatasetStatusCount.objects.filter(
+            dataset=dataset).values_list('group', 'count', 'estimated_time'))
+    return result
+
+
+def changed_tasks(dataset, since=None):
+    """ A dataset's tasks changed since a time, and any still running
+
+    Returns all the dataset's tasks if since is None.
+    """
+    tasks = DatasetTask.objects.filter(dataset=dataset)
+    if since is not None:
+        tasks = tasks.filter(Q(state_changed__gte=since) |
+                             ~Q(state__in=NOT_RUNNING))
+    return tasks
+
+
+def report(dataset, tasks):
+    """ Status of some of a dataset's tasks, and the dataset overall
+
+    tasks should include every running task, for the overall progress.
+    Returns a dict of 'tasks' (task ID: status, progress and eta),
+    'counts' (group: number of tasks), and overall 'progress' and 'eta'.
+    """
+    tasks = list(tasks.only('task', 'state', 'estimated_time'))
+    # Only running tasks' TaskResults are read, for their progress
+    prefetch_related_objects(
+        [t for t in tasks if t.state not in NOT_RUNNING], 'task')
+
+    statuses = {}
+    progress = []
+    for task in tasks:
+        fraction, eta = task.progress
+        statuses[task.task_id] = {
+            'status': task.state,
+            'progress': fraction,
+            'eta': eta
+        }
+        if group(task.state) == 'started':
+            progress.append((task.estimated_time, fraction, eta))
+
+    # Queued and finished tasks are taken from the counts, with queued
+    # tasks' estimated time shared equally between them
+    dataset_counts = counts(dataset)
+    num_queued, queued_time = dataset_counts['queued']
+    if num_queued:
+        progress += [(queued_time / num_queued, 0.0, None)] * num_queued
+    done_time = dataset_counts['success'][1] + dataset_counts['failure'][1]
+    if done_time:
+        progress.append((done_time, 1.0, 0.0))
+
+    fraction, eta = estimator.dataset_progress(progress)
+    return {
+        'tasks': statuses,
+        'counts': {g: n for g, (n, _) in dataset_counts.items()},
+        'progress': fraction,
+        'eta': eta
+    }
+
+
+def transition(task_id, status):
+    """ Record a task's new status, updating its dataset's counts """
+    row = DatasetTask.objects.filter(task_id=task_id).values_list(
+        'pk', 'dataset_id', 'estimated_time').first()
+    if row is None:
+        return
+    pk, dataset_id, estimated_time = row
+
+    with transaction.atomic():
+        _lock_counts(dataset_id)
+        for _ in range(MAX_ATTEMPTS):
+            old = DatasetTask.objects.filter(pk=pk).values_list(
+                'state', flat=True).first()
+            if old is None or old == status:
+                return
+            if DatasetTask.objects.filter(pk=pk, state=old).update(
+                    state=status, state_changed=timezone.now()):
+                break
+        else:
+            logger.warning('Could not update state of task %s', task_id)
+            return
+
+        transaction.on_commit(lambda: _publish(dataset_id, pk))
+        old_group, new_group = group(old), group(status)
+        if old_group != new_group:
+            estimate = estimator.expected(estimated_time)
+            for g, sign in ((old_group, -1), (new_group, 1)):
+                DatasetStatusCount.objects.filter(
+                    dataset_id=dataset_id, group=g
+                ).update(count=F('count') + sign,
+                         estimated_time=F('estimated_time') + sign * estimate)
+
+
+def sync(dataset):
+    """ Set a dataset's task states from their TaskResults, and recount """
+    for g in GROUPS:
+        DatasetStatusCount.objects.get_or_create(dataset=dataset, group=g)
+
+    tasks = DatasetTask.objects.filter(dataset=dataset)
+    with transaction.atomic():
+        _lock_counts(dataset.id)
+        statuses = dict(TaskResult.objects.filter(
+            task_id__in=tasks.values('task_id')
+        ).values_list('task_id', 'status'))
+
+        changed = {}
+        totals = {g: [0, 0.0] for g in GROUPS}
+        for pk, task_id, state, estimated_time in tasks.values_list(
+                'pk', 'task_id', 'state', 'estimated_time').iterator():
+            status = statuses.get(task_id, QUEUED)
+            # A task's TaskResult is only saved once it finishes, so tasks
+            # started (or revoked) by signals aren't set back to queued
+            if group(status) == 'queued' and group(state) != 'queued':
+                status = state
+            if status != state:
+                changed.setdefault((state, status), []).append(pk)
+            total = totals[group(status)]
+            total[0] += 1
+            total[1] += estimator.expected(estimated_time)
+
+        now = timezone.now()
+        for (old, status), pks in changed.items():
+            for i in range(0, len(pks), UPDATE_BATCH_SIZE):
+                DatasetTask.objects.filter(
+                    pk__in=pks[i:i + UPDATE_BATCH_SIZE], state=old
+                ).update(state=status, state_changed=now)
+        for g, (count, estimated_time) in totals.items():
+            DatasetStatusCount.objects.filter(
+                dataset=dataset, group=g
+            ).update(count=count, estimated_time=estimated_time)
+        transaction.on_commit(lambda: _publish(dataset.id))
+
+
+def status_event(dataset_id, pk=None):
+    """ A dataset's status report, as an event, including a changed task """
+    return report(dataset_id, DatasetTask.objects.filter(
+        Q(pk=pk) | ~Q(state__in=NOT_RUNNING), dataset_id=dataset_id))
+
+
+def _publish(dataset_id, pk=None):
+    """ Publish a change to a dataset's tasks """
+    try:
+        events.publish(dataset_id, pk)
+    except Exception:
+        # Events are only a notification; status can still be polled
+        logger.exception('Could not publish status of dataset %d',
+                         dataset_id)
+
+
+def track(task):
+    """ Keep DatasetTask states up to date as a Celery task runs """
+    _tracked.add(task.name)
+
+
+@task_prerun.connect
+def _prerun(task_id=None, task=None, **kwargs):
+    if task is not None and task.name in _tracked:
+        transition(task_id, states.STARTED)
+
+
+@task_postrun.connect
+def _postrun(task_id=None, task=None, state=None, **kwargs):
+    if task is not None and task.name in _tracked and state:
+        transition(task_id, state)
+
+
+@task_revoked.connect
+def _revoked(request=None, sender=None, **kwargs):
+    if sender is not None and sender.name in _tracked and request:
+        transition(request.id, states.REVOKED)
@@ -0,0 +1,31 @@
+import json
+import numpy as np
+from django.test import SimpleTestCase
+from musycweb.arrays import pack_array, unpack_array, unpack_arrays
+
+
+class ArrayTests(SimpleTestCase):
+    def test_round_trip(self):
+        for values in ([], [0.5, np.nan, -np.inf], [1.0] * 1000):
+            with self.subTest(size=len(values)):
+                packed = json.loads(json.dumps(pack_array(values)))
+                np.testing.assert_array_equal(unpack_array(packed), values)
+
+    def test_compression(self):
+        self.assertTrue(pack_array([1.0] * 1000).get('zlib'))
+        self.assertNotIn('zlib', pack_array([0.25]))
+
+    def test_dtype(self):
+        values = unpack_array(pack_array([1, 2, 3], dtype='<i4'))
+        self.assertEqual(values.dtype, np.dtype('<i4'))
+        values[0] = 0  # writable
+        np.testing.assert_array_equal(values, [0, 2, 3])
+
+    def test_plain_list(self):
+        np.testing.assert_array_equal(unpack_array([1.0, 2.0]), [1.0, 2.0])
+
+    def test_unpack_arrays(self):
+        d = unpack_arrays({'d1': pack_array([1.0]), 'd2': [2.0], 'x': 3})
+        np.testing.assert_array_equal(d['d1'], [1.0])
+        np.testing.assert_array_equal(d['d2'], [2.0])
+        self.assertEqual(d['x'], 3)
@@ -0,0 +1,33 @@
+import numpy as np
+from django.test import SimpleTestCase
+from musycweb.convergence import diagnostics, interval, rhat
+
+
+class RhatTests(SimpleTestCase):
+    def test_converged(self):
+        self.assertAlmostEqual(rhat([1.0, 1.01], [0.5, 0.5], 1000), 1.0,
+                               places=2)
+
+    def test_diverged(self):
+        self.assertGreater(rhat([0.0, 10.0], [0.5, 0.5], 1000), 1.1)
+
+    def test_zero_sd(self):
+        self.assertEqual(rhat([1.0, 1.0], [0.0, 0.0], 100), 1.0)
+        self.assertEqual(rhat([1.0, 2.0], [0.0, 0.0], 100), np.inf)
+
+
+class DiagnosticsTests(SimpleTestCase):
+    def test_interval(self):
+        self.assertEqual(interval([1, 2]), (1.0, 2.0))
+        self.assertEqual(interval('[-1.5e-1 2.0]'), (-0.15, 2.0))
+        self.assertIsNone(interval('[nan 2.0]'))
+        self.assertIsNone(interval([2, 1]))
+        self.assertIsNone(interval(None))
+
+    def test_diagnostics(self):
+        runs = [{'beta': 0.1, 'beta_ci': '[0.0 0.2]',
+                 'E0': 1.0, 'E0_ci': 'nan'},
+                {'beta': 0.1, 'beta_ci': [0.0, 0.2]}]
+        result = diagnostics(runs, 1000)
+        self.assertEqual(set(result), {'beta'})
+        self.assertAlmostEqual(result['beta'], 1.0, places=2)
@@ -0,0 +1,42 @@
+from django.test import SimpleTestCase, override_settings
+from musycweb import estimator
+from musycweb.estimator import MIN_SAMPLES, RuntimeModel
+
+
+@override_settings(RUNTIME_ESTIMATE_DEFAULT=7.0,
+                   RUNTIME_LIMIT_FACTOR=20,
+                   RUNTIME_LIMIT_MIN=3600,
+                   CELERY_TASK_SOFT_TIME_LIMIT=86400)
+class RuntimeModelTests(SimpleTestCase):
+    def test_power_law(self):
+        samples = [('a', n, 0.01 * n ** 2)
+                   for n in range(10, 10 + MIN_SAMPLES)]
+        model = RuntimeModel(samples)
+        self.assertEqual(model.num_samples, MIN_SAMPLES)
+        self.assertAlmostEqual(model.predict('a', 100), 100.0, places=6)
+
+    def test_fallback(self):
+        samples = [('a', 10, 1.0)] * MIN_SAMPLES + [('b', 10, 3.0)]
+        model = RuntimeModel(samples)
+        self.assertIn('a', model.groups)
+        self.assertNotIn('b', model.groups)
+        # Groups with too few samples use the model of all samples
+        self.assertAlmostEqual(model.predict('b', 10),
+                               model.predict('c', 10))
+
+    def test_no_history(self):
+        model = RuntimeModel([('a', 10, 1.0)])
+        self.assertIsNone(model.predict('a', 10))
+        self.assertEqual(estimator.expected(model.predict('a', 10)), 7.0)
+
+    def test_time_limit(self):
+        self.assertEqual(estimator.time_limit(None), 86400)
+        self.assertEqual(estimator.time_limit(1.0), 3600)
+        self.assertEqual(estimator.time_limit(1000.0), 20000)
+        self.assertEqual(estimator.time_limit(10000.0), 86400)
+
+    def test_dataset_progress(self):
+        fraction, remaining = estimator.dataset_progress(
+            [(10.0, 1.0, 0.0), (None, None, None), (3.0, 0.0, 3.0)])
+        self.assertAlmostEqual(fraction, 0.5)
+        self.assertGreater(remaining, 0)
@@ -0,0 +1,77 @@
+import gzip
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from django_celery_results.models import states
+from musycweb import export, taskstatus
+from musycweb.models import Dataset
+from .test_partition import DEMO_DATASET
+from .utils import CSV, MediaRootMixin, make_dataset, make_task, make_user
+
+
+class ExportTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        self.client.force_login(self.user)
+        self.dataset = make_dataset(self.user, csv=CSV)
+        make_task(self.dataset, 'a', 'b', status=states.SUCCESS)
+        make_task(self.dataset, 'a', 'c', status=states.SUCCESS)
+        make_task(self.dataset, 'b', 'c', status=states.FAILURE,
+                  task_result={'exc_type': 'ValueError',
+                               'exc_message': ['Fit failed']})
+        taskstatus.sync(self.dataset)
+
+    def saved_export(self):
+        self.dataset.refresh_from_db()
+        with self.dataset.export_file.open('rb') as f:
+            return gzip.decompress(f.read()).decode()
+
+    def download(self, **params):
+        response = self.client.get(
+            reverse('ajax_dataset_csv', args=(self.dataset.pk, )), params)
+        return b''.join(response.streaming_content)
+
+    def test_fits_finished(self):
+        self.assertTrue(export.fits_finished(self.dataset.pk))
+        self.assertTrue(export.is_complete(self.dataset))
+        make_task(self.dataset, 'a', 'd')
+        taskstatus.sync(self.dataset)
+        self.assertFalse(export.fits_finished(self.dataset.pk))
+        self.assertFalse(export.materialise(self.dataset.pk))
+
+    def test_materialised_matches_streamed(self):
+        streamed = self.download().decode()
+        self.assertEqual(len(streamed.splitlines()), 4)
+        self.assertEqual(streamed, ''.join(export.csv_lines(self.dataset)))
+
+        self.assertTrue(export.materialise(self.dataset.pk))
+        self.assertEqual(self.saved_export(), streamed)
+        # Already saved
+        self.assertFalse(export.materialise(self.dataset.pk))
+        self.assertEqual(gzip.decompress(self.download(gzip=1)).decode(),
+                         streamed)
+
+    def test_replaced_file_invalidates(self):
+        self.assertTrue(export.materialise(self.dataset.pk))
+        self.dataset.refresh_from_db()
+        export_name = self.dataset.export_file.name
+        storage = self.dataset.export_file.storage
+
+        with open(DEMO_DATASET, 'rb') as f:
+            upload = SimpleUploadedFile('demo.csv', f.read())
+        with mock.patch('musycweb.views.prepare_dataset') as prepare_dataset:
+            response = self.client.post(
+                reverse('ajax_replace_dataset_file',
+                        args=(self.dataset.pk, )), {'file': upload})
+        self.assertEqual(response.json()['status'], 'success')
+        prepare_dataset.apply_async.assert_called_once()
+
+        self.dataset.refresh_from_db()
+        self.assertFalse(self.dataset.export_file)
+        self.assertFalse(storage.exists(export_name))
+        self.assertFalse(export.is_complete(self.dataset))
+        # Not saved again until the dataset has been prepared
+        self.assertFalse(export.materialise(self.dataset.pk))
+        self.assertFalse(Dataset.objects.get(pk=self.dataset.pk).export_file)
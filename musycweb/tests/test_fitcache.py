@@ -0,0 +1,143 @@
+import json
+from unittest import mock
+import numpy as np
+from celery.utils import uuid
+from django.test import SimpleTestCase, TestCase, override_settings
+from django_celery_results.models import TaskResult, states
+from musycweb import fitcache, tasks
+from musycweb.arrays import pack_array
+from musycweb.models import DatasetTask, FitCacheEntry, FitCacheStats, \
+    FitResult
+from .utils import make_dataset, make_user, result
+
+
+def _inputs(**values):
+    inputs = dict(d1=np.array([0.0, 1.0]), d2=np.array([1.0, 0.0]),
+                  dip=np.array([0.5, 0.6]), dip_sd=np.array([0.1, 0.1]),
+                  E_fix=None, E_bnd=None, fit_alg='nlls_mcnlls')
+    inputs.update(values)
+    return inputs
+
+
+class CodeVersionMixin(object):
+    def setUp(self):
+        super().setUp()
+        version_settings = override_settings(MUSYC_CODE_VERSION='test')
+        version_settings.enable()
+        self.addCleanup(version_settings.disable)
+        fitcache.musyc_code_version.cache_clear()
+        self.addCleanup(fitcache.musyc_code_version.cache_clear)
+
+
+class FingerprintTests(CodeVersionMixin, SimpleTestCase):
+    def test_array_encodings(self):
+        # Fingerprints are the same for arrays as sent in task messages
+        # (packed, after a JSON round trip), ndarrays and lists
+        arrays = _inputs()
+        packed = dict(arrays, **{k: pack_array(arrays[k])
+                                 for k in ('d1', 'd2', 'dip', 'dip_sd')})
+        fingerprint = fitcache.fit_fingerprint(arrays)
+        for inputs in (packed, json.loads(json.dumps(packed)),
+                       {k: v.tolist() if isinstance(v, np.ndarray) else v
+                        for k, v in arrays.items()}):
+            self.assertEqual(fitcache.fit_fingerprint(inputs), fingerprint)
+
+    def test_inputs_change(self):
+        fingerprint = fitcache.fit_fingerprint(_inputs())
+        for changed in (_inputs(dip=np.array([0.5, 0.7])),
+                        _inputs(E_fix=[1.0, 0.0, 0.0, 0.0]),
+                        _inputs(fit_alg='nlls')):
+            self.assertNotEqual(fitcache.fit_fingerprint(changed),
+                                fingerprint)
+
+    def test_code_version(self):
+        fingerprint = fitcache.fit_fingerprint(_inputs())
+        fitcache.musyc_code_version.cache_clear()
+        with override_settings(MUSYC_CODE_VERSION='other'):
+            self.assertNotEqual(fitcache.fit_fingerprint(_inputs()),
+                                fingerprint)
+
+
+@override_settings(FIT_CACHE_ENABLED=True)
+class FitCacheTests(TestCase):
+    def stats(self):
+        stats = FitCacheStats.objects.filter(pk=1).first()
+        return (stats.hits, stats.misses) if stats else (0, 0)
+
+    def test_lookup(self):
+        fitcache.store('a', {'beta': 0.1})
+        self.assertEqual(fitcache.lookup(['a', 'b']), {'a': {'beta': 0.1}})
+        self.assertEqual(self.stats(), (1, 1))
+        self.assertEqual(FitCacheEntry.objects.get(pk='a').hits, 1)
+
+    def test_get_without_count(self):
+        fitcache.store('a', {'beta': 0.1})
+        self.assertEqual(fitcache.get('a', count=False), {'beta': 0.1})
+        self.assertIsNone(fitcache.get('b', count=False))
+        self.assertEqual(self.stats(), (0, 0))
+
+    def test_store_replaces(self):
+        fitcache.store('a', {'beta': 0.1})
+        fitcache.store('a', {'beta': 0.2})
+        self.assertEqual(fitcache.get('a'), {'beta': 0.2})
+
+    @override_settings(FIT_CACHE_ENABLED=False)
+    def test_disabled(self):
+        fitcache.store('a', {'beta': 0.1})
+        self.assertFalse(FitCacheEntry.objects.exists())
+        self.assertEqual(fitcache.lookup(['a']), {})
+        self.assertEqual(self.stats(), (0, 0))
+
+
+@override_settings(FIT_CACHE_ENABLED=True)
+class SubmitTasksTests(TestCase):
+    def setUp(self):
+        self.dataset = make_dataset(make_user())
+
+    def pending(self, fingerprint, drug1_units=('uM', )):
+        task = DatasetTask(dataset=self.dataset, drug1='a', drug2='b',
+                           sample='s', task_id=uuid(),
+                           fingerprint=fingerprint)
+        kwargs = dict(batch=None, expt='Test dataset',
+                      drug1_units=list(drug1_units), drug2_units=['uM'],
+                      expt_date=['2020-01-01'])
+        return task, kwargs
+
+    def test_reuse(self):
+        cached = result()
+        del cached['expt']
+        fitcache.store('a', cached)
+        task, _ = pending = self.pending('a')
+
+        with mock.patch.object(tasks.fit_drug_combination,
+                               'apply_async') as apply_async:
+            self.assertEqual(tasks._submit_tasks([pending], None, None), 1)
+        apply_async.assert_not_called()
+
+        task_result = TaskResult.objects.get(task_id=task.task_id)
+        self.assertEqual(task_result.status, states.SUCCESS)
+        self.assertEqual(json.loads(task_result.result)['expt'],
+                         'Test dataset')
+        fit_result = FitResult.objects.get(dataset_task__task_id=task.task_id)
+        self.assertEqual(fit_result.beta, 0.1)
+        self.assertEqual(fit_result.drug1_units, 'uM')
+
+    def test_miss(self):
+        task, _ = pending = self.pending('a')
+        with mock.patch.object(tasks.fit_drug_combination,
+                               'apply_async') as apply_async:
+            self.assertEqual(tasks._submit_tasks([pending], None, None), 1)
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args[1]['task_id'], task.task_id)
+        self.assertFalse(TaskResult.objects.exists())
+        self.assertEqual(FitCacheStats.objects.get().misses, 1)
+
+    def test_mixed_units_not_reused(self):
+        # Mixed units are reported by the task, so it isn't skipped
+        fitcache.store('a', result())
+        pending = self.pending('a', drug1_units=('uM', 'nM'))
+        with mock.patch.object(tasks.fit_drug_combination,
+                               'apply_async') as apply_async:
+            tasks._submit_tasks([pending], None, None)
+        apply_async.assert_called_once()
+        self.assertFalse(TaskResult.objects.exists())
@@ -0,0 +1,136 @@
+import itertools
+import os
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+from musycweb.partition import CombinationPartitioner, fit_arrays
+
+DEMO_DATASET = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'static', 'musyc_demo_dataset.csv')
+SET_FIELDS = ('drug1_units', 'drug2_units', 'expt_date')
+
+
+def _normalise(data):
+    """ process_dataset's drug order canonicalisation and SD column """
+    data = data.copy()
+    out_of_order = data['drug1'] > data['drug2']
+    cols1 = ['drug1', 'drug1.conc', 'drug1.units']
+    cols2 = ['drug2', 'drug2.conc', 'drug2.units']
+    data.loc[out_of_order, cols1 + cols2] = \
+        data.loc[out_of_order, cols2 + cols1].values
+    data['effect.sd'] = data['effect.95ci'] / (2 * 1.96)
+    return data
+
+
+def _swap_drug1_drug2(data):
+    return data.rename(columns={
+        'drug1': 'drug2',
+        'drug2': 'drug1',
+        'drug1.conc': 'drug2.conc',
+        'drug2.conc': 'drug1.conc',
+        'drug1.units': 'drug2.units',
+        'drug2.units': 'drug1.units'
+    })
+
+
+def legacy_partition(data, use_batches):
+    """ Combination splitting as previously done inline in process_dataset,
+    by filtering the dataset for each combination """
+    data_ctrl = data.loc[(data['drug1.conc'] == 0) & (data['drug2.conc'] == 0)]
+    data_sa_1 = data.loc[(data['drug1.conc'] == 0) & (data['drug2.conc'] != 0)]
+    data_sa_2 = data.loc[(data['drug1.conc'] != 0) & (data['drug2.conc'] == 0)]
+    data_expt = data.loc[(data['drug1.conc'] != 0) & (data['drug2.conc'] != 0)]
+
+    def lfrom(lists, attr):
+        return list(itertools.chain(*(l[attr].array for l in lists)))
+
+    def sfrom(lists, attr):
+        return sorted(set(itertools.chain(*(l[attr].array for l in lists))))
+
+    outer_grouping = ['batch', 'sample'] if use_batches else ['sample']
+    for bat_smp, samp_grp in data_expt.groupby(outer_grouping, sort=False):
+        if use_batches:
+            batch, sample = bat_smp
+            in_outer = [(d['batch'] == batch) & (d['sample'] == sample)
+                        for d in (data_ctrl, data_sa_1, data_sa_2)]
+        else:
+            sample = bat_smp[0] if isinstance(bat_smp, tuple) else bat_smp
+            batch = None
+            in_outer = [d['sample'] == sample
+                        for d in (data_ctrl, data_sa_1, data_sa_2)]
+        data_ctrl_s, data_sa_1_s, data_sa_2_s = (
+            d.loc[mask] for d, mask in
+            zip((data_ctrl, data_sa_1, data_sa_2), in_outer))
+
+        for (drug1, drug2), grp_dat in samp_grp.groupby(
+                ['drug1', 'drug2'], sort=False):
+            df_list = [
+                grp_dat,
+                data_ctrl_s,
+                data_sa_1_s.loc[data_sa_1_s['drug2'] == drug2],
+                data_sa_2_s.loc[data_sa_2_s['drug1'] == drug1],
+                _swap_drug1_drug2(
+                    data_sa_1_s.loc[data_sa_1_s['drug2'] == drug1]),
+                _swap_drug1_drug2(
+                    data_sa_2_s.loc[data_sa_2_s['drug1'] == drug2])
+            ]
+            yield (batch, sample, drug1, drug2), dict(
+                d1=lfrom(df_list, 'drug1.conc'),
+                d2=lfrom(df_list, 'drug2.conc'),
+                dip=lfrom(df_list, 'effect'),
+                dip_sd=lfrom(df_list, 'effect.sd'),
+                drug1_units=sfrom(df_list, 'drug1.units'),
+                drug2_units=sfrom(df_list, 'drug2.units'),
+                expt_date=sfrom(df_list, 'expt.date')
+            )
+
+
+def indexed_partition(data, use_batches):
+    partitions = CombinationPartitioner(data, use_batches)
+    for key in partitions:
+        fit_data = partitions.fit_data(*key)
+        yield key, {k: sorted(v) if k in SET_FIELDS else list(v)
+                    for k, v in fit_data.items()}
+
+
+class CombinationPartitionerTests(SimpleTestCase):
+    def setUp(self):
+        self.data = _normalise(pd.read_csv(DEMO_DATASET,
+                                           dtype={'batch': str}))
+
+    def test_matches_legacy_filtering(self):
+        for use_batches in (False, True):
+            with self.subTest(use_batches=use_batches):
+                self.assertEqual(
+                    list(indexed_partition(self.data, use_batches)),
+                    list(legacy_partition(self.data, use_batches)))
+
+    def test_single_agents_swapped(self):
+        # Single agent rows with the drug in the drug2 column are swapped
+        data = _normalise(pd.DataFrame({
+            'drug1': ['a', 'a', 'a', 'a', 'b', 'b'],
+            'drug2': ['b', 'b', 'b', 'b', 'c', 'c'],
+            'drug1.conc': [0.0, 1.0, 0.0, 2.0, 1.0, 0.0],
+            'drug2.conc': [0.0, 0.0, 3.0, 4.0, 1.0, 2.0],
+            'effect': [1.0, 0.9, 0.8, 0.5, 0.6, 0.7],
+            'effect.95ci': [0.1] * 6,
+            'sample': ['s'] * 6,
+            'drug1.units': ['uM'] * 6,
+            'drug2.units': ['uM'] * 6,
+            'expt.date': ['2020-01-01'] * 6
+        }))
+        partitions = CombinationPartitioner(data, False)
+        self.assertEqual(list(partitions.fit_data(None, 's', 'b', 'c')['d1']),
+                         [1.0, 0.0, 0.0, 3.0])
+        self.assertEqual(list(indexed_partition(data, False)),
+                         list(legacy_partition(data, False)))
+
+    def test_row_refs(self):
+        partitions = CombinationPartitioner(self.data, False)
+        self.assertGreater(len(partitions), 0)
+        for key in partitions:
+            fit_data = partitions.fit_data(*key)
+            arrays = fit_arrays(self.data, partitions.row_refs(*key))
+            for k, values in arrays.items():
+                np.testing.assert_array_equal(values, fit_data[k])
@@ -0,0 +1,81 @@
+from django.test import TestCase
+from django_celery_results.models import TaskResult, states
+from musycweb import taskstatus
+from musycweb.models import DatasetTask
+from .utils import make_dataset, make_task, make_user
+
+
+class TaskStatusTests(TestCase):
+    def setUp(self):
+        self.dataset = make_dataset(make_user())
+
+    def counts(self):
+        return {g: n for g, (n, _) in
+                taskstatus.counts(self.dataset).items()}
+
+    def state(self, task):
+        return DatasetTask.objects.get(pk=task.pk).state
+
+    def test_transition(self):
+        task = make_task(self.dataset)
+        taskstatus.sync(self.dataset)
+        self.assertEqual(self.counts(), {'queued': 1, 'started': 0,
+                                         'success': 0, 'failure': 0})
+
+        taskstatus.transition(task.task_id, states.STARTED)
+        self.assertEqual(self.state(task), states.STARTED)
+        self.assertEqual(self.counts(), {'queued': 0, 'started': 1,
+                                         'success': 0, 'failure': 0})
+
+        # Unchanged, then within the same group
+        taskstatus.transition(task.task_id, states.STARTED)
+        taskstatus.transition(task.task_id, states.RETRY)
+        self.assertEqual(self.state(task), states.RETRY)
+        self.assertEqual(self.counts(), {'queued': 0, 'started': 1,
+                                         'success': 0, 'failure': 0})
+
+        taskstatus.transition(task.task_id, states.SUCCESS)
+        self.assertEqual(self.counts(), {'queued': 0, 'started': 0,
+                                         'success': 1, 'failure': 0})
+
+    def test_transition_unknown_task(self):
+        taskstatus.transition('unknown', states.STARTED)
+        self.assertEqual(sum(self.counts().values()), 0)
+
+    def test_sync(self):
+        make_task(self.dataset, 'a', 'b', status=states.SUCCESS)
+        make_task(self.dataset, 'a', 'c', status=states.SUCCESS)
+        failed = make_task(self.dataset, 'b', 'c', status=states.FAILURE,
+                           task_result={'exc_type': 'ValueError'})
+        make_task(self.dataset, 'b', 'd')
+        taskstatus.sync(self.dataset)
+        self.assertEqual(self.state(failed), states.FAILURE)
+        self.assertEqual(self.counts(), {'queued': 1, 'started': 0,
+                                         'success': 2, 'failure': 1})
+
+        # Removed tasks are recounted
+        TaskResult.objects.filter(task_id=failed.task_id).delete()
+        failed.delete()
+        taskstatus.sync(self.dataset)
+        self.assertEqual(self.counts(), {'queued': 1, 'started': 0,
+                                         'success': 2, 'failure': 0})
+
+    def test_sync_keeps_started(self):
+        # Started tasks have no TaskResult until they finish
+        started = make_task(self.dataset)
+        revoked = make_task(self.dataset, 'a', 'c')
+        taskstatus.transition(started.task_id, states.STARTED)
+        taskstatus.transition(revoked.task_id, states.REVOKED)
+        taskstatus.sync(self.dataset)
+        self.assertEqual(self.state(started), states.STARTED)
+        self.assertEqual(self.state(revoked), states.REVOKED)
+        self.assertEqual(self.counts(), {'queued': 0, 'started': 1,
+                                         'success': 0, 'failure': 1})
+
+        # Then follow their TaskResult
+        TaskResult.objects.create(task_id=started.task_id,
+                                  status=states.FAILURE)
+        taskstatus.sync(self.dataset)
+        self.assertEqual(self.state(started), states.FAILURE)
+        self.assertEqual(self.counts(), {'queued': 0, 'started': 0,
+                                         'success': 0, 'failure': 2})
@@ -0,0 +1,86 @@
+import io
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+from musycweb.ingest import validate_dataset
+from musycweb.validation import ValidationReport, validate_chunk
+
+
+def _chunk(**columns):
+    """ A dataset chunk of valid rows, with the given columns replaced """
+    n = len(next(iter(columns.values()))) if columns else 3
+    chunk = pd.DataFrame({
+        'drug1': ['a'] * n,
+        'drug2': ['b'] * n,
+        'sample': ['s'] * n,
+        'drug1.units': ['uM'] * n,
+        'drug2.units': ['uM'] * n,
+        'drug1.conc': [1.0] * n,
+        'drug2.conc': [1.0] * n,
+        'effect': [0.5] * n,
+    })
+    for column, values in columns.items():
+        chunk[column] = values
+    return chunk
+
+
+class ValidateChunkTests(SimpleTestCase):
+    def validate(self, chunk, use_batches=False):
+        report = ValidationReport()
+        validate_chunk(chunk, use_batches, report)
+        return report
+
+    def test_valid(self):
+        report = self.validate(_chunk(**{'effect.95ci': [1.0, 2.0, 3.0]}))
+        self.assertTrue(report.is_valid)
+        self.assertEqual(report.rows_checked, 3)
+
+    def test_ci_rules(self):
+        report = self.validate(_chunk(**{'effect.95ci': [1.0, np.nan, 0.0]}))
+        self.assertEqual(report.rows, {'ci_missing': [3],
+                                       'ci_nonpositive': [4]})
+
+    def test_ci_rules_skip_missing_effect(self):
+        # Rows without an effect are dropped, so their CI doesn't matter
+        report = self.validate(_chunk(**{
+            'effect': [0.5, np.nan, np.nan],
+            'effect.95ci': [1.0, np.nan, 0.0]
+        }))
+        self.assertTrue(report.is_valid)
+
+    def test_not_numeric(self):
+        report = self.validate(_chunk(effect=['0.5', 'x', None]))
+        self.assertEqual(report.rows, {'not_numeric': [3]})
+
+    def test_negative_conc(self):
+        report = self.validate(_chunk(**{'drug2.conc': [1.0, -1.0, 0.0]}))
+        self.assertEqual(report.rows, {'negative_conc': [3]})
+
+    def test_string_rules(self):
+        report = self.validate(_chunk(sample=['s', 's,1', 's-1']))
+        self.assertEqual(report.rows, {'sample_commas': [3],
+                                       'sample_special': [3, 4]})
+
+    def test_batch_empty(self):
+        report = self.validate(_chunk(batch=['1', ' ', None]),
+                               use_batches=True)
+        self.assertEqual(report.rows, {'batch_empty': [3, 4]})
+
+
+
+class ValidateDatasetTests(SimpleTestCase):
+    CSV = ('drug1.conc,drug2.conc,effect,drug1,drug2,sample,expt.date,'
+           'drug1.units,drug2.units\n' +
+           '1,1,0.5,a,b,s,2020-01-01,uM,uM\n' * 3 +
+           '-1,1,0.5,a,b,s,2020-01-01,uM,uM\n')
+
+    def test_all_rows(self):
+        report = validate_dataset(io.StringIO(self.CSV), chunksize=2)
+        self.assertEqual(report.rows, {'negative_conc': [5]})
+        self.assertEqual(report.rows_checked, 4)
+
+    def test_first_rows(self):
+        report = validate_dataset(io.StringIO(self.CSV), chunksize=2,
+                                  nrows=2)
+        self.assertTrue(report.is_valid)
+        self.assertEqual(report.rows_checked, 2)
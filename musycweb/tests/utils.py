@@ -0,0 +1,72 @@
+""" Shared test fixtures """
+import json
+import shutil
+import tempfile
+from celery.utils import uuid
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from django.utils import timezone
+from django_celery_results.models import TaskResult, states
+from musycweb import fitresults
+from musycweb.models import Dataset, DatasetTask
+
+CSV = ('drug1.conc,drug2.conc,effect,drug1,drug2,sample,expt.date,'
+       'drug1.units,drug2.units\n'
+       '0,0,1.0,a,b,s,2020-01-01,uM,uM\n'
+       '1,0,0.8,a,b,s,2020-01-01,uM,uM\n'
+       '0,1,0.7,a,b,s,2020-01-01,uM,uM\n'
+       '1,1,0.4,a,b,s,2020-01-01,uM,uM\n').encode()
+
+
+class MediaRootMixin(object):
+    """ Saves files in a temporary MEDIA_ROOT, removed after each test """
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, True)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+
+def make_user(email='user@example.com'):
+    return get_user_model().objects.create_user(email, 'password')
+
+
+def make_dataset(owner, name='Test dataset', csv=None):
+    """ A dataset, with an uploaded file if csv (bytes) is given """
+    dataset = Dataset(owner=owner, name=name)
+    if csv is not None:
+        dataset.file.save('test.csv', ContentFile(csv), save=False)
+    dataset.save()
+    return dataset
+
+
+def result(drug1='a', drug2='b', sample='s', **values):
+    """ A successful fit_drug_combination result dict """
+    return dict(drug1_name=drug1, drug2_name=drug2, sample=sample,
+                expt='Test dataset', batch=None, drug1_units='uM',
+                drug2_units='uM', metric_name='Percent effect',
+                fit_method='nlls_mcnlls', beta=0.1, beta_ci='[0.0 0.2]',
+                E0=1.0, E0_ci='[0.9 1.1]', **values)
+
+
+def make_task(dataset, drug1='a', drug2='b', sample='s', status=None,
+              task_result=None):
+    """ A DatasetTask, with a TaskResult if status is given
+
+    Successful tasks get a FitResult too, from task_result (see result).
+    """
+    task = DatasetTask.objects.create(
+        dataset=dataset, drug1=drug1, drug2=drug2, sample=sample,
+        task_id=uuid())
+    if status is not None:
+        if task_result is None and status == states.SUCCESS:
+            task_result = result(drug1, drug2, sample)
+        TaskResult.objects.create(
+            task_id=task.task_id, status=status,
+            result=json.dumps(task_result), date_done=timezone.now())
+        if status == states.SUCCESS:
+            fitresults.save(task.task_id, task_result)
+    return task
@@ -9,10 +9,14 @@ urlpatterns = [
     path('terms', views.terms, name='terms'),
     path('account', views.account, name='account'),
     path('upload', views.create_dataset, name='create_dataset'),
+    path('upload/estimate', views.dry_run_dataset, name='ajax_dry_run_dataset'),
     path('dataset/<int:dataset_id>', views.view_dataset, name='view_dataset'),
+    path('dataset/<int:dataset_id>/preparation', views.ajax_dataset_preparation, name='ajax_dataset_preparation'),
     path('dataset/<int:dataset_id>/delete', views.delete_dataset, name='ajax_delete_dataset'),
     path('dataset/<int:dataset_id>/rename', views.rename_dataset, name='ajax_rename_dataset'),
+    path('dataset/<int:dataset_id>/replace', views.replace_dataset_file, name='ajax_replace_dataset_file'),
     path('dataset/<int:dataset_id>/csv', views.ajax_dataset_csv, name='ajax_dataset_csv'),
+    path('datasets/export.<str:fmt>', views.ajax_datasets_export, name='ajax_datasets_export'),
     path('task/<uuid:task_id>', views.view_task, name='view_task'),
     path('task/<uuid:task_id>/csv', views.ajax_task_csv, name='ajax_task_csv'),
     path('task/<uuid:task_id>/surfaceplot', views.ajax_surface_plot, name='ajax_surface_plot'),
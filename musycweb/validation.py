@@ -0,0 +1,150 @@
+""" Row-level validation of uploaded datasets
+
+All rules are checked in a single pass over each chunk, and every
+violation is collected, with row numbers, instead of stopping at the first
+failure. String rules are evaluated once per unique value in a column, then
+mapped back to rows, so their cost depends on the number of distinct drug,
+sample and unit names rather than on the number of rows.
+
+Row numbers are as shown in a spreadsheet, i.e. the header is row 1.
+"""
+import re
+import time
+import numpy as np
+import pandas as pd
+
+# Rule name, message
+RULES = (
+    ('drug_commas', 'Drug name should not contain commas'),
+    ('sample_commas', 'Sample name should not contain commas'),
+    ('units_special', 'Drug units should not contain special characters'),
+    ('sample_special', 'Sample name should not contain special characters'),
+    ('not_numeric', 'Non-numeric values in numeric columns'),
+    ('negative_conc', 'Drug concentrations cannot be negative'),
+    ('batch_empty', 'Batch column should not contain empty values'),
+    ('ci_missing', 'effect.95ci column cannot contain blank/NA values'),
+    ('ci_nonpositive', 'effect.95ci column cannot contain zero or negative '
+                       'values'),
+)
+
+_COMMA = re.compile(',')
+_SPECIAL = re.compile('[^0-9a-zA-Z_]')
+
+# Column: [(rule, pattern)], for patterns which must not match any value
+STRING_RULES = {
+    'drug1': [('drug_commas', _COMMA)],
+    'drug2': [('drug_commas', _COMMA)],
+    'sample': [('sample_commas', _COMMA), ('sample_special', _SPECIAL)],
+    'drug1.units': [('units_special', _SPECIAL)],
+    'drug2.units': [('units_special', _SPECIAL)],
+}
+NUMERIC_COLUMNS = ('drug1.conc', 'drug2.conc', 'effect', 'effect.95ci')
+
+
+class ValidationReport(object):
+    """ Violations found in a dataset, with up to max_rows rows per rule """
+    def __init__(self, max_rows=10):
+        self.max_rows = max_rows
+        self.counts = {}
+        self.rows = {}
+        self.rows_checked = 0
+        self.elapsed = 0.0
+
+    def clear(self):
+        self.counts.clear()
+        self.rows.clear()
+        self.rows_checked = 0
+        self.elapsed = 0.0
+
+    def add(self, rule, rows):
+        """ Record violations of a rule, at the given row numbers """
+        if not len(rows):
+            return
+        self.counts[rule] = self.counts.get(rule, 0) + len(rows)
+        found = self.rows.setdefault(rule, [])
+        found.extend(int(r) for r in rows[:self.max_rows - len(found)])
+
+    @property
+    def is_valid(self):
+        return not self.counts
+
+    @property
+    def us_per_row(self):
+        """ Validation cost, in microseconds per row """
+        if not self.rows_checked:
+            return 0.0
+        return self.elapsed * 1e6 / self.rows_checked
+
+    def messages(self):
+        """ One message per violated rule, in rule order """
+        messages = []
+        for rule, message in RULES:
+            if rule not in self.counts:
+                continue
+            rows = ', '.join(str(r) for r in sorted(self.rows[rule]))
+            more = self.counts[rule] - len(self.rows[rule])
+            if more:
+                rows += f' and {more} more'
+            label = 'rows' if self.counts[rule] > 1 else 'row'
+            messages.append(f'{message} ({label} {rows})')
+        return messages
+
+    def error_message(self):
+        return '\n'.join(self.messages())
+
+
+def _matching(codes, uniques, pattern):
+    """ Mask of factorized values matching a pattern; missing values don't """
+    unique_matches = np.fromiter(
+        (pattern.search(u) is not None for u in uniques),
+        dtype=bool, count=len(uniques))
+    # Append False, for missing values with code -1
+    return np.append(unique_matches, False)[codes]
+
+
+def validate_chunk(chunk, use_batches, report):
+    """ Check a chunk of rows against every rule, recording violations
+
+    Numeric columns may be read as text, in which case they are converted
+    here, with unconvertible values reported. Returns the chunk, with
+    numeric columns as floats.
+    """
+    start = time.perf_counter()
+    row_numbers = chunk.index.to_numpy() + 2
+
+    def add(rule, mask):
+        report.add(rule, row_numbers[mask])
+
+    for col, rules in STRING_RULES.items():
+        if col not in chunk.columns:
+            continue
+        codes, uniques = pd.factorize(chunk[col])
+        for rule, pattern in rules:
+            add(rule, _matching(codes, uniques, pattern))
+
+    not_numeric = np.zeros(chunk.shape[0], dtype=bool)
+    for col in NUMERIC_COLUMNS:
+        if col in chunk.columns and chunk[col].dtype == object:
+            values = pd.to_numeric(chunk[col], errors='coerce')
+            not_numeric |= (values.isna() & chunk[col].notna()).to_numpy()
+            chunk[col] = values
+    add('not_numeric', not_numeric)
+
+    add('negative_conc', ((chunk['drug1.conc'] < 0) |
+                          (chunk['drug2.conc'] < 0)).to_numpy())
+
+    if use_batches:
+        batch = chunk['batch']
+        add('batch_empty',
+            (batch.isna() | (batch.str.strip() == '')).to_numpy())
+
+    if 'effect.95ci' in chunk.columns:
+        # Rows without an effect are dropped, so their CI isn't checked
+        ci = chunk['effect.95ci']
+        has_effect = chunk['effect'].notna()
+        add('ci_missing', (ci.isna() & has_effect).to_numpy())
+        add('ci_nonpositive', ((ci <= 0) & has_effect).to_numpy())
+
+    report.rows_checked += chunk.shape[0]
+    report.elapsed += time.perf_counter() - start
+    return chunk
@@ -1,19 +1,23 @@
 from django.shortcuts import render, reverse
 from django.http import HttpResponse, HttpResponseRedirect, Http404,\
-    JsonResponse, HttpResponseBadRequest
+    JsonResponse, HttpResponseBadRequest, StreamingHttpResponse, \
+    FileResponse
+from django.db.models import Q, prefetch_related_objects
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from matplotlib.pyplot import scatter
-from .forms import CreateDatasetForm
-from .models import Dataset, DatasetTask
-from .tasks import process_dataset, DataError
+from .forms import CreateDatasetForm, ReplaceDatasetFileForm
+from .models import Dataset, DatasetTask, FitResult
+from .tasks import prepare_dataset, estimate_dataset, queue_export
+from . import export, fitresults, taskstatus
+from .ingest import DataError
 from django.contrib import messages
+from django.conf import settings
 from django_celery_results.models import TaskResult
 from django.template.context_processors import csrf
 from musyc_code.SynergyCalculator.doseResponseSurfPlot import \
     plotDoseResponseSurf
 from crispy_forms.utils import render_crispy_form
-import numpy as np
 import plotly.offline
 from plotly.utils import PlotlyJSONEncoder
 from plotly.offline.offline import get_plotlyjs
@@ -21,6 +25,9 @@ from django.utils.html import escape
 from django.utils.html import strip_tags
 import re
 import json
+import zlib
+import datetime
+import os
 # New plots
 from .drugComboBar import combo_bar
 from .singleDrugBar import single_bar
@@ -90,31 +97,37 @@ def _create_dataset_response(request, form):
         })
 
 
+def _dataset_from_form(request, form):
+    return Dataset(
+        owner=request.user,
+        name=form.cleaned_data['name'],
+        file=form.cleaned_data['file'],
+        orientation=form.cleaned_data['orientation'],
+        metric_name=form.cleaned_data['metric_name'],
+        fit_mode=form.cleaned_data['fit_mode'],
+        e0_lower=form.cleaned_data['e0_lower_bound'],
+        e0_upper=form.cleaned_data['e0_upper_bound'],
+        emax_lower=form.cleaned_data['emax_lower_bound'],
+        emax_upper=form.cleaned_data['emax_upper_bound']
+    )
+
+
 @login_required
 def create_dataset(request):
     if request.method == 'POST':
         form = CreateDatasetForm(request.POST, request.FILES)
         if form.is_valid():
-            d = Dataset(
-                owner=request.user,
-                name=form.cleaned_data['name'],
-                file=form.cleaned_data['file'],
-                orientation=form.cleaned_data['orientation'],
-                metric_name=form.cleaned_data['metric_name'],
-                e0_lower=form.cleaned_data['e0_lower_bound'],
-                e0_upper=form.cleaned_data['e0_upper_bound'],
-                emax_lower=form.cleaned_data['emax_lower_bound'],
-                emax_upper=form.cleaned_data['emax_upper_bound']
-            )
+            d = _dataset_from_form(request, form)
+            d.preparation_status = 'preparing'
+            d.preparation_progress = 0.0
             d.save()
 
-            # Fire off the fitting tasks
-            try:
-                process_dataset(d, request=request)
-            except DataError as e:
-                form.add_error('file', e)
-                d.delete()
-                return _create_dataset_response(request, form)
+            # Validate and split the dataset, and fire off the fitting
+            # tasks, in the background
+            prepare_dataset.apply_async(
+                args=(d.id, ),
+                priority=settings.CELERY_PREPARE_PRIORITY
+            )
 
             # Success
             if 'ajax' in request.GET:
@@ -129,6 +142,26 @@ def create_dataset(request):
     return _create_dataset_response(request, form)
 
 
+@login_required
+def dry_run_dataset(request):
+    """ Estimate the fitting cost of an upload, without creating it """
+    if request.method != 'POST':
+        return HttpResponseBadRequest()
+    form = CreateDatasetForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({
+            'success': False,
+            'errors': {f: list(e) for f, e in form.errors.items()}
+        })
+
+    try:
+        estimate = estimate_dataset(_dataset_from_form(request, form))
+    except DataError as e:
+        return JsonResponse({'success': False, 'errors': {'file': [str(e)]}})
+
+    return JsonResponse({'success': True, **estimate})
+
+
 @login_required
 def view_dataset(request, dataset_id):
     try:
@@ -139,7 +172,23 @@ def view_dataset(request, dataset_id):
     if d.owner_id != request.user.id and not request.user.is_staff:
         raise Http404()
     
-    return render(request, 'dataset.html', {'d': d})
+    return render(request, 'dataset.html', {
+        'd': d,
+        'preparation': d.preparation_dict
+    })
+
+
+@login_required
+def ajax_dataset_preparation(request, dataset_id):
+    try:
+        d = Dataset.objects.get(id=dataset_id, deleted_date=None)
+    except Dataset.DoesNotExist:
+        raise Http404()
+
+    if d.owner_id != request.user.id and not request.user.is_staff:
+        raise Http404()
+
+    return JsonResponse(d.preparation_dict)
 
 
 @login_required
@@ -156,6 +205,7 @@ def delete_dataset(request, dataset_id):
 
     d.deleted_date = timezone.now()
     d.save()
+    export.invalidate(d)
 
     messages.success(request, f'Dataset "{d.name}" was deleted')
     return JsonResponse({'status': 'success', 'dataset_id': dataset_id})
@@ -178,13 +228,127 @@ def rename_dataset(request, dataset_id):
 
     d.name = request.POST['dataset-name']
     d.save()
+    # The export includes the dataset name
+    export.invalidate(d)
+    queue_export(d)
 
     return JsonResponse({'status': 'success', 'dataset_id': dataset_id,
                          'dataset_name': d.name})
 
 
+@login_required
+def replace_dataset_file(request, dataset_id):
+    if request.method != 'POST':
+        return HttpResponseBadRequest()
+    d = Dataset.objects.filter(id=dataset_id, deleted_date=None)
+    if not request.user.is_staff:
+        d = d.filter(owner_id=request.user.id)
+    try:
+        d = d.get()
+    except Dataset.DoesNotExist:
+        raise Http404()
+
+    if d.preparation_status == 'preparing':
+        return HttpResponseBadRequest('Dataset is still being prepared')
+
+    form = ReplaceDatasetFileForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({'status': 'error',
+                             'errors': form.errors.get('file', [])})
+
+    # The canonical copy is kept until the dataset is prepared, as kept
+    # tasks' fit data are read from it until their rows are updated
+    old_file = d.file
+    d.file = form.cleaned_data['file']
+    d.preparation_status = 'preparing'
+    d.preparation_progress = 0.0
+    d.preparation_warnings = '[]'
+    d.preparation_error = None
+    d.save()
+    old_file.delete(save=False)
+    export.invalidate(d)
+
+    # Only refit combinations whose data have changed
+    prepare_dataset.apply_async(
+        args=(d.id, ),
+        kwargs={'clear_existing': 'changed', 'file_replaced': True},
+        priority=settings.CELERY_PREPARE_PRIORITY
+    )
+
+    return JsonResponse({'status': 'success', 'dataset_id': dataset_id})
+
+
+# Task table columns, and the DatasetTask fields they show
+TASK_TABLE_COLUMNS = {
+    'drug1': 'drug1',
+    'drug2': 'drug2',
+    'sample': 'sample',
+    'batch': 'batch',
+    'status': 'state',
+}
+
+
+def _task_table_page(tasks, params, num_total):
+    """ A page of the task table, for a DataTables server-side request
+
+    Only the requested columns (by name) are returned, with each row's
+    task_id. Rows may be searched on any column, and sorted by any column
+    then by creation order.
+    """
+    columns = []
+    while f'columns[{len(columns)}][data]' in params:
+        i = len(columns)
+        columns.append(params.get(f'columns[{i}][name]') or
+                       params[f'columns[{i}][data]'])
+    fields = [TASK_TABLE_COLUMNS[c] for c in columns
+              if c in TASK_TABLE_COLUMNS]
+
+    num_filtered = num_total
+    search = params.get('search[value]', '').strip()
+    if search:
+        query = Q()
+        for field in TASK_TABLE_COLUMNS.values():
+            query |= Q(**{f'{field}__icontains': search})
+        tasks = tasks.filter(query)
+        num_filtered = tasks.count()
+
+    ordering = []
+    i = 0
+    while f'order[{i}][column]' in params:
+        try:
+            column = columns[int(params[f'order[{i}][column]'])]
+        except (ValueError, IndexError):
+            column = None
+        if column in TASK_TABLE_COLUMNS:
+            desc = params.get(f'order[{i}][dir]') == 'desc'
+            ordering.append(('-' if desc else '') + TASK_TABLE_COLUMNS[column])
+        i += 1
+
+    start = max(int(params.get('start', 0)), 0)
+    length = int(params.get('length', settings.TASK_TABLE_MAX_PAGE_SIZE))
+    if length < 0 or length > settings.TASK_TABLE_MAX_PAGE_SIZE:
+        length = settings.TASK_TABLE_MAX_PAGE_SIZE
+
+    names = {f: c for c, f in TASK_TABLE_COLUMNS.items()}
+    rows = tasks.order_by(*ordering, 'pk').values(
+        'task_id', *fields)[start:start + length]
+    return {
+        'draw': int(params.get('draw', 0)),
+        'recordsTotal': num_total,
+        'recordsFiltered': num_filtered,
+        'data': [{names.get(k, k): v for k, v in row.items()}
+                 for row in rows],
+    }
+
+
 @login_required
 def ajax_tasks(request, dataset_id):
+    """ A dataset's tasks, for the task table
+
+    With DataTables server-side processing parameters (draw, etc.), only
+    the requested page is returned (see _task_table_page); otherwise, all
+    tasks. Statuses are read from DatasetTask.state, not TaskResults.
+    """
     try:
         d = Dataset.objects.get(id=dataset_id, deleted_date=None)
     except Dataset.DoesNotExist:
@@ -193,38 +357,129 @@ def ajax_tasks(request, dataset_id):
     if d.owner_id != request.user.id and not request.user.is_staff:
         raise Http404()
 
-    tasks = DatasetTask.objects.filter(dataset=d).prefetch_related(
-        'task').order_by('drug1', 'drug2', 'sample')
+    cursor = _status_cursor()
+    counts = {g: n for g, (n, _) in taskstatus.counts(d).items()}
+    tasks = DatasetTask.objects.filter(dataset=d)
+    use_batches = tasks.filter(batch__isnull=False).exclude(
+        batch='').exists()
 
-    return JsonResponse({'data': [
-        [t.drug1, t.drug2, t.sample, t.status, t.task_id, t.batch]
-        for t in tasks
-    ], 'use_batches': any(t.batch for t in tasks)})
+    if 'draw' in request.GET:
+        try:
+            response = _task_table_page(tasks, request.GET, tasks.count())
+        except ValueError:
+            return HttpResponseBadRequest('Invalid table request')
+    else:
+        response = {'data': [
+            [t.drug1, t.drug2, t.sample, t.state, t.task_id, t.batch]
+            for t in tasks.order_by('drug1', 'drug2', 'sample').only(
+                'drug1', 'drug2', 'sample', 'state', 'task', 'batch')
+        ]}
+
+    response.update(use_batches=use_batches, counts=counts, cursor=cursor)
+    return JsonResponse(response)
+
+
+def _gzip(chunks):
+    """ Gzip compress a stream of text, flushing after the first chunk """
+    compressor = zlib.compressobj(wbits=31)
+    for i, chunk in enumerate(chunks):
+        data = compressor.compress(chunk.encode())
+        if i == 0:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _export_file_response(dataset, filename, gzipped):
+    """ A response serving a dataset's saved (gzipped) CSV export
+
+    With DATASET_EXPORT_ACCEL_REDIRECT, nginx serves the file: it sends
+    the gzipped file to clients accepting gzip encoding, and decompresses
+    it for any others.
+    """
+    if gzipped:
+        filename += '.gz'
+    if settings.DATASET_EXPORT_ACCEL_REDIRECT:
+        response = HttpResponse(
+            content_type='application/gzip' if gzipped else 'text/csv')
+        path = settings.DATASET_EXPORT_ACCEL_PREFIX + \
+            os.path.basename(dataset.export_file.name)
+        # The uncompressed name, for nginx's gzip_static
+        response['X-Accel-Redirect'] = path if gzipped else path[:-3]
+    else:
+        response = FileResponse(dataset.export_file.open('rb'),
+                                content_type='application/gzip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 
 @login_required
 def ajax_dataset_csv(request, dataset_id):
-    tasks = DatasetTask.objects.filter(
-        dataset_id=dataset_id,
-        dataset__deleted_date=None
-    ).prefetch_related('task').select_related('dataset')
-
-    if not tasks:
+    try:
+        dataset = Dataset.objects.get(pk=dataset_id, deleted_date=None)
+    except Dataset.DoesNotExist:
         return HttpResponse(f'Dataset {dataset_id} has no tasks or not found')
 
-    if tasks[0].dataset.owner_id != request.user.id and \
-            not request.user.is_staff:
+    if dataset.owner_id != request.user.id and not request.user.is_staff:
         return HttpResponse(f'Dataset {dataset_id} not found', status=404)
 
-    csv_lines = tasks[0].result_csv_header + '\n'
-    for task in tasks:
-        csv_lines += task.result_csv_line + '\n'
+    if not DatasetTask.objects.filter(dataset=dataset).exists():
+        return HttpResponse(f'Dataset {dataset_id} has no tasks or not found')
+
+    dataset_name = dataset.name.replace('"', '')
+    gzipped = bool(request.GET.get('gzip'))
+
+    if dataset.export_file and \
+            (gzipped or settings.DATASET_EXPORT_ACCEL_REDIRECT):
+        return _export_file_response(dataset, f'{dataset_name}.csv', gzipped)
+
+    # Lines are sent as they are generated, so the download starts at once
+    # and memory use doesn't grow with the dataset
+    lines = export.csv_lines(dataset)
+    if gzipped:
+        response = StreamingHttpResponse(_gzip(lines),
+                                         content_type='application/gzip')
+        filename = f'{dataset_name}.csv.gz'
+    else:
+        response = StreamingHttpResponse(lines, content_type='text/csv')
+        filename = f'{dataset_name}.csv'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def ajax_datasets_export(request, fmt):
+    """ Typed export of the results of one or more datasets
 
-    dataset_name = tasks[0].dataset.name.replace('"', '')
+    Datasets are given as ?dataset=<id>, repeated for several.
+    """
+    if fmt not in export.FORMATS:
+        return HttpResponse(f'Unknown export format {fmt}', status=404)
 
-    response = HttpResponse(csv_lines, content_type='text/csv')
+    try:
+        dataset_ids = {int(d) for d in request.GET.getlist('dataset')}
+    except ValueError:
+        return HttpResponseBadRequest('Invalid dataset ID')
+    if not dataset_ids:
+        return HttpResponseBadRequest('No datasets selected')
+
+    datasets = Dataset.objects.filter(pk__in=dataset_ids, deleted_date=None)
+    if not request.user.is_staff:
+        datasets = datasets.filter(owner=request.user)
+    datasets = list(datasets.order_by('pk'))
+    missing = dataset_ids - {d.id for d in datasets}
+    if missing:
+        return HttpResponse(f'Dataset {min(missing)} not found', status=404)
+
+    content_type, extension = export.FORMATS[fmt]
+    response = HttpResponse(
+        export.write(export.results_frame(dataset_ids), fmt),
+        content_type=content_type)
+    filename = datasets[0].name.replace('"', '') if len(datasets) == 1 \
+        else 'musyc_results'
     response['Content-Disposition'] = f'attachment; ' \
-                                      f'filename="{dataset_name}.csv"'
+                                      f'filename="{filename}.{extension}"'
     return response
 
 
@@ -290,7 +545,7 @@ def ajax_surface_plot(request, task_id):
         raise Http404()
 
     # Get any plot
-    rd = task.result_dict
+    rd = task.result_data_dict
     if rd:
         # Apply HTML escapes
         for field in ('sample', 'drug1_name', 'drug2_name', 'batch',
@@ -303,10 +558,10 @@ def ajax_surface_plot(request, task_id):
         rd['save_direc'] = None
         plot = plotDoseResponseSurf(
             rd,
-            np.array(rd['d1']),
-            np.array(rd['d2']),
-            np.array(rd['dip']),
-            np.array(rd['dip_sd'])
+            rd['d1'],
+            rd['d2'],
+            rd['dip'],
+            rd['dip_sd']
         )['plot']
         plot_html = plotly.offline.plot(plot, output_type='div',
                                         include_plotlyjs=False)
@@ -320,17 +575,40 @@ def ajax_surface_plot(request, task_id):
         return HttpResponse(plot_html)
 
 
+def _status_cursor():
+    """ A since cursor for ajax_task_status, for changes after now """
+    return timezone.now().timestamp() - settings.TASK_STATUS_CURSOR_OVERLAP
+
+
 @login_required
 def ajax_task_status(request, dataset_id):
-    tasks = DatasetTask.objects.filter(
-        dataset_id=dataset_id,
-        dataset__deleted_date=None
-    ).prefetch_related('task')
-    
-    if not request.user.is_staff:
-        tasks = tasks.filter(dataset__owner_id=request.user.id)
-        
-    return JsonResponse({task.task_id: task.status for task in tasks})
+    """ Status of a dataset's tasks
+
+    Returns every task, or with ?since=<cursor> (from a previous response,
+    or ajax_tasks), only tasks whose status has changed since, and any
+    still running. Status counts come from the dataset's DatasetStatusCount.
+    """
+    try:
+        d = Dataset.objects.get(id=dataset_id, deleted_date=None)
+    except Dataset.DoesNotExist:
+        raise Http404()
+
+    if d.owner_id != request.user.id and not request.user.is_staff:
+        raise Http404()
+
+    cursor = _status_cursor()
+    since = None
+    if 'since' in request.GET:
+        try:
+            since = datetime.datetime.fromtimestamp(
+                float(request.GET['since']), tz=datetime.timezone.utc)
+        except (ValueError, OverflowError):
+            return HttpResponseBadRequest('Invalid since cursor')
+
+    return JsonResponse(dict(
+        taskstatus.report(d, taskstatus.changed_tasks(d, since)),
+        cursor=cursor
+    ))
 
 
 # New plotting code
@@ -429,7 +707,7 @@ def ajax_curve_plot(request, task_id):
         raise Http404()
 
     # Get any plot
-    rd = task.result_dict
+    rd = task.result_data_dict
     if rd:
         # Apply HTML escapes
         for field in ('sample', 'drug1_name', 'drug2_name', 'batch',
@@ -443,10 +721,10 @@ def ajax_curve_plot(request, task_id):
         
         curve1, curve2 = doseResponse_Curve(
             rd,
-            np.array(rd['d1']),
-            np.array(rd['d2']),
-            np.array(rd['dip']),
-            np.array(rd['dip_sd'])
+            rd['d1'],
+            rd['d2'],
+            rd['dip'],
+            rd['dip_sd']
         )
 
         plot1_html = plotly.offline.plot(curve1, output_type='div',
@@ -473,7 +751,7 @@ def ajax_curve2_plot(request, task_id):
         raise Http404()
 
     # Get any plot
-    rd = task.result_dict
+    rd = task.result_data_dict
     if rd:
         # Apply HTML escapes
         for field in ('sample', 'drug1_name', 'drug2_name', 'batch',
@@ -487,10 +765,10 @@ def ajax_curve2_plot(request, task_id):
         
         curve1, curve2 = doseResponse_Curve(
             rd,
-            np.array(rd['d1']),
-            np.array(rd['d2']),
-            np.array(rd['dip']),
-            np.array(rd['dip_sd'])
+            rd['d1'],
+            rd['d2'],
+            rd['dip'],
+            rd['dip_sd']
         )
         # return HttpResponse(curve2) 
         plot2_html = plotly.offline.plot(curve2, output_type='div',
@@ -502,6 +780,50 @@ def ajax_curve2_plot(request, task_id):
             return HttpResponse(plot2_html)
 
 
+def _plot_dataset_error(request, dataset_id):
+    """ An error response if a dataset can't be plotted by a user """
+    if not DatasetTask.objects.filter(dataset_id=dataset_id,
+                                      dataset__deleted_date=None).exists():
+        return HttpResponse(f'Dataset {dataset_id} has no tasks or not found')
+    if not request.user.is_staff and not Dataset.objects.filter(
+            pk=dataset_id, owner_id=request.user.id).exists():
+        return HttpResponse(f'Dataset {dataset_id} not found', status=404)
+    return None
+
+
+def _plot_rows(dataset_id):
+    """ Rows of result values for the analysis plot modules, and task IDs
+
+    Successful fits are read from their FitResult columns, and any other
+    tasks from their result CSV line, with only those tasks' TaskResults
+    fetched.
+    """
+    tasks = list(DatasetTask.objects.filter(
+        dataset_id=dataset_id).select_related('fit_result', 'dataset'))
+    missing = []
+    for task in tasks:
+        try:
+            task.fit_result
+        except FitResult.DoesNotExist:
+            missing.append(task)
+    prefetch_related_objects(missing, 'task')
+
+    rows = []
+    task_ids = []
+    for task in tasks:
+        try:
+            row = fitresults.plot_row(task.fit_result, task)
+        except FitResult.DoesNotExist:
+            csv_lines = '"'
+            csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
+            row = csv_lines.split('\",\"')
+            row = [x.lstrip('\"') for x in row]
+            row = [x.replace('\"', '') for x in row]
+        rows.append(row)
+        task_ids.append(task.task_id)
+    return rows, task_ids
+
+
 @login_required
 def ajax_comboBar_plot(request, dataset_id):
     # To show the added datasets
@@ -514,26 +836,13 @@ def ajax_comboBar_plot(request, dataset_id):
         dataset_list =[]
         task_list = []
         for x in datasets:
-            tasks = DatasetTask.objects.filter(
-                dataset_id=x,
-                dataset__deleted_date=None
-            ).prefetch_related('task').select_related('dataset')
-
-            if not tasks:
-                return HttpResponse(f'Dataset {x} has no tasks or not found')
-
-            if tasks[0].dataset.owner_id != request.user.id and \
-                    not request.user.is_staff:
-                return HttpResponse(f'Dataset {x} not found', status=404)
-            
-            for task in tasks:
-                csv_lines = '"'
-                csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-                test = csv_lines.split('\",\"')
-                test = [x.lstrip('\"') for x in test]
-                test = [x.replace('\"', '') for x in test]
-                dataset_list.append(test)
-                task_list.append(task.task_id)
+            error = _plot_dataset_error(request, x)
+            if error:
+                return error
+
+            rows, task_ids = _plot_rows(x)
+            dataset_list.extend(rows)
+            task_list.extend(task_ids)
 
         barPlots = combo_bar(dataset_list, task_list)
         bar_final_plot = get_plot_html(barPlots)
@@ -547,57 +856,22 @@ def ajax_comboBar_plot(request, dataset_id):
         dataset_list =[]
         task_list = []
         for x in datasets:
-            tasks = DatasetTask.objects.filter(
-                dataset_id=x,
-                dataset__deleted_date=None
-            ).prefetch_related('task').select_related('dataset')
-
-            if not tasks:
-                return HttpResponse(f'Dataset {x} has no tasks or not found')
-
-            if tasks[0].dataset.owner_id != request.user.id and \
-                    not request.user.is_staff:
-                return HttpResponse(f'Dataset {x} not found', status=404)
-            
-            for task in tasks:
-                csv_lines = '"'
-                csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-                test = csv_lines.split('\",\"')
-                test = [x.lstrip('\"') for x in test]
-                test = [x.replace('\"', '') for x in test]
-                dataset_list.append(test)
-                task_list.append(task.task_id)
+            error = _plot_dataset_error(request, x)
+            if error:
+                return error
+
+            rows, task_ids = _plot_rows(x)
+            dataset_list.extend(rows)
+            task_list.extend(task_ids)
 
         barPlots = combo_bar(dataset_list, task_list)
         return barPlots
     else:
-        tasks = DatasetTask.objects.filter(
-            dataset_id=dataset_id,
-            dataset__deleted_date=None
-        ).prefetch_related('task').select_related('dataset')
+        error = _plot_dataset_error(request, dataset_id)
+        if error:
+            return error
 
-        if not tasks:
-            return HttpResponse(f'Dataset {dataset_id} has no tasks or not found')
-
-        if tasks[0].dataset.owner_id != request.user.id and \
-                not request.user.is_staff:
-            return HttpResponse(f'Dataset {dataset_id} not found', status=404)
-        
-        task_list = []
-        results = []
-        for t in tasks:
-            task = DatasetTask.objects.filter(
-                task_id=t.task_id,
-                dataset__deleted_date=None
-            ).select_related('task').select_related('dataset').get()
-
-            csv_lines = '"'
-            csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-            test = csv_lines.split('\",\"')
-            test = [x.lstrip('\"') for x in test]
-            test = [x.replace('\"', '') for x in test]
-            results.append(test)
-            task_list.append(t.task_id)
+        results, task_list = _plot_rows(dataset_id)
         
         barPlot = combo_bar(results, task_list)
         bar_final_plot = get_plot_html(barPlot)
@@ -617,27 +891,13 @@ def ajax_singleBar_plot(request, dataset_id):
         task_list = []
         # x is a dataset_id in the list of dataset id's
         for x in datasets:
-            tasks = DatasetTask.objects.filter(
-                dataset_id=x,
-                dataset__deleted_date=None
-            ).prefetch_related('task').select_related('dataset')
-
-            if not tasks:
-                return HttpResponse(f'Dataset {x} has no tasks or not found')
-
-            if tasks[0].dataset.owner_id != request.user.id and \
-                    not request.user.is_staff:
-                return HttpResponse(f'Dataset {x} not found', status=404)
-            
-            for task in tasks:
-                csv_lines = '"'
-                csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-                test = csv_lines.split('\",\"')
-                test = [x.lstrip('\"') for x in test]
-                test = [x.replace('\"', '') for x in test]
-                dataset_list.append(test)
-                # Added for creating URL for surface plot
-                task_list.append(task.task_id)
+            error = _plot_dataset_error(request, x)
+            if error:
+                return error
+
+            rows, task_ids = _plot_rows(x)
+            dataset_list.extend(rows)
+            task_list.extend(task_ids)
 
         barPlots = single_bar(dataset_list, task_list)
         bar_final_plot = get_plot_html(barPlots)
@@ -652,60 +912,22 @@ def ajax_singleBar_plot(request, dataset_id):
         task_list = []
         # x is a dataset_id in the list of dataset id's
         for x in datasets:
-            tasks = DatasetTask.objects.filter(
-                dataset_id=x,
-                dataset__deleted_date=None
-            ).prefetch_related('task').select_related('dataset')
-
-            if not tasks:
-                return HttpResponse(f'Dataset {x} has no tasks or not found')
-
-            if tasks[0].dataset.owner_id != request.user.id and \
-                    not request.user.is_staff:
-                return HttpResponse(f'Dataset {x} not found', status=404)
-            
-            for task in tasks:
-                csv_lines = '"'
-                csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-                test = csv_lines.split('\",\"')
-                test = [x.lstrip('\"') for x in test]
-                test = [x.replace('\"', '') for x in test]
-                dataset_list.append(test)
-                # Added for creating URL for surface plot
-                task_list.append(task.task_id)
+            error = _plot_dataset_error(request, x)
+            if error:
+                return error
+
+            rows, task_ids = _plot_rows(x)
+            dataset_list.extend(rows)
+            task_list.extend(task_ids)
 
         barPlots = single_bar(dataset_list, task_list)
         return barPlots
     else:
-        tasks = DatasetTask.objects.filter(
-                dataset_id=dataset_id,
-                dataset__deleted_date=None
-            ).prefetch_related('task').select_related('dataset')
-
-        if not tasks:
-            return HttpResponse(f'Dataset {dataset_id} has no tasks or not found')
-
-        if tasks[0].dataset.owner_id != request.user.id and \
-                not request.user.is_staff:
-            return HttpResponse(f'Dataset {dataset_id} not found', status=404)
+        error = _plot_dataset_error(request, dataset_id)
+        if error:
+            return error
 
-        task_list = []
-        results = []
-        for t in tasks:
-            task = DatasetTask.objects.filter(
-                task_id=t.task_id,
-                dataset__deleted_date=None
-            ).select_related(
-                'task').select_related('dataset').get()
-
-            csv_lines = '"'
-            csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-            test = csv_lines.split('\",\"')
-            test = [x.lstrip('\"') for x in test]
-            test = [x.replace('\"', '') for x in test]
-            results.append(test)
-            # Added for creating URL to surface plot
-            task_list.append(t.task_id)
+        results, task_list = _plot_rows(dataset_id)
     
     barPlot = single_bar(results, task_list)
     bar_final_plot = get_plot_html(barPlot)
@@ -723,27 +945,13 @@ def ajax_comboScatter_plot(request, dataset_id):
         dataset_list =[]
         task_list = []
         for x in datasets:
-            tasks = DatasetTask.objects.filter(
-                dataset_id=x,
-                dataset__deleted_date=None
-            ).prefetch_related('task').select_related('dataset')
-
-            if not tasks:
-                return HttpResponse(f'Dataset {x} has no tasks or not found')
-            
-            if tasks[0].dataset.owner_id != request.user.id and \
-                    not request.user.is_staff:
-                return HttpResponse(f'Dataset {x} not found', status=404)
-            
-            for task in tasks:
-                csv_lines = '"'
-                csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-                test = csv_lines.split('\",\"')
-                test = [x.lstrip('\"') for x in test]
-                test = [x.replace('\"', '') for x in test]
-                dataset_list.append(test)
-                # Add the task_id for each task within that dataset
-                task_list.append(task.task_id)
+            error = _plot_dataset_error(request, x)
+            if error:
+                return error
+
+            rows, task_ids = _plot_rows(x)
+            dataset_list.extend(rows)
+            task_list.extend(task_ids)
 
         comboScatterPlots = combo_scatter(dataset_list, task_list)
         comboScatter_final_plot = get_plot_html(comboScatterPlots)
@@ -757,58 +965,22 @@ def ajax_comboScatter_plot(request, dataset_id):
         dataset_list =[]
         task_list = []
         for x in datasets:
-            tasks = DatasetTask.objects.filter(
-                dataset_id=x,
-                dataset__deleted_date=None
-            ).prefetch_related('task').select_related('dataset')
-
-            if not tasks:
-                return HttpResponse(f'Dataset {x} has no tasks or not found')
-
-            if tasks[0].dataset.owner_id != request.user.id and \
-                    not request.user.is_staff:
-                return HttpResponse(f'Dataset {x} not found', status=404)
-            
-            for task in tasks:
-                csv_lines = '"'
-                csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-                test = csv_lines.split('\",\"')
-                test = [x.lstrip('\"') for x in test]
-                test = [x.replace('\"', '') for x in test]
-                dataset_list.append(test)
-                # Add the task_id for each task within that dataset
-                task_list.append(task.task_id)
+            error = _plot_dataset_error(request, x)
+            if error:
+                return error
+
+            rows, task_ids = _plot_rows(x)
+            dataset_list.extend(rows)
+            task_list.extend(task_ids)
 
         comboScatterPlots = combo_scatter(dataset_list, task_list)
         return comboScatterPlots
     else:
-        tasks = DatasetTask.objects.filter(
-                dataset_id=dataset_id,
-                dataset__deleted_date=None
-            ).prefetch_related('task').select_related('dataset')
-
-        if not tasks:
-            return HttpResponse(f'Dataset {dataset_id} has no tasks or not found')
-
-        if tasks[0].dataset.owner_id != request.user.id and \
-                not request.user.is_staff:
-            return HttpResponse(f'Dataset {dataset_id} not found', status=404)
-        
-        task_list = []
-        results = []
-        for t in tasks:
-            task = DatasetTask.objects.filter(
-                task_id=t.task_id,
-                dataset__deleted_date=None
-            ).select_related('task').select_related('dataset').get()
+        error = _plot_dataset_error(request, dataset_id)
+        if error:
+            return error
 
-            csv_lines = '"'
-            csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-            test = csv_lines.split('\",\"')
-            test = [x.lstrip('\"') for x in test]
-            test = [x.replace('\"', '') for x in test]
-            results.append(test)
-            task_list.append(t.task_id)
+        results, task_list = _plot_rows(dataset_id)
         
         scatterPlot = combo_scatter(results, task_list)
         comboScatter_final_plot = get_plot_html(scatterPlot)
@@ -827,27 +999,13 @@ def ajax_singleScatter_plot(request, dataset_id):
         task_list = []
         dataset_list =[]
         for x in datasets:
-            tasks = DatasetTask.objects.filter(
-                dataset_id=x,
-                dataset__deleted_date=None
-            ).prefetch_related('task').select_related('dataset')
-
-            if not tasks:
-                return HttpResponse(f'Dataset {x} has no tasks or not found')
-
-            if tasks[0].dataset.owner_id != request.user.id and \
-                    not request.user.is_staff:
-                return HttpResponse(f'Dataset {x} not found', status=404)
-            
-            for task in tasks:
-                csv_lines = '"'
-                csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-                test = csv_lines.split('\",\"')
-                test = [x.lstrip('\"') for x in test]
-                test = [x.replace('\"', '') for x in test]
-                dataset_list.append(test)
-                # Add the task_id for each task within that dataset
-                task_list.append(task.task_id)
+            error = _plot_dataset_error(request, x)
+            if error:
+                return error
+
+            rows, task_ids = _plot_rows(x)
+            dataset_list.extend(rows)
+            task_list.extend(task_ids)
 
         scatterPlot = single_scatter(dataset_list, task_list)
         singleScatter_final_plot = get_plot_html(scatterPlot)
@@ -861,59 +1019,22 @@ def ajax_singleScatter_plot(request, dataset_id):
         task_list = []
         dataset_list =[]
         for x in datasets:
-            tasks = DatasetTask.objects.filter(
-                dataset_id=x,
-                dataset__deleted_date=None
-            ).prefetch_related('task').select_related('dataset')
-
-            if not tasks:
-                return HttpResponse(f'Dataset {x} has no tasks or not found')
-
-            if tasks[0].dataset.owner_id != request.user.id and \
-                    not request.user.is_staff:
-                return HttpResponse(f'Dataset {x} not found', status=404)
-            
-            for task in tasks:
-                csv_lines = '"'
-                csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-                test = csv_lines.split('\",\"')
-                test = [x.lstrip('\"') for x in test]
-                test = [x.replace('\"', '') for x in test]
-                dataset_list.append(test)
-                # Add the task_id for each task within that dataset
-                task_list.append(task.task_id)
+            error = _plot_dataset_error(request, x)
+            if error:
+                return error
+
+            rows, task_ids = _plot_rows(x)
+            dataset_list.extend(rows)
+            task_list.extend(task_ids)
 
         scatterPlot = single_scatter(dataset_list, task_list)
         return scatterPlot
     else:
-        tasks = DatasetTask.objects.filter(
-                dataset_id=dataset_id,
-                dataset__deleted_date=None
-            ).prefetch_related('task').select_related('dataset')
-
-        if not tasks:
-            return HttpResponse(f'Dataset {dataset_id} has no tasks or not found')
-
-        if tasks[0].dataset.owner_id != request.user.id and \
-                not request.user.is_staff:
-            return HttpResponse(f'Dataset {dataset_id} not found', status=404)
+        error = _plot_dataset_error(request, dataset_id)
+        if error:
+            return error
 
-        task_list = []
-        results = []
-        for t in tasks: 
-            task = DatasetTask.objects.filter(
-                task_id=t.task_id,
-                dataset__deleted_date=None
-            ).select_related(
-                'task').select_related('dataset').get()
-
-            csv_lines = '"'
-            csv_lines += task.result_csv_line.replace(' ', '').lstrip("\"")
-            test = csv_lines.split('\",\"')
-            test = [x.lstrip('\"') for x in test]
-            test = [x.replace('\"', '') for x in test]
-            results.append(test)
-            task_list.append(t.task_id)
+        results, task_list = _plot_rows(dataset_id)
 
         scatterPlot = single_scatter(results, task_list)
         singleScatter_final_plot = get_plot_html(scatterPlot)
@@ -1,2 +1,2 @@
 #!/bin/bash
-celery -A musycdjango worker -l info -c 5
+celery -A musycdjango worker -Q celery,prepare -l info -c 5